@@ -2,31 +2,331 @@
  * Bindings to the ASL library on Mac OS X
  */
 #include "Python.h"
+#include "structmember.h"
 #include <asl.h>
 
+/*
+ * Calls into libasl that can block (those that talk to syslogd) are
+ * made with the GIL released. An aslclient or aslresponse handle must
+ * not be used by two threads at the same time, hence those objects have
+ * a lock that is held while the handle is in use.
+ *
+ * Messages don't have a lock, but are marked as in use while a libasl
+ * call without the GIL might read them and cannot be modified
+ * during that time.
+ */
+
 typedef struct {
     PyObject_HEAD
 
     aslclient value;
+    PyThread_type_lock lock;
+
+    /* Copy of the filter mask set with set_filter, 'filter_set' is
+     * false until then and the filter of the library is used. Messages
+     * are written to the additional log files ('nfiles') regardless
+     * of the filter.
+     */
+    int filter;
+    int filter_set;
+    int nfiles;
 } ASLClientObject;
 
 typedef struct {
     PyObject_HEAD
 
     aslmsg value;
+    uint32_t type; /* ASL_TYPE_MSG or ASL_TYPE_QUERY */
     int owned;
+    int in_use;
 } ASLMessageObject;
 
+/* Number of records read from a response at a time */
+#define RESPONSE_CHUNK 128
+
 typedef struct {
     PyObject_HEAD
 
     aslresponse value;
+    PyThread_type_lock lock;
+
+    /* Records read from 'value' that have not been returned yet,
+     * 'chunk_pos' is the index of the next one. Records are read
+     * in chunks to release the GIL once for a number of records.
+     */
+    aslmsg chunk[RESPONSE_CHUNK];
+    Py_ssize_t chunk_pos;
+    Py_ssize_t chunk_len;
+    int exhausted;
+
+    /* Field projection: tuple of attribute names and their UTF-8
+     * representation, or NULL.
+     */
+    PyObject* fields;
+    const char** c_fields;
 } ASLResponseObject;
 
 
-static PyObject* new_response(aslresponse value);
+static PyObject* new_response(aslresponse value, PyObject* fields);
 static PyObject* new_message(aslmsg value, int owned);
-static PyObject* new_client(aslclient value);
+static PyObject* new_client(aslclient value, int nfiles);
+
+
+/* Acquire 'lock', releasing the GIL while waiting for it */
+static void
+acquire_lock(PyThread_type_lock lock)
+{
+    if (!PyThread_acquire_lock(lock, NOWAIT_LOCK)) {
+        Py_BEGIN_ALLOW_THREADS
+        PyThread_acquire_lock(lock, WAIT_LOCK);
+        Py_END_ALLOW_THREADS
+    }
+}
+
+
+/*
+ * Cache of str objects for C strings
+ *
+ * The cache is set associative: a string can only be stored in
+ * one of the CACHE_WAYS slots of the set selected by its hash, and
+ * when all slots are in use the least recently used one is replaced.
+ * Pinned entries are never replaced.
+ *
+ * A cache without entries (maxsize 0) always creates a new object.
+ */
+
+#define CACHE_WAYS 4
+
+typedef struct {
+    uint64_t hash;
+    Py_ssize_t len;
+    const char* utf8; /* UTF-8 buffer of 'value' */
+    PyObject* value; /* NULL for an empty slot */
+    uint64_t last_used;
+    int pinned;
+} cache_entry;
+
+typedef struct {
+    cache_entry* entries;
+    uint64_t nsets;
+    uint64_t clock;
+    Py_ssize_t size;
+    uint64_t hits;
+    uint64_t misses;
+    int intern; /* Intern new str objects */
+} str_cache;
+
+static int
+str_cache_init(str_cache* cache, Py_ssize_t maxsize, int intern)
+{
+    uint64_t nsets = 1;
+
+    cache->clock = 0;
+    cache->size = 0;
+    cache->hits = 0;
+    cache->misses = 0;
+    cache->intern = intern;
+
+    if (maxsize == 0) {
+        cache->entries = NULL;
+        cache->nsets = 0;
+        return 0;
+    }
+
+    while (nsets * CACHE_WAYS < (uint64_t)maxsize) {
+        nsets *= 2;
+    }
+
+    cache->entries = PyMem_Calloc(nsets * CACHE_WAYS, sizeof(cache_entry));
+    if (cache->entries == NULL) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    cache->nsets = nsets;
+    return 0;
+}
+
+static void
+str_cache_clear(str_cache* cache)
+{
+    uint64_t i;
+
+    for (i = 0; i < cache->nsets * CACHE_WAYS; i++) {
+        Py_CLEAR(cache->entries[i].value);
+    }
+    cache->size = 0;
+}
+
+static void
+str_cache_free(str_cache* cache)
+{
+    if (cache->entries != NULL) {
+        str_cache_clear(cache);
+        PyMem_Free(cache->entries);
+        cache->entries = NULL;
+        cache->nsets = 0;
+    }
+}
+
+/* Return a new reference to a str object with the value of 'value' */
+static PyObject*
+str_cache_get(str_cache* cache, const char* value, int pinned)
+{
+    /* FNV-1a, calculating the length at the same time */
+    uint64_t hash = 14695981039346656037ULL;
+    const unsigned char* cur;
+    cache_entry* set;
+    cache_entry* victim = NULL;
+    PyObject* result;
+    const char* utf8;
+    Py_ssize_t len;
+    int i;
+
+    if (cache->entries == NULL) {
+        return PyUnicode_FromString(value);
+    }
+
+    for (cur = (const unsigned char*)value; *cur; cur++) {
+        hash = (hash ^ *cur) * 1099511628211ULL;
+    }
+    len = (Py_ssize_t)(cur - (const unsigned char*)value);
+
+    set = cache->entries + (hash & (cache->nsets - 1)) * CACHE_WAYS;
+    for (i = 0; i < CACHE_WAYS; i++) {
+        cache_entry* entry = set + i;
+
+        if (entry->value == NULL) {
+            if (victim == NULL || victim->value != NULL) {
+                victim = entry;
+            }
+            continue;
+        }
+
+        if (entry->hash == hash && entry->len == len
+                && memcmp(entry->utf8, value, len) == 0) {
+            entry->last_used = ++cache->clock;
+            cache->hits++;
+            Py_INCREF(entry->value);
+            return entry->value;
+        }
+
+        if (!entry->pinned && (victim == NULL
+                || (victim->value != NULL && entry->last_used < victim->last_used))) {
+            victim = entry;
+        }
+    }
+
+    cache->misses++;
+    result = PyUnicode_FromStringAndSize(value, len);
+    if (result == NULL) {
+        return NULL;
+    }
+    if (cache->intern) {
+        PyUnicode_InternInPlace(&result);
+    }
+
+    /* The UTF-8 representation is cached in the str object */
+    utf8 = PyUnicode_AsUTF8(result);
+    if (utf8 == NULL) {
+        Py_DECREF(result);
+        return NULL;
+    }
+
+    if (victim != NULL) {
+        if (victim->value == NULL) {
+            cache->size++;
+        }
+        Py_XDECREF(victim->value);
+        Py_INCREF(result);
+        victim->value = result;
+        victim->utf8 = utf8;
+        victim->hash = hash;
+        victim->len = len;
+        victim->last_used = ++cache->clock;
+        victim->pinned = pinned;
+    }
+    return result;
+}
+
+
+/*
+ * Attribute names: the standard keys are pinned in the cache,
+ * other names share the remaining slots.
+ */
+
+static str_cache key_cache;
+
+static const char* standard_keys[] = {
+    ASL_KEY_TIME,
+    ASL_KEY_TIME_NSEC,
+    ASL_KEY_HOST,
+    ASL_KEY_SENDER,
+    ASL_KEY_FACILITY,
+    ASL_KEY_PID,
+    ASL_KEY_UID,
+    ASL_KEY_GID,
+    ASL_KEY_LEVEL,
+    ASL_KEY_MSG,
+    ASL_KEY_READ_UID,
+    ASL_KEY_READ_GID,
+    ASL_KEY_EXPIRE_TIME,
+    ASL_KEY_MSG_ID,
+    ASL_KEY_SESSION,
+    ASL_KEY_REF_PID,
+    ASL_KEY_REF_PROC,
+    ASL_KEY_AUX_TITLE,
+    ASL_KEY_AUX_UTI,
+    ASL_KEY_AUX_URL,
+    ASL_KEY_AUX_DATA,
+    ASL_KEY_OPTION,
+    ASL_KEY_SENDER_INSTANCE,
+    NULL
+};
+
+static int
+key_cache_init(void)
+{
+    const char** cur;
+
+    if (str_cache_init(&key_cache, 256, 1) < 0) {
+        return -1;
+    }
+
+    for (cur = standard_keys; *cur != NULL; cur++) {
+        PyObject* o = str_cache_get(&key_cache, *cur, 1);
+        if (o == NULL) {
+            return -1;
+        }
+        Py_DECREF(o);
+    }
+    return 0;
+}
+
+#define key_object(key) str_cache_get(&key_cache, (key), 0)
+
+
+/*
+ * Attribute values: optional, see set_value_cache(). Values of
+ * attributes that are (nearly) unique for every message bypass
+ * the cache.
+ */
+
+static str_cache value_cache;
+
+static PyObject* value_cache_info_type;
+
+static PyObject*
+value_object(const char* key, const char* value)
+{
+    if (value_cache.entries == NULL
+            || strcmp(key, ASL_KEY_MSG) == 0
+            || strcmp(key, ASL_KEY_TIME) == 0
+            || strcmp(key, ASL_KEY_TIME_NSEC) == 0
+            || strcmp(key, ASL_KEY_MSG_ID) == 0) {
+        return PyUnicode_FromString(value);
+    }
+    return str_cache_get(&value_cache, value, 0);
+}
 
 
 /* Response type */
@@ -34,6 +334,46 @@ static PyObject* new_client(aslclient value);
 static void response_dealloc(PyObject* self);
 static PyObject* response_iter(PyObject* self);
 static PyObject* response_iternext(PyObject* self);
+static PyObject* response_fetch(PyObject* self, PyObject* args, PyObject* kwds);
+static PyObject* response_fetch_dicts(PyObject* self, PyObject* args, PyObject* kwds);
+static PyObject* response_fetch_records(PyObject* self, PyObject* args, PyObject* kwds);
+static PyObject* message_as_dict(aslmsg msg);
+static PyObject* message_as_pair(aslmsg msg, PyObject** keys);
+static PyObject* message_as_row(aslmsg msg, ASLResponseObject* r);
+static PyObject* message_as_projected_dict(aslmsg msg, ASLResponseObject* r);
+
+static PyMethodDef response_methods[] = {
+    {
+        "fetch",
+        (PyCFunction)response_fetch,
+        METH_VARARGS|METH_KEYWORDS,
+        "Fetch up to n records as (keys, values) tuples, or as rows when fields are set",
+    },
+    {
+        "fetch_dicts",
+        (PyCFunction)response_fetch_dicts,
+        METH_VARARGS|METH_KEYWORDS,
+        "Fetch up to n records as dicts",
+    },
+    {
+        "fetch_records",
+        (PyCFunction)response_fetch_records,
+        METH_VARARGS|METH_KEYWORDS,
+        "Fetch up to n records as asl.Record objects",
+    },
+    { 0, 0, 0, 0 } /* SENTINEL */
+};
+
+static PyMemberDef response_members[] = {
+    {
+        "fields",
+        T_OBJECT,
+        offsetof(ASLResponseObject, fields),
+        READONLY,
+        "Attribute names for the rows, or None",
+    },
+    { 0, 0, 0, 0, 0 } /* SENTINEL */
+};
 
 static PyTypeObject ASLResponseType = {
     PyVarObject_HEAD_INIT(&PyType_Type, 0)
@@ -46,18 +386,54 @@ static PyTypeObject ASLResponseType = {
     .tp_iter        = response_iter,
     .tp_iternext    = response_iternext,
     .tp_dealloc     = response_dealloc,
+    .tp_methods     = response_methods,
+    .tp_members     = response_members,
 };
 
+/* 'fields' is NULL or a tuple of str objects */
 static PyObject*
-new_response(aslresponse response)
+new_response(aslresponse response, PyObject* fields)
 {
+    Py_ssize_t i;
     ASLResponseObject* result = PyObject_New(ASLResponseObject, &ASLResponseType);
     if (result == NULL) {
-        aslresponse_free(response);
+        if (response != NULL) {
+            aslresponse_free(response);
+        }
         return NULL;
     }
 
     result->value = response;
+    result->fields = NULL;
+    result->c_fields = NULL;
+    result->chunk_pos = 0;
+    result->chunk_len = 0;
+    result->exhausted = (response == NULL);
+    result->lock = PyThread_allocate_lock();
+    if (result->lock == NULL) {
+        Py_DECREF(result);
+        PyErr_NoMemory();
+        return NULL;
+    }
+
+    if (fields != NULL) {
+        Py_INCREF(fields);
+        result->fields = fields;
+        result->c_fields = PyMem_New(const char*, PyTuple_GET_SIZE(fields) + 1);
+        if (result->c_fields == NULL) {
+            Py_DECREF(result);
+            PyErr_NoMemory();
+            return NULL;
+        }
+
+        for (i = 0; i < PyTuple_GET_SIZE(fields); i++) {
+            result->c_fields[i] = PyUnicode_AsUTF8(PyTuple_GET_ITEM(fields, i));
+            if (result->c_fields[i] == NULL) {
+                Py_DECREF(result);
+                return NULL;
+            }
+        }
+    }
     return (PyObject*)result;
 }
 
@@ -66,7 +442,14 @@ response_dealloc(PyObject* self)
 {
     ASLResponseObject* r = (ASLResponseObject*)self;
 
-    aslresponse_free(r->value);
+    if (r->value != NULL) {
+        aslresponse_free(r->value);
+    }
+    if (r->lock != NULL) {
+        PyThread_free_lock(r->lock);
+    }
+    PyMem_Free(r->c_fields);
+    Py_XDECREF(r->fields);
     PyObject_DEL(self);
 }
 
@@ -77,18 +460,202 @@ response_iter(PyObject* self)
     return self;
 }
 
+/*
+ * Read at most 'want' records of 'value' into 'chunk', with the GIL
+ * released. Returns the number of records read, which is less than
+ * 'want' at the end of the response.
+ */
+static Py_ssize_t
+response_read_chunk(aslresponse value, aslmsg* chunk, Py_ssize_t want)
+{
+    Py_ssize_t len = 0;
+
+    Py_BEGIN_ALLOW_THREADS
+    while (len < want) {
+        aslmsg msg = aslresponse_next(value);
+        if (msg == NULL) {
+            break;
+        }
+        chunk[len++] = msg;
+    }
+    Py_END_ALLOW_THREADS
+
+    return len;
+}
+
+/*
+ * Return the next record of a response, or NULL at the end. Must
+ * be called with r->lock held. The GIL is released while reading
+ * a chunk of at most 'want' records from libasl.
+ */
+static aslmsg
+response_next(ASLResponseObject* r, Py_ssize_t want)
+{
+    if (r->chunk_pos == r->chunk_len) {
+        Py_ssize_t len;
+
+        if (r->exhausted) {
+            return NULL;
+        }
+        if (want <= 0 || want > RESPONSE_CHUNK) {
+            want = RESPONSE_CHUNK;
+        }
+
+        len = response_read_chunk(r->value, r->chunk, want);
+
+        r->exhausted = (len < want);
+        r->chunk_pos = 0;
+        r->chunk_len = len;
+        if (len == 0) {
+            return NULL;
+        }
+    }
+    return r->chunk[r->chunk_pos++];
+}
+
 static PyObject*
 response_iternext(PyObject* self)
 {
     ASLResponseObject* r = (ASLResponseObject*)self;
-    aslmsg msg = aslresponse_next(r->value);
+    PyObject* result;
+    aslmsg msg;
 
+    acquire_lock(r->lock);
+    msg = response_next(r, RESPONSE_CHUNK);
     if (msg == NULL) {
         /* End of iteration */
-        return NULL;
+        result = NULL;
+    } else if (r->fields != NULL) {
+        result = message_as_row(msg, r);
     } else {
-        return new_message(msg, 0);
+        result = new_message(msg, 0);
+    }
+    PyThread_release_lock(r->lock);
+    return result;
+}
+
+/*
+ * Convert up to 'count' records (all records when 'count' is negative)
+ * to dicts or pairs (rows with field projection) and return them
+ * as a list.
+ */
+static PyObject*
+response_fetch_common(ASLResponseObject* r, Py_ssize_t count, int as_dict)
+{
+    PyObject* result;
+    PyObject* keys = NULL;
+    aslmsg msg;
+
+    result = PyList_New(0);
+    if (result == NULL) {
+        return NULL;
+    }
+
+    acquire_lock(r->lock);
+    while (count < 0 || PyList_GET_SIZE(result) < count) {
+        PyObject* item;
+
+        msg = response_next(r, count < 0 ? -1 : count - PyList_GET_SIZE(result));
+        if (msg == NULL) {
+            break;
+        }
+
+        if (r->fields != NULL) {
+            if (as_dict) {
+                item = message_as_projected_dict(msg, r);
+            } else {
+                item = message_as_row(msg, r);
+            }
+        } else if (as_dict) {
+            item = message_as_dict(msg);
+        } else {
+            item = message_as_pair(msg, &keys);
+        }
+        if (item == NULL) {
+            PyThread_release_lock(r->lock);
+            Py_XDECREF(keys);
+            Py_DECREF(result);
+            return NULL;
+        }
+
+        if (PyList_Append(result, item) < 0) {
+            PyThread_release_lock(r->lock);
+            Py_DECREF(item);
+            Py_XDECREF(keys);
+            Py_DECREF(result);
+            return NULL;
+        }
+        Py_DECREF(item);
+    }
+    PyThread_release_lock(r->lock);
+
+    Py_XDECREF(keys);
+    return result;
+}
+
+static PyObject*
+response_fetch(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "n", NULL };
+    Py_ssize_t count = -1;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|n", kw_list, &count)) {
+        return NULL;
+    }
+
+    return response_fetch_common((ASLResponseObject*)self, count, 0);
+}
+
+static PyObject*
+response_fetch_dicts(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "n", NULL };
+    Py_ssize_t count = -1;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|n", kw_list, &count)) {
+        return NULL;
+    }
+
+    return response_fetch_common((ASLResponseObject*)self, count, 1);
+}
+
+/* asl._record._from_fetch, imported on first use */
+static PyObject* record_from_fetch;
+
+static PyObject*
+response_fetch_records(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "n", NULL };
+    ASLResponseObject* r = (ASLResponseObject*)self;
+    Py_ssize_t count = -1;
+    PyObject* rows;
+    PyObject* result;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|n", kw_list, &count)) {
+        return NULL;
+    }
+
+    if (record_from_fetch == NULL) {
+        PyObject* module = PyImport_ImportModule("asl._record");
+        if (module == NULL) {
+            return NULL;
+        }
+        record_from_fetch = PyObject_GetAttrString(module, "_from_fetch");
+        Py_DECREF(module);
+        if (record_from_fetch == NULL) {
+            return NULL;
+        }
+    }
+
+    rows = response_fetch_common(r, count, 0);
+    if (rows == NULL) {
+        return NULL;
     }
+
+    result = PyObject_CallFunctionObjArgs(record_from_fetch,
+            r->fields != NULL ? r->fields : Py_None, rows, NULL);
+    Py_DECREF(rows);
+    return result;
 }
 
 
@@ -96,14 +663,21 @@ response_iternext(PyObject* self)
 
 #define ASLMessage_Check(object) PyObject_TypeCheck((object), &ASLMessageType)
 #define ASLMessage_GET(object) (((ASLMessageObject*)(object))->value)
+#define ASLMessage_IN_USE(object) (((ASLMessageObject*)(object))->in_use)
 
 static PyObject* message_new(PyTypeObject* cls, PyObject* args, PyObject* kwds);
 static void message_dealloc(PyObject* self);
 static PyObject* message_keys(PyObject* self);
 static PyObject* message_asdict(PyObject* self);
 static PyObject* message_set_query(PyObject* self, PyObject* args, PyObject* kwds);
+#if defined(ASL_API_VERSION) && ASL_API_VERSION >= 20131108
+static PyObject* message_query_items(PyObject* self);
+#endif
 static PyObject* message_getitem(PyObject* self, PyObject* key);
 static int message_setitem(PyObject* self, PyObject* key, PyObject* value);
+static PyObject* message_update(PyObject* self, PyObject* args, PyObject* kwds);
+static int message_update_from(aslmsg msg, uint32_t type, PyObject* other);
+static PyObject* message_copy(PyObject* self);
 
 
 static PyMethodDef message_methods[] = {
@@ -125,6 +699,26 @@ static PyMethodDef message_methods[] = {
         METH_VARARGS|METH_KEYWORDS,
         "Set a query element",
     },
+#if defined(ASL_API_VERSION) && ASL_API_VERSION >= 20131108
+    {
+        "query_items",
+        (PyCFunction)message_query_items,
+        METH_NOARGS,
+        "List of (key, value, operation) tuples",
+    },
+#endif
+    {
+        "update",
+        (PyCFunction)message_update,
+        METH_VARARGS|METH_KEYWORDS,
+        "Set attributes from a message, mapping and/or keyword arguments",
+    },
+    {
+        "copy",
+        (PyCFunction)message_copy,
+        METH_NOARGS,
+        "Return a copy of the message",
+    },
     { 0, 0, 0, 0 } /* SENTINEL */
 };
 
@@ -160,24 +754,163 @@ new_message(aslmsg msg, int owned)
     }
 
     result->value = msg;
+    result->type = ASL_TYPE_MSG;
     result->owned = owned;
+    result->in_use = 0;
     return (PyObject*)result;
 }
 
-static PyObject*
-message_new(PyTypeObject* cls, PyObject* args, PyObject* kwds)
+/*
+ * Return the UTF-8 representation of a str object. The buffer is
+ * cached in the str object and must not be freed.
+ */
+static const char*
+as_utf8(PyObject* value)
 {
-static char* kw_args[] = { "type", NULL };
-    uint32_t type;
-    aslmsg msg;
-
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "I", kw_args, (unsigned int*)&type)) {
+    if (!PyUnicode_Check(value)) {
+        PyErr_Format(PyExc_TypeError, "Expecting a string, got instance of '%s'", Py_TYPE(value)->tp_name);
         return NULL;
     }
+    return PyUnicode_AsUTF8(value);
+}
 
-    if (type != ASL_TYPE_MSG && type != ASL_TYPE_QUERY) {
-        PyErr_SetString(PyExc_ValueError, "Invalid message type");
-        return NULL;
+static int
+message_set(aslmsg msg, PyObject* key, PyObject* value)
+{
+    const char* c_key;
+    const char* c_value;
+
+    c_key = as_utf8(key);
+    if (c_key == NULL) {
+        return -1;
+    }
+
+    c_value = as_utf8(value);
+    if (c_value == NULL) {
+        return -1;
+    }
+
+    if (asl_set(msg, c_key, c_value) != 0) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * Copy all attributes of 'src' to 'dst' without creating Python objects.
+ * Query operations are copied when both are queries.
+ */
+static int
+message_merge(aslmsg dst, uint32_t dst_type, aslmsg src)
+{
+    uint32_t n = 0;
+    const char* key;
+    const char* value;
+    int r;
+
+#if defined(ASL_API_VERSION) && ASL_API_VERSION >= 20131108
+    uint32_t op;
+
+    while (asl_fetch_key_val_op(src, n++, &key, &value, &op) == 0) {
+        if (key == NULL) {
+            break;
+        }
+        if (dst_type == ASL_TYPE_QUERY) {
+            r = asl_set_query(dst, key, value, op);
+        } else {
+            r = asl_set(dst, key, value == NULL ? "" : value);
+        }
+#else
+    (void)dst_type;
+    while ((key = asl_key(src, n++)) != NULL) {
+        value = asl_get(src, key);
+        r = asl_set(dst, key, value == NULL ? "" : value);
+#endif
+        if (r != 0) {
+            PyErr_SetFromErrno(PyExc_OSError);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+/*
+ * Set all items of 'other' on 'msg' (of type 'type'), 'other' is an aslmsg,
+ * a mapping or an iterable of key-value pairs (like the argument of dict.update).
+ */
+static int
+message_update_from(aslmsg msg, uint32_t type, PyObject* other)
+{
+    PyObject* seq;
+    Py_ssize_t i;
+
+    if (ASLMessage_Check(other)) {
+        return message_merge(msg, type, ASLMessage_GET(other));
+    }
+
+    if (PyDict_Check(other)) {
+        Py_ssize_t pos = 0;
+        PyObject* key;
+        PyObject* value;
+
+        while (PyDict_Next(other, &pos, &key, &value)) {
+            if (message_set(msg, key, value) < 0) {
+                return -1;
+            }
+        }
+        return 0;
+    }
+
+    if (PyObject_HasAttrString(other, "keys")) {
+        PyObject* items = PyMapping_Items(other);
+        if (items == NULL) {
+            return -1;
+        }
+        seq = PySequence_Fast(items, "items() must return an iterable");
+        Py_DECREF(items);
+    } else {
+        seq = PySequence_Fast(other, "Expecting a mapping or an iterable of pairs");
+    }
+    if (seq == NULL) {
+        return -1;
+    }
+
+    for (i = 0; i < PySequence_Fast_GET_SIZE(seq); i++) {
+        PyObject* item = PySequence_Fast_GET_ITEM(seq, i);
+
+        if (!PyTuple_Check(item) || PyTuple_GET_SIZE(item) != 2) {
+            PyErr_Format(PyExc_TypeError, "Expecting a key-value pair, got instance of '%s'",
+                    Py_TYPE(item)->tp_name);
+            Py_DECREF(seq);
+            return -1;
+        }
+
+        if (message_set(msg, PyTuple_GET_ITEM(item, 0), PyTuple_GET_ITEM(item, 1)) < 0) {
+            Py_DECREF(seq);
+            return -1;
+        }
+    }
+    Py_DECREF(seq);
+    return 0;
+}
+
+static PyObject*
+message_new(PyTypeObject* cls, PyObject* args, PyObject* kwds)
+{
+static char* kw_args[] = { "type", "mapping", NULL };
+    uint32_t type;
+    PyObject* mapping = NULL;
+    PyObject* result;
+    aslmsg msg;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "I|O", kw_args, (unsigned int*)&type, &mapping)) {
+        return NULL;
+    }
+
+    if (type != ASL_TYPE_MSG && type != ASL_TYPE_QUERY) {
+        PyErr_SetString(PyExc_ValueError, "Invalid message type");
+        return NULL;
     }
 
     msg = asl_new(type);
@@ -186,7 +919,19 @@ static char* kw_args[] = { "type", NULL };
         return NULL;
     }
 
-    return new_message(msg, 1);
+    result = new_message(msg, 1);
+    if (result == NULL) {
+        return NULL;
+    }
+    ((ASLMessageObject*)result)->type = type;
+
+    if (mapping != NULL && mapping != Py_None) {
+        if (message_update_from(msg, type, mapping) < 0) {
+            Py_DECREF(result);
+            return NULL;
+        }
+    }
+    return result;
 }
 
 
@@ -206,104 +951,115 @@ static PyObject*
 message_getitem(PyObject* self, PyObject* key)
 {
     ASLMessageObject* r = (ASLMessageObject*)self;
-    PyObject* bytes = NULL;
     const char* c_key;
     const char* c_value;
 
-    if (PyUnicode_Check(key)) {
-        bytes = PyUnicode_AsUTF8String(key);
-        if (bytes == NULL) {
-            return NULL;
-        }
-
-        c_key = PyBytes_AsString(bytes);
-        if (c_key == NULL) {
-            Py_XDECREF(bytes);
-            return NULL;
-        }
-
-    } else {
+    if (!PyUnicode_Check(key)) {
         PyErr_SetObject(PyExc_KeyError, key);
         return NULL;
     }
 
+    c_key = PyUnicode_AsUTF8(key);
+    if (c_key == NULL) {
+        return NULL;
+    }
+
     c_value = asl_get(r->value, c_key);
     if (c_value == NULL) {
-        PyErr_SetString(PyExc_KeyError, c_key);
-        Py_XDECREF(bytes);
+        PyErr_SetObject(PyExc_KeyError, key);
         return NULL;
     }
 
-    Py_XDECREF(bytes);
-    return Py_BuildValue("s", c_value);
+    return value_object(c_key, c_value);
+}
+
+static int
+message_check_mutable(ASLMessageObject* r)
+{
+    if (r->in_use) {
+        PyErr_SetString(PyExc_RuntimeError, "aslmsg is in use by another thread");
+        return -1;
+    }
+    return 0;
 }
 
 static int
 message_setitem(PyObject* self, PyObject* key, PyObject* value)
 {
     ASLMessageObject* r = (ASLMessageObject*)self;
-    PyObject* key_bytes = NULL;
-    PyObject* value_bytes = NULL;
     const char* c_key;
-    const char* c_value;
 
-    if (PyUnicode_Check(key)) {
-        key_bytes = PyUnicode_AsUTF8String(key);
-        if (key_bytes == NULL) {
-            return -1;
-        }
-
-        c_key = PyBytes_AsString(key_bytes);
-        if (c_key == NULL) {
-            Py_XDECREF(key_bytes);
-            return -1;
-        }
-
-    } else {
-        PyErr_Format(PyExc_TypeError, "Expecting a string, got instance of '%s'", Py_TYPE(key)->tp_name);
+    if (message_check_mutable(r) < 0) {
         return -1;
     }
 
-    if (value == NULL) {
-        if (asl_unset(r->value, c_key) != 0) {
-            PyErr_SetFromErrno(PyExc_OSError);
-            Py_XDECREF(key_bytes);
-            return -1;
-        }
-        Py_XDECREF(key_bytes);
-        return 0;
+    if (value != NULL) {
+        return message_set(r->value, key, value);
     }
 
-    if (PyUnicode_Check(value)) {
-        value_bytes = PyUnicode_AsUTF8String(value);
-        if (value_bytes == NULL) {
-            Py_XDECREF(key_bytes);
-            return -1;
-        }
-        c_value = PyBytes_AsString(value_bytes);;
-        if (c_value == NULL) {
-            Py_XDECREF(key_bytes);
-            Py_XDECREF(value_bytes);
-            return -1;
-        }
-
-    } else {
-        PyErr_Format(PyExc_TypeError, "Expecting a string, got instance of '%s'", Py_TYPE(value)->tp_name);
-        Py_XDECREF(key_bytes);
+    c_key = as_utf8(key);
+    if (c_key == NULL) {
         return -1;
     }
 
-    if (asl_set(r->value, c_key, c_value) != 0) {
+    if (asl_unset(r->value, c_key) != 0) {
         PyErr_SetFromErrno(PyExc_OSError);
-        Py_XDECREF(key_bytes);
-        Py_XDECREF(value_bytes);
         return -1;
     }
-    Py_XDECREF(key_bytes);
-    Py_XDECREF(value_bytes);
     return 0;
 }
 
+static PyObject*
+message_update(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    ASLMessageObject* r = (ASLMessageObject*)self;
+    PyObject* other = NULL;
+
+    if (!PyArg_UnpackTuple(args, "update", 0, 1, &other)) {
+        return NULL;
+    }
+
+    if (message_check_mutable(r) < 0) {
+        return NULL;
+    }
+
+    if (other != NULL && message_update_from(r->value, r->type, other) < 0) {
+        return NULL;
+    }
+
+    if (kwds != NULL && message_update_from(r->value, r->type, kwds) < 0) {
+        return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject*
+message_copy(PyObject* self)
+{
+    ASLMessageObject* r = (ASLMessageObject*)self;
+    PyObject* result;
+    aslmsg msg;
+
+    msg = asl_new(r->type);
+    if (msg == NULL) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        return NULL;
+    }
+
+    result = new_message(msg, 1);
+    if (result == NULL) {
+        return NULL;
+    }
+    ((ASLMessageObject*)result)->type = r->type;
+
+    if (message_merge(msg, r->type, r->value) < 0) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    return result;
+}
 
 static PyObject*
 message_keys(PyObject* self)
@@ -314,7 +1070,7 @@ message_keys(PyObject* self)
     const char* key;
 
     result = PySet_New(NULL);
-    if (r == NULL) {
+    if (result == NULL) {
         return NULL;
     }
 
@@ -326,7 +1082,7 @@ message_keys(PyObject* self)
             break;
         }
 
-        o = PyUnicode_FromString(key);
+        o = key_object(key);
         if (o == NULL) {
             Py_DECREF(result);
             return NULL;
@@ -334,6 +1090,7 @@ message_keys(PyObject* self)
 
         if (PySet_Add(result, o) < 0) {
             Py_DECREF(o);
+            Py_DECREF(result);
             return NULL;
         }
 
@@ -342,30 +1099,31 @@ message_keys(PyObject* self)
     return result;
 }
 
+/* Return a dict with all attributes of 'msg' */
 static PyObject*
-message_asdict(PyObject* self)
+message_as_dict(aslmsg msg)
 {
-    ASLMessageObject* r = (ASLMessageObject*)self;
     PyObject* result;
     uint32_t n = 0;
     const char* key;
 
     result = PyDict_New();
-    if (r == NULL) {
+    if (result == NULL) {
         return NULL;
     }
 
     while (1) {
+        PyObject* k;
         PyObject* o;
         const char* value;
 
 
-        key = asl_key(r->value, n++);
+        key = asl_key(msg, n++);
         if (key == NULL) {
             break;
         }
 
-        value = asl_get(r->value, key);
+        value = asl_get(msg, key);
         if (value == NULL) {
             /* Shouldn't happen */
             PyErr_SetFromErrno(PyExc_OSError);
@@ -374,22 +1132,186 @@ message_asdict(PyObject* self)
         }
 
 
-        o = PyUnicode_FromString(value);
+        o = value_object(key, value);
         if (o == NULL) {
             Py_DECREF(result);
             return NULL;
         }
 
-        if (PyDict_SetItemString(result, key, o) < 0) {
+        k = key_object(key);
+        if (k == NULL) {
+            Py_DECREF(o);
+            Py_DECREF(result);
+            return NULL;
+        }
+
+        if (PyDict_SetItem(result, k, o) < 0) {
+            Py_DECREF(k);
             Py_DECREF(o);
+            Py_DECREF(result);
+            return NULL;
+        }
+
+        Py_DECREF(k);
+        Py_DECREF(o);
+    }
+    return result;
+}
+
+/*
+ * Return a (keys, values) tuple with the attributes of 'msg'.
+ *
+ * '*keys' is the keys tuple of the previous record, or NULL. That
+ * tuple is reused when this record has the same attribute names in
+ * the same order, otherwise '*keys' is replaced by a new tuple.
+ */
+static PyObject*
+message_as_pair(aslmsg msg, PyObject** keys)
+{
+    PyObject* values;
+    PyObject* result;
+    Py_ssize_t count = 0;
+    Py_ssize_t i;
+    int same_keys;
+
+    while (asl_key(msg, (uint32_t)count) != NULL) {
+        count++;
+    }
+
+    values = PyTuple_New(count);
+    if (values == NULL) {
+        return NULL;
+    }
+
+    same_keys = *keys != NULL && PyTuple_GET_SIZE(*keys) == count;
+    for (i = 0; i < count; i++) {
+        const char* key = asl_key(msg, (uint32_t)i);
+        const char* value = key ? asl_get(msg, key) : NULL;
+        PyObject* o;
+
+        if (value == NULL) {
+            /* Shouldn't happen */
+            PyErr_SetFromErrno(PyExc_OSError);
+            Py_DECREF(values);
+            return NULL;
+        }
+
+        o = value_object(key, value);
+        if (o == NULL) {
+            Py_DECREF(values);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(values, i, o);
+
+        if (same_keys && strcmp(PyUnicode_AsUTF8(PyTuple_GET_ITEM(*keys, i)), key) != 0) {
+            same_keys = 0;
+        }
+    }
+
+    if (!same_keys) {
+        PyObject* new_keys = PyTuple_New(count);
+        if (new_keys == NULL) {
+            Py_DECREF(values);
+            return NULL;
+        }
+
+        for (i = 0; i < count; i++) {
+            PyObject* o = key_object(asl_key(msg, (uint32_t)i));
+            if (o == NULL) {
+                Py_DECREF(new_keys);
+                Py_DECREF(values);
+                return NULL;
+            }
+            PyTuple_SET_ITEM(new_keys, i, o);
+        }
+
+        Py_XDECREF(*keys);
+        *keys = new_keys;
+    }
+
+    result = PyTuple_Pack(2, *keys, values);
+    Py_DECREF(values);
+    return result;
+}
+
+/*
+ * Return a tuple with the values of the projected fields of 'r',
+ * with None for missing attributes.
+ */
+static PyObject*
+message_as_row(aslmsg msg, ASLResponseObject* r)
+{
+    Py_ssize_t count = PyTuple_GET_SIZE(r->fields);
+    Py_ssize_t i;
+    PyObject* result;
+
+    result = PyTuple_New(count);
+    if (result == NULL) {
+        return NULL;
+    }
+
+    for (i = 0; i < count; i++) {
+        const char* value = asl_get(msg, r->c_fields[i]);
+        PyObject* o;
+
+        if (value == NULL) {
+            o = Py_None;
+            Py_INCREF(o);
+        } else {
+            o = value_object(r->c_fields[i], value);
+            if (o == NULL) {
+                Py_DECREF(result);
+                return NULL;
+            }
+        }
+        PyTuple_SET_ITEM(result, i, o);
+    }
+    return result;
+}
+
+/* Return a dict with the projected fields of 'r' that are present */
+static PyObject*
+message_as_projected_dict(aslmsg msg, ASLResponseObject* r)
+{
+    Py_ssize_t count = PyTuple_GET_SIZE(r->fields);
+    Py_ssize_t i;
+    PyObject* result;
+
+    result = PyDict_New();
+    if (result == NULL) {
+        return NULL;
+    }
+
+    for (i = 0; i < count; i++) {
+        const char* value = asl_get(msg, r->c_fields[i]);
+        PyObject* o;
+
+        if (value == NULL) {
+            continue;
+        }
+
+        o = value_object(r->c_fields[i], value);
+        if (o == NULL) {
+            Py_DECREF(result);
             return NULL;
         }
 
+        if (PyDict_SetItem(result, PyTuple_GET_ITEM(r->fields, i), o) < 0) {
+            Py_DECREF(o);
+            Py_DECREF(result);
+            return NULL;
+        }
         Py_DECREF(o);
     }
     return result;
 }
 
+static PyObject*
+message_asdict(PyObject* self)
+{
+    return message_as_dict(ASLMessage_GET(self));
+}
+
 static PyObject*
 message_set_query(PyObject* self, PyObject* args, PyObject* kwds)
 {
@@ -403,14 +1325,65 @@ message_set_query(PyObject* self, PyObject* args, PyObject* kwds)
         return NULL;
     }
 
+    if (message_check_mutable(r) < 0) {
+        return NULL;
+    }
+
     if (asl_set_query(r->value, key, value, op) != 0) {
         PyErr_SetFromErrno(PyExc_OSError);
         return NULL;
     }
-
-    Py_INCREF(Py_None);
-    return Py_None;
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+#if defined(ASL_API_VERSION) && ASL_API_VERSION >= 20131108
+static PyObject*
+message_query_items(PyObject* self)
+{
+    ASLMessageObject* r = (ASLMessageObject*)self;
+    PyObject* result;
+    uint32_t n = 0;
+    const char* key;
+    const char* value;
+    uint32_t op;
+
+    result = PyList_New(0);
+    if (result == NULL) {
+        return NULL;
+    }
+
+    while (asl_fetch_key_val_op(r->value, n++, &key, &value, &op) == 0) {
+        PyObject* o;
+        PyObject* k;
+
+        if (key == NULL) {
+            break;
+        }
+
+        k = key_object(key);
+        if (k == NULL) {
+            Py_DECREF(result);
+            return NULL;
+        }
+
+        o = Py_BuildValue("(Nsk)", k, value == NULL ? "" : value, (unsigned long)op);
+        if (o == NULL) {
+            Py_DECREF(result);
+            return NULL;
+        }
+
+        if (PyList_Append(result, o) < 0) {
+            Py_DECREF(o);
+            Py_DECREF(result);
+            return NULL;
+        }
+        Py_DECREF(o);
+    }
+    return result;
 }
+#endif
 
 
 /* Client type */
@@ -421,8 +1394,11 @@ static PyObject* client_add_log_file(PyObject* self, PyObject* args, PyObject* k
 static PyObject* client_remove_log_file(PyObject* self, PyObject* args, PyObject* kwds);
 static PyObject* client_set_filter(PyObject* self, PyObject* args, PyObject* kwds);
 static PyObject* client_log(PyObject* self, PyObject* args, PyObject* kwds);
+static PyObject* client_is_enabled(PyObject* self, PyObject* args, PyObject* kwds);
 static PyObject* client_send(PyObject* self, PyObject* args, PyObject* kwds);
+static PyObject* client_send_many(PyObject* self, PyObject* args, PyObject* kwds);
 static PyObject* client_search(PyObject* self, PyObject* args, PyObject* kwds);
+static PyObject* client_search_columns(PyObject* self, PyObject* args, PyObject* kwds);
 #if (MAC_OS_X_VERSION_MAX_ALLOWED >= MAC_OS_X_VERSION_10_8)
 static PyObject* client_log_descriptor(PyObject* self, PyObject* args, PyObject* kwds);
 #endif
@@ -449,6 +1425,12 @@ static PyMethodDef client_methods[] = {
         METH_VARARGS|METH_KEYWORDS,
         NULL,
     },
+    {
+        "is_enabled",
+        (PyCFunction)client_is_enabled,
+        METH_VARARGS|METH_KEYWORDS,
+        NULL,
+    },
     {
         "log",
         (PyCFunction)client_log,
@@ -461,12 +1443,24 @@ static PyMethodDef client_methods[] = {
         METH_VARARGS|METH_KEYWORDS,
         NULL,
     },
+    {
+        "send_many",
+        (PyCFunction)client_send_many,
+        METH_VARARGS|METH_KEYWORDS,
+        NULL,
+    },
     {
         "search",
         (PyCFunction)client_search,
         METH_VARARGS|METH_KEYWORDS,
         NULL,
     },
+    {
+        "search_columns",
+        (PyCFunction)client_search_columns,
+        METH_VARARGS|METH_KEYWORDS,
+        NULL,
+    },
 #if (MAC_OS_X_VERSION_MAX_ALLOWED >= MAC_OS_X_VERSION_10_8)
     {
         "log_descriptor",
@@ -511,7 +1505,7 @@ static PyTypeObject ASLClientType = {
 };
 
 static PyObject*
-new_client(aslclient cli)
+new_client(aslclient cli, int nfiles)
 {
     ASLClientObject* result = PyObject_New(ASLClientObject, &ASLClientType);
     if (result == NULL) {
@@ -520,6 +1514,15 @@ new_client(aslclient cli)
     }
 
     result->value = cli;
+    result->filter = 0;
+    result->filter_set = 0;
+    result->nfiles = nfiles;
+    result->lock = PyThread_allocate_lock();
+    if (result->lock == NULL) {
+        Py_DECREF(result);
+        PyErr_NoMemory();
+        return NULL;
+    }
     return (PyObject*)result;
 }
 
@@ -542,7 +1545,7 @@ static char* kw_args[] = { "ident", "facility", "options", NULL };
         return NULL;
     }
 
-    return new_client(cli);
+    return new_client(cli, (opts & ASL_OPT_STDERR) ? 1 : 0);
 }
 
 static void
@@ -553,6 +1556,9 @@ client_dealloc(PyObject* self)
     if (r->value) {
         asl_close(r->value);
     }
+    if (r->lock != NULL) {
+        PyThread_free_lock(r->lock);
+    }
     PyObject_DEL(self);
 }
 
@@ -563,7 +1569,435 @@ client_add_log_file(PyObject* self, PyObject* args, PyObject* kwds)
         ASLClientObject* r = (ASLClientObject*)self;
     int fd;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "i", kw_list, &fd)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "i", kw_list, &fd)) {
+        return NULL;
+    }
+
+    acquire_lock(r->lock);
+    if (r->value == NULL) {
+        PyThread_release_lock(r->lock);
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    if (asl_add_log_file(r->value, fd) != 0) {
+        PyThread_release_lock(r->lock);
+        PyErr_SetFromErrno(PyExc_OSError);
+        return NULL;
+    }
+    r->nfiles++;
+    PyThread_release_lock(r->lock);
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject*
+client_remove_log_file(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "fd", NULL };
+        ASLClientObject* r = (ASLClientObject*)self;
+    int fd;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "i", kw_list, &fd)) {
+        return NULL;
+    }
+
+    acquire_lock(r->lock);
+    if (r->value == NULL) {
+        PyThread_release_lock(r->lock);
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    if (asl_remove_log_file(r->value, fd) != 0) {
+        PyThread_release_lock(r->lock);
+        PyErr_SetFromErrno(PyExc_OSError);
+        return NULL;
+    }
+    if (r->nfiles > 0) {
+        r->nfiles--;
+    }
+    PyThread_release_lock(r->lock);
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject*
+client_set_filter(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "filter", NULL };
+        ASLClientObject* r = (ASLClientObject*)self;
+    int filter;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "i", kw_list, &filter)) {
+        return NULL;
+    }
+
+    acquire_lock(r->lock);
+    if (r->value == NULL) {
+        PyThread_release_lock(r->lock);
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    r->filter = filter;
+    r->filter_set = 1;
+    filter = asl_set_filter(r->value, filter);
+    PyThread_release_lock(r->lock);
+    return Py_BuildValue("i", filter);
+}
+
+/* True if a message with the given level is sent, or written to a log file */
+static int
+client_level_enabled(ASLClientObject* r, int level)
+{
+    if (r->nfiles > 0) {
+        return 1;
+    }
+    if (level < 0 || level >= 32) {
+        return 0;
+    }
+    if (!r->filter_set) {
+        /* The library filters the message, its filter can be changed
+         * by the system administrator (syslog -c).
+         */
+        return 1;
+    }
+    return (r->filter & ASL_FILTER_MASK(level)) != 0;
+}
+
+static PyObject*
+client_is_enabled(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "level", NULL };
+    ASLClientObject* r = (ASLClientObject*)self;
+    int level;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "i", kw_list, &level)) {
+        return NULL;
+    }
+
+    if (r->value == NULL) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    return PyBool_FromLong(client_level_enabled(r, level));
+}
+
+static PyObject*
+client_close(PyObject* self)
+{
+        ASLClientObject* r = (ASLClientObject*)self;
+    acquire_lock(r->lock);
+    if (r->value != NULL) {
+        asl_close(r->value);
+        r->value = NULL;
+    }
+    PyThread_release_lock(r->lock);
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject*
+client_enter(PyObject* self)
+{
+        ASLClientObject* r = (ASLClientObject*)self;
+    if (r->value == NULL) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+    Py_INCREF(self);
+    return self;
+}
+
+static PyObject*
+client_exit(PyObject* self, PyObject* args)
+{
+        ASLClientObject* r = (ASLClientObject*)self;
+    PyObject* exc_type;
+    PyObject* exc_val;
+    PyObject* exc_tb;
+
+    if (!PyArg_ParseTuple(args, "OOO", &exc_type, &exc_val, &exc_tb)) {
+        return NULL;
+    }
+
+    acquire_lock(r->lock);
+    if (r->value != NULL) {
+        asl_close(r->value);
+        r->value = NULL;
+    }
+    PyThread_release_lock(r->lock);
+
+    Py_INCREF(Py_False);
+    return Py_False;
+}
+
+static PyObject*
+client_send(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "msg", NULL };
+        ASLClientObject* r = (ASLClientObject*)self;
+    PyObject* msg;
+    int closed = 0;
+    int result = 0;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!", kw_list, &ASLMessageType, &msg)) {
+        return NULL;
+    }
+
+    if (r->value == NULL) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    ASLMessage_IN_USE(msg)++;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(r->lock, WAIT_LOCK);
+    if (r->value == NULL) {
+        closed = 1;
+    } else {
+        result = asl_send(r->value, ASLMessage_GET(msg));
+    }
+    PyThread_release_lock(r->lock);
+    Py_END_ALLOW_THREADS
+    ASLMessage_IN_USE(msg)--;
+
+    if (closed) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    if (result != 0) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        return NULL;
+    }
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject*
+client_send_many(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "messages", "release_gil", NULL };
+        ASLClientObject* r = (ASLClientObject*)self;
+    PyObject* messages;
+    PyObject* seq;
+    PyObject* result = NULL;
+    int release_gil = 1;
+    Py_ssize_t count, converted, i;
+    Py_ssize_t failed = -1;
+    aslmsg* items;
+    char* owned;
+    int closed = 0;
+    int error = 0;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|p", kw_list, &messages, &release_gil)) {
+        return NULL;
+    }
+
+    if (r->value == NULL) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    seq = PySequence_Fast(messages, "messages must be iterable");
+    if (seq == NULL) {
+        return NULL;
+    }
+    count = PySequence_Fast_GET_SIZE(seq);
+
+    items = PyMem_New(aslmsg, count ? count : 1);
+    owned = PyMem_Malloc(count ? count : 1);
+    if (items == NULL || owned == NULL) {
+        PyMem_Free(items);
+        PyMem_Free(owned);
+        Py_DECREF(seq);
+        PyErr_NoMemory();
+        return NULL;
+    }
+
+    /* Convert all records before sending anything, the conversion
+     * needs the GIL.
+     */
+    for (i = 0; i < count; i++) {
+        PyObject* item = PySequence_Fast_GET_ITEM(seq, i);
+
+        if (ASLMessage_Check(item)) {
+            items[i] = ASLMessage_GET(item);
+            owned[i] = 0;
+            ASLMessage_IN_USE(item)++;
+
+        } else if (PyDict_Check(item)) {
+            items[i] = asl_new(ASL_TYPE_MSG);
+            if (items[i] == NULL) {
+                PyErr_SetFromErrno(PyExc_OSError);
+                error = 1;
+                break;
+            }
+            owned[i] = 1;
+            if (message_update_from(items[i], ASL_TYPE_MSG, item) < 0) {
+                error = 1;
+                i++;
+                break;
+            }
+
+        } else {
+            PyErr_Format(PyExc_TypeError, "Expected aslmsg or dict instance at index %zd, got instance of '%s'",
+                    i, Py_TYPE(item)->tp_name);
+            error = 1;
+            break;
+        }
+    }
+
+    converted = i;
+
+    if (!error) {
+        if (release_gil) {
+            Py_BEGIN_ALLOW_THREADS
+            PyThread_acquire_lock(r->lock, WAIT_LOCK);
+            if (r->value == NULL) {
+                closed = 1;
+            } else {
+                for (i = 0; i < count; i++) {
+                    if (asl_send(r->value, items[i]) != 0) {
+                        failed = i;
+                        break;
+                    }
+                }
+            }
+            PyThread_release_lock(r->lock);
+            Py_END_ALLOW_THREADS
+
+        } else {
+            acquire_lock(r->lock);
+            if (r->value == NULL) {
+                closed = 1;
+            } else {
+                for (i = 0; i < count; i++) {
+                    if (asl_send(r->value, items[i]) != 0) {
+                        failed = i;
+                        break;
+                    }
+                }
+            }
+            PyThread_release_lock(r->lock);
+        }
+
+        if (closed) {
+            PyErr_SetString(PyExc_ValueError, "Client is closed");
+
+        } else if (failed != -1) {
+            /* Records before 'failed' have been sent, report the index
+             * of the failing record on the exception.
+             */
+            PyObject* exc_type;
+            PyObject* exc_value;
+            PyObject* exc_tb;
+            PyObject* index;
+
+            PyErr_SetFromErrno(PyExc_OSError);
+            PyErr_Fetch(&exc_type, &exc_value, &exc_tb);
+            PyErr_NormalizeException(&exc_type, &exc_value, &exc_tb);
+            index = PyLong_FromSsize_t(failed);
+            if (index == NULL || PyObject_SetAttrString(exc_value, "index", index) < 0) {
+                Py_XDECREF(index);
+                Py_XDECREF(exc_type);
+                Py_XDECREF(exc_value);
+                Py_XDECREF(exc_tb);
+            } else {
+                Py_DECREF(index);
+                PyErr_Restore(exc_type, exc_value, exc_tb);
+            }
+
+        } else {
+            result = PyLong_FromSsize_t(count);
+        }
+    }
+
+    for (i = 0; i < converted; i++) {
+        if (owned[i]) {
+            asl_free(items[i]);
+        } else {
+            ASLMessage_IN_USE(PySequence_Fast_GET_ITEM(seq, i))--;
+        }
+    }
+    PyMem_Free(items);
+    PyMem_Free(owned);
+    Py_DECREF(seq);
+    return result;
+}
+
+/*
+ * Convert the 'fields' argument of the search methods to a tuple
+ * of strings, returns a new reference.
+ */
+static PyObject*
+fields_tuple(PyObject* fields)
+{
+    Py_ssize_t i;
+
+    if (PyUnicode_Check(fields)) {
+        PyErr_SetString(PyExc_TypeError, "fields must be a sequence of strings, not a string");
+        return NULL;
+    }
+
+    fields = PySequence_Tuple(fields);
+    if (fields == NULL) {
+        return NULL;
+    }
+
+    for (i = 0; i < PyTuple_GET_SIZE(fields); i++) {
+        if (as_utf8(PyTuple_GET_ITEM(fields, i)) == NULL) {
+            Py_DECREF(fields);
+            return NULL;
+        }
+    }
+    return fields;
+}
+
+/*
+ * Perform a search with the GIL released. '*resp' is NULL when
+ * there are no results.
+ */
+static int
+client_run_search(ASLClientObject* r, PyObject* msg, aslresponse* resp)
+{
+    int closed = 0;
+
+    *resp = NULL;
+
+    ASLMessage_IN_USE(msg)++;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(r->lock, WAIT_LOCK);
+    if (r->value == NULL) {
+        closed = 1;
+    } else {
+        *resp = asl_search(r->value, ASLMessage_GET(msg));
+    }
+    PyThread_release_lock(r->lock);
+    Py_END_ALLOW_THREADS
+    ASLMessage_IN_USE(msg)--;
+
+    if (closed) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject*
+client_search(PyObject* self, PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "msg", "fields", NULL };
+        ASLClientObject* r = (ASLClientObject*)self;
+    PyObject* msg;
+    PyObject* fields = NULL;
+    PyObject* result;
+    aslresponse resp;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!|O", kw_list, &ASLMessageType, &msg, &fields)) {
         return NULL;
     }
 
@@ -572,111 +2006,260 @@ client_add_log_file(PyObject* self, PyObject* args, PyObject* kwds)
         return NULL;
     }
 
-    if (asl_add_log_file(r->value, fd) != 0) {
-        PyErr_SetFromErrno(PyExc_OSError);
+    if (fields == Py_None) {
+        fields = NULL;
+
+    } else if (fields != NULL) {
+        fields = fields_tuple(fields);
+        if (fields == NULL) {
+            return NULL;
+        }
+    }
+
+    if (client_run_search(r, msg, &resp) < 0) {
+        Py_XDECREF(fields);
         return NULL;
     }
-    Py_INCREF(Py_None);
-    return Py_None;
+
+    /* A NULL 'resp' is an empty response, it is not possible to
+     * detect the difference between 'no results' and 'invalid query'.
+     */
+    result = new_response(resp, fields);
+    Py_XDECREF(fields);
+    return result;
 }
 
-static PyObject*
-client_remove_log_file(PyObject* self, PyObject* args, PyObject* kwds)
+
+/*
+ * Columnar search results
+ *
+ * Numeric columns are collected in a C buffer and converted to an
+ * array.array at the end, text columns are collected in a list.
+ */
+
+typedef struct {
+    const char* name;
+    char typecode; /* 'q', 'd' or '\0' for a text column */
+    PyObject* list;
+    char* buf;
+    unsigned char* mask; /* 1 for valid numeric values, or NULL */
+    int with_mask;
+    Py_ssize_t used;
+    Py_ssize_t allocated;
+} column;
+
+/* Attributes that are numeric columns by default */
+static const char* numeric_keys[] = {
+    ASL_KEY_TIME,
+    ASL_KEY_TIME_NSEC,
+    ASL_KEY_PID,
+    ASL_KEY_UID,
+    ASL_KEY_GID,
+    ASL_KEY_LEVEL,
+    ASL_KEY_READ_UID,
+    ASL_KEY_READ_GID,
+    ASL_KEY_MSG_ID,
+    ASL_KEY_REF_PID,
+    NULL
+};
+
+static int
+column_init(column* col, PyObject* name, PyObject* types, int with_mask)
 {
-    static char* kw_list[] = { "fd", NULL };
-        ASLClientObject* r = (ASLClientObject*)self;
-    int fd;
+    const char** cur;
+    PyObject* type = NULL;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "i", kw_list, &fd)) {
-        return NULL;
+    col->name = PyUnicode_AsUTF8(name);
+    if (col->name == NULL) {
+        return -1;
     }
 
-    if (r->value == NULL) {
-        PyErr_SetString(PyExc_ValueError, "Client is closed");
-        return NULL;
+    col->typecode = '\0';
+    for (cur = numeric_keys; *cur != NULL; cur++) {
+        if (strcmp(*cur, col->name) == 0) {
+            col->typecode = 'q';
+            break;
+        }
     }
 
-    if (asl_remove_log_file(r->value, fd) != 0) {
-        PyErr_SetFromErrno(PyExc_OSError);
-        return NULL;
+    if (types != NULL) {
+        type = PyDict_GetItemWithError(types, name);
+        if (type == NULL && PyErr_Occurred()) {
+            return -1;
+        }
     }
-    Py_INCREF(Py_None);
-    return Py_None;
+
+    if (type == Py_None) {
+        col->typecode = '\0';
+
+    } else if (type != NULL) {
+        const char* code = PyUnicode_Check(type) ? PyUnicode_AsUTF8(type) : NULL;
+
+        if (code == NULL || (strcmp(code, "q") != 0 && strcmp(code, "d") != 0)) {
+            PyErr_Format(PyExc_ValueError, "Invalid column type for '%s', expecting 'q', 'd' or None",
+                    col->name);
+            return -1;
+        }
+        col->typecode = code[0];
+    }
+
+    col->with_mask = with_mask && col->typecode != '\0';
+    if (col->typecode == '\0') {
+        col->list = PyList_New(0);
+        if (col->list == NULL) {
+            return -1;
+        }
+    }
+    return 0;
 }
 
-static PyObject*
-client_set_filter(PyObject* self, PyObject* args, PyObject* kwds)
+static int
+column_append(column* col, const char* value)
 {
-    static char* kw_list[] = { "filter", NULL };
-        ASLClientObject* r = (ASLClientObject*)self;
-    int filter;
+    PyObject* o;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "i", kw_list, &filter)) {
-        return NULL;
+    if (col->typecode == '\0') {
+        if (value == NULL) {
+            o = Py_None;
+            Py_INCREF(o);
+        } else {
+            o = value_object(col->name, value);
+            if (o == NULL) {
+                return -1;
+            }
+        }
+        if (PyList_Append(col->list, o) < 0) {
+            Py_DECREF(o);
+            return -1;
+        }
+        Py_DECREF(o);
+        return 0;
     }
 
-    if (r->value == NULL) {
-        PyErr_SetString(PyExc_ValueError, "Client is closed");
-        return NULL;
+    if (col->used == col->allocated) {
+        Py_ssize_t allocated = col->allocated ? col->allocated * 2 : 1024;
+        char* buf = PyMem_Realloc(col->buf, allocated * 8);
+        if (buf == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        col->buf = buf;
+
+        if (col->with_mask) {
+            unsigned char* mask = PyMem_Realloc(col->mask, allocated);
+            if (mask == NULL) {
+                PyErr_NoMemory();
+                return -1;
+            }
+            col->mask = mask;
+        }
+        col->allocated = allocated;
     }
 
-    filter = asl_set_filter(r->value, filter);
-    return Py_BuildValue("i", filter);
-}
+    if (col->typecode == 'q') {
+        long long v = 0;
 
-static PyObject*
-client_close(PyObject* self)
-{
-        ASLClientObject* r = (ASLClientObject*)self;
-    if (r->value != NULL) {
-        asl_close(r->value);
-        r->value = NULL;
+        if (value != NULL) {
+            char* end;
+
+            errno = 0;
+            v = strtoll(value, &end, 10);
+            if (end == value || *end != '\0' || errno == ERANGE) {
+                /* Not an integer, or out of range */
+                v = 0;
+                value = NULL;
+            }
+        }
+        memcpy(col->buf + col->used * 8, &v, 8);
+
+    } else {
+        double v = Py_NAN;
+
+        if (value != NULL) {
+            v = PyOS_string_to_double(value, NULL, NULL);
+            if (v == -1.0 && PyErr_Occurred()) {
+                /* Not a number */
+                PyErr_Clear();
+                v = Py_NAN;
+                value = NULL;
+            }
+        }
+        memcpy(col->buf + col->used * 8, &v, 8);
     }
-    Py_INCREF(Py_None);
-    return Py_None;
+    if (col->with_mask) {
+        col->mask[col->used] = (value != NULL);
+    }
+    col->used++;
+    return 0;
 }
 
+/* Return a new array.array with typecode 'typecode' and the data in 'buf' */
 static PyObject*
-client_enter(PyObject* self)
+make_array(PyObject* array_module, char typecode, void* buf, Py_ssize_t size)
 {
-        ASLClientObject* r = (ASLClientObject*)self;
-    if (r->value == NULL) {
-        PyErr_SetString(PyExc_ValueError, "Client is closed");
+    PyObject* result;
+    PyObject* data;
+    PyObject* tmp;
+
+    result = PyObject_CallMethod(array_module, "array", "C", typecode);
+    if (result == NULL || size == 0) {
+        return result;
+    }
+
+    /* frombytes() with a read-only view on 'buf' copies the
+     * data once, without an intermediate bytes object.
+     */
+    data = PyMemoryView_FromMemory(buf, size, PyBUF_READ);
+    if (data == NULL) {
+        Py_DECREF(result);
         return NULL;
     }
-    Py_INCREF(self);
-    return self;
+    tmp = PyObject_CallMethod(result, "frombytes", "O", data);
+    Py_DECREF(data);
+    if (tmp == NULL) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    Py_DECREF(tmp);
+    return result;
 }
 
+/* Return a new reference to the column value (a list or an array.array) */
 static PyObject*
-client_exit(PyObject* self, PyObject* args)
+column_finish(column* col, PyObject* array_module)
 {
-        ASLClientObject* r = (ASLClientObject*)self;
-    PyObject* exc_type;
-    PyObject* exc_val;
-    PyObject* exc_tb;
+    PyObject* result;
 
-    if (!PyArg_ParseTuple(args, "OOO", &exc_type, &exc_val, &exc_tb)) {
-        return NULL;
+    if (col->typecode == '\0') {
+        Py_INCREF(col->list);
+        return col->list;
     }
 
-    if (r->value != NULL) {
-        asl_close(r->value);
-        r->value = NULL;
-    }
+    result = make_array(array_module, col->typecode, col->buf, col->used * 8);
 
-    Py_INCREF(Py_False);
-    return Py_False;
+    /* Release the memory as soon as possible, the buffer can be large */
+    PyMem_Free(col->buf);
+    col->buf = NULL;
+    return result;
 }
 
 static PyObject*
-client_send(PyObject* self, PyObject* args, PyObject* kwds)
+client_search_columns(PyObject* self, PyObject* args, PyObject* kwds)
 {
-    static char* kw_list[] = { "msg", NULL };
+    static char* kw_list[] = { "msg", "fields", "types", "masks", NULL };
         ASLClientObject* r = (ASLClientObject*)self;
     PyObject* msg;
+    PyObject* fields;
+    PyObject* types = NULL;
+    int with_masks = 0;
+    PyObject* array_module = NULL;
+    PyObject* result = NULL;
+    PyObject* masks = NULL;
+    column* columns;
+    Py_ssize_t count, i;
+    aslresponse resp;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!", kw_list, &ASLMessageType, &msg)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!O|O$p", kw_list, &ASLMessageType, &msg, &fields, &types, &with_masks)) {
         return NULL;
     }
 
@@ -685,47 +2268,126 @@ client_send(PyObject* self, PyObject* args, PyObject* kwds)
         return NULL;
     }
 
-    if (asl_send(r->value, ASLMessage_GET(msg)) != 0) {
-        PyErr_SetFromErrno(PyExc_OSError);
+    if (types == Py_None) {
+        types = NULL;
+    } else if (types != NULL && !PyDict_Check(types)) {
+        PyErr_Format(PyExc_TypeError, "Expecting a dict for types, got instance of '%s'",
+                Py_TYPE(types)->tp_name);
         return NULL;
     }
-    Py_INCREF(Py_None);
-    return Py_None;
-}
-
-static PyObject*
-client_search(PyObject* self, PyObject* args, PyObject* kwds)
-{
-    static char* kw_list[] = { "msg", NULL };
-        ASLClientObject* r = (ASLClientObject*)self;
-    PyObject* msg;
-    aslresponse resp;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!", kw_list, &ASLMessageType, &msg)) {
+    fields = fields_tuple(fields);
+    if (fields == NULL) {
         return NULL;
     }
+    count = PyTuple_GET_SIZE(fields);
 
-    if (r->value == NULL) {
-        PyErr_SetString(PyExc_ValueError, "Client is closed");
+    columns = PyMem_Calloc(count ? count : 1, sizeof(column));
+    if (columns == NULL) {
+        Py_DECREF(fields);
+        PyErr_NoMemory();
         return NULL;
     }
 
-    resp = asl_search(r->value, ASLMessage_GET(msg));
-    if (resp == NULL) {
-        /* It is not possible to detect the difference between 'no results'
-         * and 'invalid query'.
+    for (i = 0; i < count; i++) {
+        if (column_init(columns + i, PyTuple_GET_ITEM(fields, i), types, with_masks) < 0) {
+            goto done;
+        }
+    }
+
+    array_module = PyImport_ImportModule("array");
+    if (array_module == NULL) {
+        goto done;
+    }
+
+    if (client_run_search(r, msg, &resp) < 0) {
+        goto done;
+    }
+
+    if (resp != NULL) {
+        /* Records are read in chunks without the GIL, the values
+         * are appended to the columns with the GIL held.
          */
-        PyObject* res;
-        PyObject* tmp = PyTuple_New(0);
-        if (tmp == NULL) {
-            return NULL;
+        aslmsg chunk[RESPONSE_CHUNK];
+        Py_ssize_t len, j;
+
+        do {
+            len = response_read_chunk(resp, chunk, RESPONSE_CHUNK);
+            for (j = 0; j < len; j++) {
+                for (i = 0; i < count; i++) {
+                    if (column_append(columns + i, asl_get(chunk[j], columns[i].name)) < 0) {
+                        aslresponse_free(resp);
+                        goto done;
+                    }
+                }
+            }
+        } while (len == RESPONSE_CHUNK);
+        aslresponse_free(resp);
+    }
+
+    result = PyDict_New();
+    if (result == NULL) {
+        goto done;
+    }
+
+    if (with_masks) {
+        masks = PyDict_New();
+        if (masks == NULL) {
+            Py_CLEAR(result);
+            goto done;
+        }
+
+        for (i = 0; i < count; i++) {
+            PyObject* value;
+
+            if (!columns[i].with_mask) {
+                continue;
+            }
+            value = make_array(array_module, 'B', columns[i].mask, columns[i].used);
+            if (value == NULL) {
+                Py_CLEAR(result);
+                goto done;
+            }
+            if (PyDict_SetItem(masks, PyTuple_GET_ITEM(fields, i), value) < 0) {
+                Py_DECREF(value);
+                Py_CLEAR(result);
+                goto done;
+            }
+            Py_DECREF(value);
+        }
+    }
+
+    for (i = 0; i < count; i++) {
+        PyObject* value = column_finish(columns + i, array_module);
+        if (value == NULL) {
+            Py_CLEAR(result);
+            goto done;
         }
-        res = PyObject_GetIter(tmp);
-        Py_DECREF(tmp);
-        return res;
+        if (PyDict_SetItem(result, PyTuple_GET_ITEM(fields, i), value) < 0) {
+            Py_DECREF(value);
+            Py_CLEAR(result);
+            goto done;
+        }
+        Py_DECREF(value);
+    }
+
+    if (with_masks) {
+        PyObject* tmp = PyTuple_Pack(2, result, masks);
+        Py_DECREF(result);
+        result = tmp;
     }
 
-    return new_response(resp);
+done:
+    for (i = 0; i < count; i++) {
+        Py_XDECREF(columns[i].list);
+        PyMem_Free(columns[i].buf);
+        PyMem_Free(columns[i].mask);
+    }
+    Py_XDECREF(masks);
+    PyMem_Free(columns);
+    Py_XDECREF(array_module);
+    Py_DECREF(fields);
+    return result;
 }
 
 static PyObject*
@@ -735,11 +2397,32 @@ client_log(PyObject* self, PyObject* args, PyObject* kwds)
         ASLClientObject* r = (ASLClientObject*)self;
     PyObject* msg;
     int level;
-    const char* text;
+    PyObject* text;
+    PyObject* head = args;
+    PyObject* fmt_args = NULL;
+    PyObject* formatted = NULL;
+    const char* c_text;
+    Py_ssize_t len;
+    int closed = 0;
+    int result = 0;
+
+    /* Positional arguments after 'text' are formatting arguments */
+    if (PyTuple_GET_SIZE(args) > 3) {
+        head = PyTuple_GetSlice(args, 0, 3);
+        if (head == NULL) {
+            return NULL;
+        }
+    }
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "Ois", kw_list, &msg, &level, &text)) {
+    if (!PyArg_ParseTupleAndKeywords(head, kwds, "OiU", kw_list, &msg, &level, &text)) {
+        if (head != args) {
+            Py_DECREF(head);
+        }
         return NULL;
     }
+    if (head != args) {
+        Py_DECREF(head);
+    }
 
     if (msg != Py_None && !ASLMessage_Check(msg)) {
         PyErr_Format(PyExc_TypeError, "Expected aclmsg instance or None, got instance of '%s'",
@@ -752,7 +2435,68 @@ client_log(PyObject* self, PyObject* args, PyObject* kwds)
         return NULL;
     }
 
-    if (asl_log(r->value, msg == Py_None ? NULL : ASLMessage_GET(msg), level, "%s", text) != 0) {
+    if (!client_level_enabled(r, level)) {
+        /* Filtered out, don't format the message */
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    if (PyTuple_GET_SIZE(args) > 3) {
+        /* Like the logging package a single mapping is used
+         * for named formatting arguments.
+         */
+        if (PyTuple_GET_SIZE(args) == 4 && PyDict_Check(PyTuple_GET_ITEM(args, 3))
+                && PyDict_GET_SIZE(PyTuple_GET_ITEM(args, 3)) != 0) {
+            fmt_args = PyTuple_GET_ITEM(args, 3);
+            Py_INCREF(fmt_args);
+        } else {
+            fmt_args = PyTuple_GetSlice(args, 3, PyTuple_GET_SIZE(args));
+            if (fmt_args == NULL) {
+                return NULL;
+            }
+        }
+        formatted = PyUnicode_Format(text, fmt_args);
+        Py_DECREF(fmt_args);
+        if (formatted == NULL) {
+            return NULL;
+        }
+        text = formatted;
+    }
+
+    c_text = PyUnicode_AsUTF8AndSize(text, &len);
+    if (c_text == NULL) {
+        Py_XDECREF(formatted);
+        return NULL;
+    }
+    if ((size_t)len != strlen(c_text)) {
+        Py_XDECREF(formatted);
+        PyErr_SetString(PyExc_ValueError, "embedded null character");
+        return NULL;
+    }
+
+    if (msg != Py_None) {
+        ASLMessage_IN_USE(msg)++;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(r->lock, WAIT_LOCK);
+    if (r->value == NULL) {
+        closed = 1;
+    } else {
+        result = asl_log(r->value, msg == Py_None ? NULL : ASLMessage_GET(msg), level, "%s", c_text);
+    }
+    PyThread_release_lock(r->lock);
+    Py_END_ALLOW_THREADS
+    if (msg != Py_None) {
+        ASLMessage_IN_USE(msg)--;
+    }
+    Py_XDECREF(formatted);
+
+    if (closed) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    if (result != 0) {
         PyErr_SetFromErrno(PyExc_OSError);
         return NULL;
     }
@@ -771,6 +2515,8 @@ client_log_descriptor(PyObject* self, PyObject* args, PyObject* kwds)
     int level;
     int fd;
     int fd_type;
+    int closed = 0;
+    int result = 0;
 
     if (!PyArg_ParseTupleAndKeywords(args, kwds, "Oiii", kw_list, &msg, &level, &fd, &fd_type)) {
         return NULL;
@@ -792,7 +2538,28 @@ client_log_descriptor(PyObject* self, PyObject* args, PyObject* kwds)
         return NULL;
     }
 
-    if (asl_log_descriptor(r->value, msg == Py_None ? NULL : ASLMessage_GET(msg), level, fd, fd_type) != 0) {
+    if (msg != Py_None) {
+        ASLMessage_IN_USE(msg)++;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(r->lock, WAIT_LOCK);
+    if (r->value == NULL) {
+        closed = 1;
+    } else {
+        result = asl_log_descriptor(r->value, msg == Py_None ? NULL : ASLMessage_GET(msg), level, fd, fd_type);
+    }
+    PyThread_release_lock(r->lock);
+    Py_END_ALLOW_THREADS
+    if (msg != Py_None) {
+        ASLMessage_IN_USE(msg)--;
+    }
+
+    if (closed) {
+        PyErr_SetString(PyExc_ValueError, "Client is closed");
+        return NULL;
+    }
+
+    if (result != 0) {
         PyErr_SetFromErrno(PyExc_OSError);
         return NULL;
     }
@@ -888,12 +2655,75 @@ static char* kw_list[] = { "fd", "ident", "facility", NULL };
         return NULL;
     }
 
-    return new_client(cli);
+    return new_client(cli, 0);
 }
 #endif
 
 
+static PyObject*
+set_value_cache(PyObject* self __attribute__((__unused__)), PyObject* args, PyObject* kwds)
+{
+    static char* kw_list[] = { "maxsize", NULL };
+    Py_ssize_t maxsize;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "n", kw_list, &maxsize)) {
+        return NULL;
+    }
+
+    if (maxsize < 0) {
+        PyErr_SetString(PyExc_ValueError, "maxsize must not be negative");
+        return NULL;
+    }
+
+    str_cache_free(&value_cache);
+    if (str_cache_init(&value_cache, maxsize, 0) < 0) {
+        return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static PyObject*
+value_cache_info(PyObject* self __attribute__((__unused__)))
+{
+    return PyObject_CallFunction(value_cache_info_type, "KKnn",
+        (unsigned long long)value_cache.hits,
+        (unsigned long long)value_cache.misses,
+        (Py_ssize_t)(value_cache.nsets * CACHE_WAYS),
+        value_cache.size);
+}
+
+static PyObject*
+value_cache_clear(PyObject* self __attribute__((__unused__)))
+{
+    str_cache_clear(&value_cache);
+    value_cache.hits = 0;
+    value_cache.misses = 0;
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 static PyMethodDef mod_methods[] = {
+    {
+        "set_value_cache",
+        (PyCFunction)set_value_cache,
+        METH_VARARGS|METH_KEYWORDS,
+        NULL
+    },
+    {
+        "value_cache_info",
+        (PyCFunction)value_cache_info,
+        METH_NOARGS,
+        NULL
+    },
+    {
+        "value_cache_clear",
+        (PyCFunction)value_cache_clear,
+        METH_NOARGS,
+        NULL
+    },
 #if (MAC_OS_X_VERSION_MAX_ALLOWED >= MAC_OS_X_VERSION_10_7)
     {
         "log_auxiliary_location",
@@ -955,6 +2785,37 @@ PyInit__asl(void)
         return NULL;
     }
 
+    if (key_cache.entries == NULL && key_cache_init() < 0) {
+        return NULL;
+    }
+
+    if (value_cache_info_type == NULL) {
+        PyObject* namedtuple;
+        PyObject* args;
+        PyObject* kwds;
+
+        namedtuple = PyImport_ImportModule("collections");
+        if (namedtuple == NULL) {
+            return NULL;
+        }
+        Py_SETREF(namedtuple, PyObject_GetAttrString(namedtuple, "namedtuple"));
+        if (namedtuple == NULL) {
+            return NULL;
+        }
+
+        args = Py_BuildValue("ss", "ValueCacheInfo", "hits misses maxsize currsize");
+        kwds = Py_BuildValue("{ss}", "module", "asl");
+        if (args != NULL && kwds != NULL) {
+            value_cache_info_type = PyObject_Call(namedtuple, args, kwds);
+        }
+        Py_XDECREF(args);
+        Py_XDECREF(kwds);
+        Py_DECREF(namedtuple);
+        if (value_cache_info_type == NULL) {
+            return NULL;
+        }
+    }
+
 #if (MAC_OS_X_VERSION_MAX_ALLOWED >= MAC_OS_X_VERSION_10_8) && (MAC_OS_X_VERSION_MIN_REQUIRED < MAC_OS_X_VERSION_10_8)
     if (asl_log_descriptor == NULL) {
         if (PyDict_DelItemString(ASLClientType.tp_dict, "log_descriptor") < 0) {
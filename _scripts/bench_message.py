@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for constructing aslmsg objects
+
+Compares building a message one key at a time with the mapping
+interface against constructing it from a dict in a single call,
+using the attributes of a typical logging.LogRecord.
+
+Usage::
+
+   python3 _scripts/bench_message.py [--stub] [--number N]
+"""
+import argparse
+import logging
+import sys
+import timeit
+import typing
+
+from stubbuild import ROOTDIR, build_stub_extension
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--stub", action="store_true", help="build against the stub libasl"
+    )
+    parser.add_argument("--number", type=int, default=100000, help="iterations")
+    opts = parser.parse_args(argv)
+
+    if opts.stub:
+        build_stub_extension()
+
+    sys.path.insert(0, ROOTDIR)
+    import asl
+
+    record = logging.LogRecord(
+        "bench", logging.INFO, __file__, 42, "hello %s", ("world",), None
+    )
+    values = {
+        "py." + k: str(v)
+        for k, v in vars(record).items()
+        if not k.startswith("_") and k not in ("args", "msecs", "relativeCreated")
+    }
+    values[asl.ASL_KEY_FACILITY] = "com.apple.console"
+    values[asl.ASL_KEY_LEVEL] = asl.ASL_STRING_INFO
+    values[asl.ASL_KEY_READ_UID] = "-1"
+    values[asl.ASL_KEY_MSG] = record.getMessage()
+
+    def per_key():
+        msg = asl.aslmsg(asl.ASL_TYPE_MSG)
+        for k, v in values.items():
+            msg[k] = v
+
+    def constructor():
+        asl.aslmsg(asl.ASL_TYPE_MSG, values)
+
+    def update():
+        msg = asl.aslmsg(asl.ASL_TYPE_MSG)
+        msg.update(values)
+
+    print("{} keys per message".format(len(values)))
+    base = None
+    for name, func in [
+        ("__setitem__", per_key),
+        ("aslmsg(type, mapping)", constructor),
+        ("update(mapping)", update),
+    ]:
+        best = min(timeit.repeat(func, number=opts.number, repeat=5))
+        per_call = best / opts.number * 1e6
+        if base is None:
+            base = per_call
+        print("{:24} {:8.2f} us/msg {:6.2f}x".format(name, per_call, base / per_call))
+
+
+if __name__ == "__main__":
+    main()
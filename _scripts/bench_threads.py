@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Threaded throughput benchmark for the asl extension
+
+Every thread uses its own aslclient and repeatedly calls one of
+the blocking APIs (send, log or search). Because those calls release
+the GIL the throughput should scale with the number of threads until
+syslogd becomes the bottleneck.
+
+On platforms without libasl use "--stub" to build the extension
+against the stub library in _scripts/stub_asl, which simulates the
+IPC round trip with a short sleep (see ASL_STUB_LATENCY_US).
+
+Usage::
+
+   python3 _scripts/bench_threads.py [--stub] [--calls N] [--threads 1,2,4,8]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import typing
+
+from stubbuild import ROOTDIR, build_stub_extension
+
+
+def worker(asl, action: str, calls: int, barrier: threading.Barrier) -> None:
+    cli = asl.aslclient("bench", "user", 0)
+    msg = asl.aslmsg(asl.ASL_TYPE_MSG)
+    msg[asl.ASL_KEY_LEVEL] = asl.ASL_STRING_NOTICE
+    msg[asl.ASL_KEY_MSG] = "benchmark message"
+
+    query = asl.aslmsg(asl.ASL_TYPE_QUERY)
+    query.set_query(asl.ASL_KEY_SENDER, "nosuchsender", asl.ASL_QUERY_OP_EQUAL)
+
+    barrier.wait()
+    if action == "send":
+        for _ in range(calls):
+            cli.send(msg)
+
+    elif action == "log":
+        for _ in range(calls):
+            cli.log(None, asl.ASL_LEVEL_NOTICE, "benchmark message")
+
+    elif action == "search":
+        for _ in range(calls):
+            for _ in cli.search(query):
+                pass
+
+    cli.close()
+
+
+def run(asl, action: str, nthreads: int, calls: int) -> float:
+    barrier = threading.Barrier(nthreads + 1)
+    threads = [
+        threading.Thread(target=worker, args=(asl, action, calls, barrier))
+        for _ in range(nthreads)
+    ]
+    for t in threads:
+        t.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return (nthreads * calls) / (time.perf_counter() - start)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--stub", action="store_true", help="build against the stub libasl"
+    )
+    parser.add_argument("--calls", type=int, default=2000, help="calls per thread")
+    parser.add_argument(
+        "--threads", default="1,2,4,8", help="comma separated thread counts"
+    )
+    parser.add_argument(
+        "--actions", default="send,log,search", help="comma separated APIs to test"
+    )
+    opts = parser.parse_args(argv)
+
+    if opts.stub:
+        # Keep the in-memory store of the stub small, the benchmark
+        # doesn't need the messages it sends.
+        os.environ.setdefault("ASL_STUB_MAX_RECORDS", "100")
+        build_stub_extension()
+
+    sys.path.insert(0, ROOTDIR)
+    import asl
+
+    counts = [int(v) for v in opts.threads.split(",")]
+    print("{:8} {:>8} {:>12} {:>8}".format("api", "threads", "calls/s", "speedup"))
+    for action in opts.actions.split(","):
+        base = None
+        for nthreads in counts:
+            rate = run(asl, action, nthreads, opts.calls)
+            if base is None:
+                base = rate
+            print(
+                "{:8} {:8d} {:12.0f} {:8.2f}".format(
+                    action, nthreads, rate, rate / base
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
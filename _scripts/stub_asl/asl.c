@@ -0,0 +1,666 @@
+/*
+ * Minimal in-process implementation of the ASL API, see asl.h
+ *
+ * Messages that are sent are kept in a bounded in-memory store
+ * that can be searched. Calls that would perform IPC with syslogd
+ * in the real library sleep for ASL_STUB_LATENCY_US microseconds
+ * (default: 50) to simulate the round trip.
+ */
+#include "asl.h"
+
+#include <errno.h>
+#include <fcntl.h>
+#include <pthread.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <strings.h>
+#include <sys/time.h>
+#include <time.h>
+#include <unistd.h>
+
+struct __aslmsg {
+    uint32_t type;
+    uint32_t count;
+    uint32_t capacity;
+    char** keys;
+    char** values;
+    uint32_t* ops;
+};
+
+struct __aslclient {
+    char* ident;
+    char* facility;
+    uint32_t opts;
+    int filter;
+};
+
+struct __aslresponse {
+    uint32_t count;
+    uint32_t next;
+    aslmsg* items;
+};
+
+static pthread_mutex_t store_lock = PTHREAD_MUTEX_INITIALIZER;
+static aslmsg* store;
+static uint32_t store_size;
+static uint32_t store_start;
+static uint32_t store_count;
+static uint64_t store_next_id = 1;
+
+static void
+simulate_ipc(void)
+{
+    static long latency = -1;
+
+    if (latency == -1) {
+        const char* v = getenv("ASL_STUB_LATENCY_US");
+        latency = v ? atol(v) : 50;
+    }
+    if (latency > 0) {
+        usleep((useconds_t)latency);
+    }
+}
+
+static char*
+xstrdup(const char* value)
+{
+    return strdup(value ? value : "");
+}
+
+/* Messages */
+
+aslmsg
+asl_new(uint32_t type)
+{
+    aslmsg msg;
+
+    if (type != ASL_TYPE_MSG && type != ASL_TYPE_QUERY) {
+        errno = EINVAL;
+        return NULL;
+    }
+
+    msg = calloc(1, sizeof(*msg));
+    if (msg == NULL) {
+        return NULL;
+    }
+    msg->type = type;
+    return msg;
+}
+
+void
+asl_free(aslmsg msg)
+{
+    uint32_t i;
+
+    if (msg == NULL) {
+        return;
+    }
+    for (i = 0; i < msg->count; i++) {
+        free(msg->keys[i]);
+        free(msg->values[i]);
+    }
+    free(msg->keys);
+    free(msg->values);
+    free(msg->ops);
+    free(msg);
+}
+
+static int
+msg_index(aslmsg msg, const char* key)
+{
+    uint32_t i;
+
+    for (i = 0; i < msg->count; i++) {
+        if (strcmp(msg->keys[i], key) == 0) {
+            return (int)i;
+        }
+    }
+    return -1;
+}
+
+const char*
+asl_key(aslmsg msg, uint32_t n)
+{
+    if (msg == NULL || n >= msg->count) {
+        return NULL;
+    }
+    return msg->keys[n];
+}
+
+static int
+msg_set(aslmsg msg, const char* key, const char* value, uint32_t op)
+{
+    int idx;
+    char* v;
+
+    if (msg == NULL || key == NULL) {
+        errno = EINVAL;
+        return -1;
+    }
+
+    v = xstrdup(value);
+    if (v == NULL) {
+        return -1;
+    }
+
+    idx = msg_index(msg, key);
+    if (idx != -1) {
+        free(msg->values[idx]);
+        msg->values[idx] = v;
+        msg->ops[idx] = op;
+        return 0;
+    }
+
+    if (msg->count == msg->capacity) {
+        uint32_t capacity = msg->capacity ? msg->capacity * 2 : 8;
+        char** keys = realloc(msg->keys, capacity * sizeof(char*));
+        char** values;
+        uint32_t* ops;
+        if (keys == NULL) {
+            free(v);
+            return -1;
+        }
+        msg->keys = keys;
+        values = realloc(msg->values, capacity * sizeof(char*));
+        if (values == NULL) {
+            free(v);
+            return -1;
+        }
+        msg->values = values;
+        ops = realloc(msg->ops, capacity * sizeof(uint32_t));
+        if (ops == NULL) {
+            free(v);
+            return -1;
+        }
+        msg->ops = ops;
+        msg->capacity = capacity;
+    }
+
+    msg->keys[msg->count] = strdup(key);
+    if (msg->keys[msg->count] == NULL) {
+        free(v);
+        return -1;
+    }
+    msg->values[msg->count] = v;
+    msg->ops[msg->count] = op;
+    msg->count++;
+    return 0;
+}
+
+int
+asl_set(aslmsg msg, const char* key, const char* value)
+{
+    return msg_set(msg, key, value, ASL_QUERY_OP_EQUAL);
+}
+
+int
+asl_set_query(aslmsg msg, const char* key, const char* value, uint32_t op)
+{
+    return msg_set(msg, key, value, op);
+}
+
+int
+asl_unset(aslmsg msg, const char* key)
+{
+    int idx;
+
+    if (msg == NULL || key == NULL) {
+        errno = EINVAL;
+        return -1;
+    }
+
+    idx = msg_index(msg, key);
+    if (idx == -1) {
+        return 0;
+    }
+
+    free(msg->keys[idx]);
+    free(msg->values[idx]);
+    memmove(msg->keys + idx, msg->keys + idx + 1, (msg->count - idx - 1) * sizeof(char*));
+    memmove(msg->values + idx, msg->values + idx + 1, (msg->count - idx - 1) * sizeof(char*));
+    memmove(msg->ops + idx, msg->ops + idx + 1, (msg->count - idx - 1) * sizeof(uint32_t));
+    msg->count--;
+    return 0;
+}
+
+const char*
+asl_get(aslmsg msg, const char* key)
+{
+    int idx;
+
+    if (msg == NULL || key == NULL) {
+        return NULL;
+    }
+    idx = msg_index(msg, key);
+    if (idx == -1) {
+        return NULL;
+    }
+    return msg->values[idx];
+}
+
+int
+asl_fetch_key_val_op(aslmsg msg, uint32_t n, const char** key, const char** val, uint32_t* op)
+{
+    if (msg == NULL || n >= msg->count) {
+        return -1;
+    }
+    if (key != NULL) *key = msg->keys[n];
+    if (val != NULL) *val = msg->values[n];
+    if (op != NULL) *op = msg->ops[n];
+    return 0;
+}
+
+static aslmsg
+msg_copy(aslmsg msg)
+{
+    aslmsg result = asl_new(msg->type);
+    uint32_t i;
+
+    if (result == NULL) {
+        return NULL;
+    }
+    for (i = 0; i < msg->count; i++) {
+        if (msg_set(result, msg->keys[i], msg->values[i], msg->ops[i]) != 0) {
+            asl_free(result);
+            return NULL;
+        }
+    }
+    return result;
+}
+
+/* Clients */
+
+aslclient
+asl_open(const char* ident, const char* facility, uint32_t opts)
+{
+    aslclient cli = calloc(1, sizeof(*cli));
+
+    if (cli == NULL) {
+        return NULL;
+    }
+    cli->ident = ident ? strdup(ident) : NULL;
+    cli->facility = xstrdup(facility);
+    cli->opts = opts;
+    cli->filter = ASL_FILTER_MASK_UPTO(ASL_LEVEL_NOTICE);
+    return cli;
+}
+
+aslclient
+asl_open_from_file(int descriptor, const char* ident, const char* facility)
+{
+    int flags = fcntl(descriptor, F_GETFL);
+
+    /* The store is read and written, like the real implementation */
+    if (flags == -1) {
+        return NULL;
+    }
+    if ((flags & O_ACCMODE) != O_RDWR) {
+        errno = EBADF;
+        return NULL;
+    }
+    return asl_open(ident, facility, 0);
+}
+
+void
+asl_close(aslclient asl)
+{
+    if (asl == NULL) {
+        return;
+    }
+    free(asl->ident);
+    free(asl->facility);
+    free(asl);
+}
+
+int
+asl_add_log_file(aslclient asl, int descriptor)
+{
+    (void)asl;
+    (void)descriptor;
+    return 0;
+}
+
+int
+asl_remove_log_file(aslclient asl, int descriptor)
+{
+    (void)asl;
+    (void)descriptor;
+    return 0;
+}
+
+int
+asl_set_filter(aslclient asl, int f)
+{
+    int prev = asl->filter;
+    asl->filter = f;
+    return prev;
+}
+
+static int
+store_add(aslclient asl, aslmsg msg, int level)
+{
+    aslmsg copy;
+    char buf[64];
+    struct timespec ts;
+    int ok = 0;
+
+    if (msg != NULL) {
+        copy = msg_copy(msg);
+    } else {
+        copy = asl_new(ASL_TYPE_MSG);
+    }
+    if (copy == NULL) {
+        return -1;
+    }
+
+    clock_gettime(CLOCK_REALTIME, &ts);
+    snprintf(buf, sizeof(buf), "%lld", (long long)ts.tv_sec);
+    ok |= msg_set(copy, ASL_KEY_TIME, buf, ASL_QUERY_OP_EQUAL);
+    snprintf(buf, sizeof(buf), "%ld", (long)ts.tv_nsec);
+    ok |= msg_set(copy, ASL_KEY_TIME_NSEC, buf, ASL_QUERY_OP_EQUAL);
+    snprintf(buf, sizeof(buf), "%d", (int)getpid());
+    ok |= msg_set(copy, ASL_KEY_PID, buf, ASL_QUERY_OP_EQUAL);
+    snprintf(buf, sizeof(buf), "%d", (int)getuid());
+    ok |= msg_set(copy, ASL_KEY_UID, buf, ASL_QUERY_OP_EQUAL);
+    snprintf(buf, sizeof(buf), "%d", (int)getgid());
+    ok |= msg_set(copy, ASL_KEY_GID, buf, ASL_QUERY_OP_EQUAL);
+    if (asl_get(copy, ASL_KEY_LEVEL) == NULL) {
+        snprintf(buf, sizeof(buf), "%d", level);
+        ok |= msg_set(copy, ASL_KEY_LEVEL, buf, ASL_QUERY_OP_EQUAL);
+    }
+    if (asl_get(copy, ASL_KEY_SENDER) == NULL) {
+        ok |= msg_set(copy, ASL_KEY_SENDER, asl && asl->ident ? asl->ident : "python", ASL_QUERY_OP_EQUAL);
+    }
+    if (asl_get(copy, ASL_KEY_FACILITY) == NULL) {
+        ok |= msg_set(copy, ASL_KEY_FACILITY, asl ? asl->facility : "user", ASL_QUERY_OP_EQUAL);
+    }
+    if (asl_get(copy, ASL_KEY_HOST) == NULL) {
+        if (gethostname(buf, sizeof(buf)) != 0) {
+            strcpy(buf, "localhost");
+        }
+        buf[sizeof(buf) - 1] = '\0';
+        ok |= msg_set(copy, ASL_KEY_HOST, buf, ASL_QUERY_OP_EQUAL);
+    }
+    if (ok != 0) {
+        asl_free(copy);
+        return -1;
+    }
+
+    pthread_mutex_lock(&store_lock);
+    if (store == NULL) {
+        const char* v = getenv("ASL_STUB_MAX_RECORDS");
+        store_size = v ? (uint32_t)atol(v) : 100000;
+        if (store_size == 0) {
+            store_size = 1;
+        }
+        store = calloc(store_size, sizeof(aslmsg));
+        if (store == NULL) {
+            pthread_mutex_unlock(&store_lock);
+            asl_free(copy);
+            return -1;
+        }
+    }
+
+    snprintf(buf, sizeof(buf), "%llu", (unsigned long long)store_next_id++);
+    if (msg_set(copy, ASL_KEY_MSG_ID, buf, ASL_QUERY_OP_EQUAL) != 0) {
+        pthread_mutex_unlock(&store_lock);
+        asl_free(copy);
+        return -1;
+    }
+
+    if (store_count == store_size) {
+        asl_free(store[store_start]);
+        store[store_start] = copy;
+        store_start = (store_start + 1) % store_size;
+    } else {
+        store[(store_start + store_count) % store_size] = copy;
+        store_count++;
+    }
+    pthread_mutex_unlock(&store_lock);
+    return 0;
+}
+
+static int
+level_of(aslmsg msg)
+{
+    const char* v = msg ? asl_get(msg, ASL_KEY_LEVEL) : NULL;
+
+    if (v == NULL) {
+        return ASL_LEVEL_NOTICE;
+    }
+    return atoi(v);
+}
+
+int
+asl_send(aslclient asl, aslmsg msg)
+{
+    simulate_ipc();
+    if (asl != NULL && !(asl->filter & ASL_FILTER_MASK(level_of(msg)))) {
+        return 0;
+    }
+    return store_add(asl, msg, level_of(msg));
+}
+
+int
+asl_log(aslclient asl, aslmsg msg, int level, const char* format, ...)
+{
+    char buf[1024];
+    char lvl[16];
+    va_list ap;
+    aslmsg tmp;
+    int result;
+
+    simulate_ipc();
+    if (asl != NULL && !(asl->filter & ASL_FILTER_MASK(level))) {
+        return 0;
+    }
+
+    tmp = msg ? msg_copy(msg) : asl_new(ASL_TYPE_MSG);
+    if (tmp == NULL) {
+        return -1;
+    }
+
+    va_start(ap, format);
+    vsnprintf(buf, sizeof(buf), format, ap);
+    va_end(ap);
+
+    snprintf(lvl, sizeof(lvl), "%d", level);
+    if (msg_set(tmp, ASL_KEY_MSG, buf, ASL_QUERY_OP_EQUAL) != 0
+            || msg_set(tmp, ASL_KEY_LEVEL, lvl, ASL_QUERY_OP_EQUAL) != 0) {
+        asl_free(tmp);
+        return -1;
+    }
+    result = store_add(asl, tmp, level);
+    asl_free(tmp);
+    return result;
+}
+
+int
+asl_log_descriptor(aslclient asl, aslmsg msg, int level, int descriptor, uint32_t fd_type)
+{
+    (void)asl;
+    (void)msg;
+    (void)level;
+    (void)descriptor;
+    (void)fd_type;
+    return 0;
+}
+
+/* Searching */
+
+static int
+test_term(uint32_t op, const char* q, const char* v)
+{
+    int cmp;
+    uint32_t rel = op & 0x000f;
+
+    if (rel == ASL_QUERY_OP_TRUE) {
+        return 1;
+    }
+    if (v == NULL) {
+        return rel == ASL_QUERY_OP_NOT_EQUAL;
+    }
+
+    if (op & ASL_QUERY_OP_NUMERIC) {
+        long long a = atoll(v);
+        long long b = atoll(q);
+        cmp = (a > b) - (a < b);
+
+    } else if (op & ASL_QUERY_OP_SUBSTRING) {
+        size_t lv = strlen(v), lq = strlen(q);
+        int found;
+        int (*ncmp)(const char*, const char*, size_t) =
+            (op & ASL_QUERY_OP_CASEFOLD) ? strncasecmp : strncmp;
+
+        if ((op & ASL_QUERY_OP_SUBSTRING) == ASL_QUERY_OP_PREFIX) {
+            found = lq <= lv && ncmp(v, q, lq) == 0;
+        } else if ((op & ASL_QUERY_OP_SUBSTRING) == ASL_QUERY_OP_SUFFIX) {
+            found = lq <= lv && ncmp(v + lv - lq, q, lq) == 0;
+        } else {
+            size_t i;
+            found = 0;
+            for (i = 0; !found && i + lq <= lv; i++) {
+                found = ncmp(v + i, q, lq) == 0;
+            }
+        }
+        cmp = found ? 0 : 1;
+
+    } else if (op & ASL_QUERY_OP_CASEFOLD) {
+        cmp = strcasecmp(v, q);
+    } else {
+        cmp = strcmp(v, q);
+    }
+
+    switch (rel) {
+    case ASL_QUERY_OP_EQUAL: return cmp == 0;
+    case ASL_QUERY_OP_GREATER: return cmp > 0;
+    case ASL_QUERY_OP_GREATER_EQUAL: return cmp >= 0;
+    case ASL_QUERY_OP_LESS: return cmp < 0;
+    case ASL_QUERY_OP_LESS_EQUAL: return cmp <= 0;
+    case ASL_QUERY_OP_NOT_EQUAL: return cmp != 0;
+    default: return 0;
+    }
+}
+
+static int
+msg_matches(aslmsg query, aslmsg msg)
+{
+    uint32_t i;
+
+    if (query == NULL) {
+        return 1;
+    }
+    for (i = 0; i < query->count; i++) {
+        const char* v = asl_get(msg, query->keys[i]);
+        if ((query->ops[i] & 0x000f) == ASL_QUERY_OP_TRUE && v == NULL) {
+            return 0;
+        }
+        if (!test_term(query->ops[i], query->values[i], v)) {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+aslresponse
+asl_search(aslclient asl, aslmsg msg)
+{
+    aslresponse r;
+    uint32_t i;
+
+    (void)asl;
+    simulate_ipc();
+
+    r = calloc(1, sizeof(*r));
+    if (r == NULL) {
+        return NULL;
+    }
+
+    pthread_mutex_lock(&store_lock);
+    r->items = calloc(store_count ? store_count : 1, sizeof(aslmsg));
+    if (r->items == NULL) {
+        pthread_mutex_unlock(&store_lock);
+        free(r);
+        return NULL;
+    }
+    for (i = 0; i < store_count; i++) {
+        aslmsg cur = store[(store_start + i) % store_size];
+        if (msg_matches(msg, cur)) {
+            aslmsg copy = msg_copy(cur);
+            if (copy == NULL) {
+                break;
+            }
+            r->items[r->count++] = copy;
+        }
+    }
+    pthread_mutex_unlock(&store_lock);
+
+    if (r->count == 0) {
+        aslresponse_free(r);
+        return NULL;
+    }
+    return r;
+}
+
+aslmsg
+aslresponse_next(aslresponse r)
+{
+    if (r == NULL || r->next >= r->count) {
+        return NULL;
+    }
+    return r->items[r->next++];
+}
+
+void
+aslresponse_free(aslresponse r)
+{
+    uint32_t i;
+
+    if (r == NULL) {
+        return;
+    }
+    for (i = 0; i < r->count; i++) {
+        asl_free(r->items[i]);
+    }
+    free(r->items);
+    free(r);
+}
+
+/* Auxiliary files */
+
+int
+asl_create_auxiliary_file(aslmsg msg, const char* title, const char* uti, int* out_descriptor)
+{
+    char path[] = "/tmp/asl-aux-XXXXXX";
+    int fd;
+
+    (void)msg;
+    (void)title;
+    (void)uti;
+
+    fd = mkstemp(path);
+    if (fd == -1) {
+        return -1;
+    }
+    unlink(path);
+    *out_descriptor = fd;
+    return 0;
+}
+
+int
+asl_log_auxiliary_location(aslmsg msg, const char* title, const char* uti, const char* url)
+{
+    (void)msg;
+    (void)title;
+    (void)uti;
+    (void)url;
+    return 0;
+}
+
+int
+asl_close_auxiliary_file(int descriptor)
+{
+    return close(descriptor);
+}
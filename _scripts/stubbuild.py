@@ -0,0 +1,41 @@
+"""
+Helper for the benchmark scripts: build asl._asl against the
+stub libasl in _scripts/stub_asl.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+
+ROOTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_stub_extension() -> None:
+    """
+    Build asl._asl against the stub libasl in a temporary
+    directory and register it before the asl package is imported.
+    """
+    from setuptools import Distribution, Extension
+
+    stubdir = os.path.join(ROOTDIR, "_scripts", "stub_asl")
+    build_dir = tempfile.mkdtemp(prefix="asl-bench-")
+
+    ext = Extension(
+        "asl._asl",
+        [os.path.join(ROOTDIR, "_asl.c"), os.path.join(stubdir, "asl.c")],
+        include_dirs=[stubdir],
+    )
+    dist = Distribution({"name": "asl", "ext_modules": [ext]})
+    cmd = dist.get_command_obj("build_ext")
+    cmd.build_lib = build_dir  # type: ignore
+    cmd.build_temp = os.path.join(build_dir, "tmp")  # type: ignore
+    cmd.ensure_finalized()
+    cmd.run()
+
+    spec = importlib.util.spec_from_file_location(
+        "asl._asl", cmd.get_ext_fullpath("asl._asl")
+    )
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # type: ignore
+    sys.modules["asl._asl"] = module
@@ -3,8 +3,12 @@ Bindings to the Apple System Log facility.
 """
 from __future__ import absolute_import
 
-from ._asl import *  # noqa: F403
+from ._backend import *  # noqa: F403
 from ._constants import *  # noqa: F403
+from ._pool import *  # noqa: F403
+from ._query import *  # noqa: F403
+from ._record import *  # noqa: F403
+from . import match, store  # noqa: F401, I100
 
 __version__ = "1.0"
 
@@ -2,13 +2,102 @@ from __future__ import absolute_import, print_function
 
 import argparse
 import collections
+import csv
+import getpass
+import heapq
+import io
+import itertools
+import json
+import operator
 import os
+import re
+import shlex
+import string
 import sys
+import time
+import typing
 
 import asl
 
 LEVELS = sorted(asl.STRING2LEVEL, key=lambda l: asl.STRING2LEVEL[l])
 
+# Number of records converted at a time when fetching search results
+FETCH_BATCH = 256
+
+# Number of records sent at a time by "sendlog --stdin"
+SEND_BATCH = 256
+
+# Columns for "query --output csv" and "--output tsv" without "--fields"
+DEFAULT_COLUMNS = (
+    asl.ASL_KEY_MSG_ID,
+    asl.ASL_KEY_TIME,
+    asl.ASL_KEY_HOST,
+    asl.ASL_KEY_SENDER,
+    asl.ASL_KEY_FACILITY,
+    asl.ASL_KEY_PID,
+    asl.ASL_KEY_LEVEL,
+    asl.ASL_KEY_MSG,
+)
+
+# Maximum number of groups counted by "stats --top"
+TOP_MAX_GROUPS = 10000
+
+# Name of the column with the number of records in the output of "stats"
+STATS_COUNT = "Count"
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Initial interval between searches for new records with "query --follow",
+# the interval is doubled up to "--max-interval" while there are none.
+FOLLOW_MIN_INTERVAL = 0.05
+
+
+def parse_fields(value):
+    """
+    Parse the argument of "--fields", a comma separated list of
+    attribute names.
+    """
+    fields = []
+    for name in value.split(","):
+        name = name.strip()
+        if not name:
+            raise argparse.ArgumentTypeError("Empty attribute name")
+        if name in fields:
+            raise argparse.ArgumentTypeError("Duplicate attribute name: %s" % (name,))
+        fields.append(name)
+    return fields
+
+
+def parse_interval(value):
+    """
+    Parse a time interval: a number of seconds, optionally with
+    a unit ("s", "m", "h" or "d").
+    """
+    number, unit = value, 1
+    if value[-1:] in INTERVAL_UNITS:
+        number, unit = value[:-1], INTERVAL_UNITS[value[-1]]
+    try:
+        result = int(number) * unit
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid interval: %s" % (value,))
+    if result <= 0:
+        raise argparse.ArgumentTypeError("The interval must be greater than 0")
+    return result
+
+
+def positive_int(value):
+    """
+    Parse an argument that must be a number greater than 0
+    """
+    try:
+        result = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid number: %s" % (value,))
+    if result <= 0:
+        raise argparse.ArgumentTypeError("The number must be greater than 0")
+    return result
+
+
 parser = argparse.ArgumentParser(
     description="ASL command-line interface", prog=__package__
 )
@@ -25,7 +114,7 @@ parser_consolelog.add_argument(
     "--ident",
     action="store",
     metavar="IDENT",
-    default=os.getlogin(),
+    default=getpass.getuser(),
     help="Source identifier (default: %(default)s)",
 )
 parser_consolelog.add_argument(
@@ -51,8 +140,50 @@ parser_sendlog.add_argument(
     metavar=("KEY", "VALUE"),
     help="Add a key and value to the message",
 )
+parser_sendlog.add_argument(
+    "--stdin",
+    action="store_true",
+    help="send records read from stdin, using the -k values as defaults",
+)
+parser_sendlog.add_argument(
+    "--input-format",
+    action="store",
+    choices=("auto", "jsonl", "kv"),
+    default="auto",
+    help="format of the records on stdin (default: %(default)s)",
+)
+parser_sendlog.add_argument(
+    "--batch-size",
+    action="store",
+    type=positive_int,
+    default=SEND_BATCH,
+    metavar="N",
+    help="number of records sent at a time (default: %(default)s)",
+)
+
+# Options for selecting records, shared by "query" and "stats"
+query_options = argparse.ArgumentParser(add_help=False)
+query_options.add_argument(
+    "-C",
+    action="store_true",
+    dest="show_console",
+    help="include Console.app log entries",
+)
+query_options.add_argument(
+    "-k",
+    action="append",
+    dest="query",
+    nargs=3,
+    metavar=("KEY", "OP", "VALUE"),
+    help="add query element",
+)
+query_options.add_argument(
+    "-e", action="append", dest="exists", metavar="KEY", help="query that key exists"
+)
 
-parser_query = sub.add_parser("query", help="Perform ASL query")
+parser_query = sub.add_parser(
+    "query", parents=[query_options], help="Perform ASL query"
+)
 parser_query.set_defaults(action="query")
 parser_query.add_argument(
     "-f",
@@ -64,21 +195,84 @@ parser_query.add_argument(
     help="Format string for showing the record",
 )
 parser_query.add_argument(
-    "-C",
-    action="store_true",
-    dest="show_console",
-    help="include Console.app log entries",
+    "--output",
+    action="store",
+    choices=("text", "jsonl", "csv", "tsv"),
+    default="text",
+    help="output format (default: %(default)s)",
 )
 parser_query.add_argument(
-    "-k",
-    action="append",
-    dest="query",
-    nargs=3,
-    metavar=("KEY", "OP", "VALUE"),
-    help="add query element",
+    "--fields",
+    action="store",
+    type=parse_fields,
+    default=None,
+    metavar="KEY,...",
+    help="only output these attributes, in this order",
 )
 parser_query.add_argument(
-    "-e", action="append", dest="exists", metavar="KEY", help="query that key exists"
+    "--limit",
+    action="store",
+    type=positive_int,
+    default=None,
+    metavar="N",
+    help="stop after N records",
+)
+parser_query.add_argument(
+    "--follow",
+    action="store_true",
+    help="keep running and print new matching records as they are logged",
+)
+parser_query.add_argument(
+    "--max-interval",
+    action="store",
+    type=float,
+    default=1.0,
+    metavar="SECONDS",
+    help="maximum interval between searches for new records (default: %(default)s)",
+)
+
+parser_stats = sub.add_parser(
+    "stats", parents=[query_options], help="Count matching ASL records"
+)
+parser_stats.set_defaults(action="stats")
+parser_stats.add_argument(
+    "--by",
+    action="store",
+    type=parse_fields,
+    default=[],
+    metavar="KEY,...",
+    help="count records for every combination of values of these attributes",
+)
+parser_stats.add_argument(
+    "--interval",
+    action="store",
+    type=parse_interval,
+    default=None,
+    metavar="SECONDS",
+    help="count records per interval of Time, e.g. 60, 5m, 1h or 1d",
+)
+parser_stats.add_argument(
+    "--top",
+    action="store",
+    type=positive_int,
+    default=None,
+    metavar="K",
+    help="only output the K groups with the highest count",
+)
+parser_stats.add_argument(
+    "--max-groups",
+    action="store",
+    type=positive_int,
+    default=TOP_MAX_GROUPS,
+    metavar="N",
+    help="number of groups kept in memory with --top (default: %(default)s)",
+)
+parser_stats.add_argument(
+    "--output",
+    action="store",
+    choices=("text", "jsonl", "csv", "tsv"),
+    default="text",
+    help="output format (default: %(default)s)",
 )
 
 
@@ -97,6 +291,10 @@ def do_consolelog(options):
 
 
 def do_sendlog(opts):
+    if opts.stdin:
+        send_stream(opts, sys.stdin.buffer)
+        return
+
     if not opts.keys:
         print("No message arguments specified", file=sys.stderr)
         sys.exit(1)
@@ -109,6 +307,122 @@ def do_sendlog(opts):
     cli.send(msg)
 
 
+def parse_json_record(line):
+    """
+    Parse a JSON object, numbers are converted to strings
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Expecting a JSON object")
+
+    for key, value in record.items():
+        if not isinstance(value, str):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError("Invalid value for %r" % (key,))
+            record[key] = str(value)
+    return record
+
+
+def parse_kv_record(line):
+    """
+    Parse a line with "key=value" pairs separated by whitespace,
+    values with whitespace can be quoted like in a shell.
+    """
+    line = line.decode("utf-8")
+    if '"' in line or "'" in line or "\\" in line:
+        words = shlex.split(line)
+    else:
+        words = line.split()
+
+    record = {}
+    for word in words:
+        key, sep, value = word.partition("=")
+        if not sep or not key:
+            raise ValueError("Expecting key=value, got %r" % (word,))
+        record[key] = value
+    return record
+
+
+def iter_stream_records(stream, input_format):
+    """
+    Yield (line number, record) for the records in binary stream
+    *stream*, the record is an exception for invalid lines. Empty
+    lines are ignored.
+    """
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            if input_format == "jsonl" or (
+                input_format == "auto" and line.startswith(b"{")
+            ):
+                yield lineno, parse_json_record(line)
+            else:
+                yield lineno, parse_kv_record(line)
+
+        except ValueError as exc:
+            yield lineno, exc
+
+
+def send_stream(opts, stream):
+    """
+    Send the records in *stream* in batches of "--batch-size" records,
+    and print a summary to stderr.
+    """
+    defaults = dict(opts.keys or ())
+    cli = asl.aslclient(ident=None, facility="user", options=0)
+
+    # All records are sent, also those with a low level
+    cli.set_filter((1 << (asl.ASL_LEVEL_DEBUG + 1)) - 1)
+
+    sent = 0
+    invalid = 0
+    failed = False
+    start = time.monotonic()
+    batch = []
+    try:
+        for lineno, record in iter_stream_records(stream, opts.input_format):
+            if isinstance(record, ValueError):
+                print("line %d: %s" % (lineno, record), file=sys.stderr)
+                invalid += 1
+                continue
+
+            if defaults:
+                record = dict(defaults, **record)
+            batch.append(record)
+            if len(batch) >= opts.batch_size:
+                sent += cli.send_many(batch)
+                batch = []
+
+        if batch:
+            sent += cli.send_many(batch)
+
+    except OSError as exc:
+        sent += getattr(exc, "index", 0)
+        print("Sending failed:", exc, file=sys.stderr)
+        failed = True
+
+    except KeyboardInterrupt:
+        failed = True
+
+    finally:
+        cli.close()
+
+    elapsed = time.monotonic() - start
+    print(
+        "Sent %d messages in %.2f seconds (%.0f messages/second)"
+        % (sent, elapsed, sent / elapsed if elapsed > 0 else 0),
+        file=sys.stderr,
+    )
+    if invalid:
+        print("Skipped %d invalid records" % (invalid,), file=sys.stderr)
+
+    if failed or invalid:
+        sys.exit(1)
+
+
 OP_MAP = {
     "eq": asl.ASL_QUERY_OP_EQUAL,
     "ne": asl.ASL_QUERY_OP_NOT_EQUAL,
@@ -145,41 +459,497 @@ OP_MAP = {
 }
 
 
-def do_query(opts):
-    cli = asl.aslclient(ident=None, facility="user", options=0)
-    msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+def compile_format(fmt):
+    """
+    Compile format string *fmt* for formatting records.
+
+    Returns a format string that uses positional arguments instead
+    of the attribute names, and the list of attribute names used.
+    The formatted text for a record is ``template.format(*values)``,
+    where *values* are the values of those attributes with an empty
+    string for missing attributes.
+    """
+    fields = []
+
+    def convert(fmt):
+        parts = []
+        for literal, field_name, spec, conversion in string.Formatter().parse(fmt):
+            parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field_name is None:
+                continue
+
+            # Attribute and index references: "{Time.real}" and "{Time[0]}"
+            # refer to the "Time" attribute.
+            m = re.fullmatch(r"([^.\[]*)(.*)", field_name, re.DOTALL)
+            assert m is not None  # Both groups can be empty
+            name, rest = m.groups()
+            if name not in fields:
+                fields.append(name)
+
+            parts.append("{%d%s" % (fields.index(name), rest))
+            if conversion:
+                parts.append("!" + conversion)
+            if spec:
+                parts.append(":" + convert(spec))
+            parts.append("}")
+        return "".join(parts)
+
+    return convert(fmt), fields
+
+
+def text_renderer(columns):
+    """
+    Render records as "key value" lines followed by an empty line,
+    with the attributes in *columns* or all attributes in sorted order.
+    """
+    if columns is None:
+
+        def render(records):
+            return "".join(
+                "".join(["%s %s\n" % (key, record[key]) for key in sorted(record)])
+                + "\n"
+                for record in records
+            )
+
+    else:
+
+        def render(records):
+            return "".join(
+                "".join(
+                    ["%s %s\n" % (key, record[key]) for key in columns if key in record]
+                )
+                + "\n"
+                for record in records
+            )
+
+    return render
+
+
+def format_renderer(fmt):
+    """
+    Render records using format string *fmt*, one record per line
+    """
+    template, fields = compile_format(fmt)
+    format = template.format  # noqa: A001
+
+    def render(records):
+        return "".join(
+            [format(*[record.get(f, "") for f in fields]) + "\n" for record in records]
+        )
+
+    return render, fields
+
+
+def jsonl_renderer(columns):
+    """
+    Render records as JSON objects, one record per line
+    """
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    if columns is None:
+
+        def render(records):
+            return "".join([encode(record.asdict()) + "\n" for record in records])
+
+    else:
+
+        def render(records):
+            return "".join(
+                [
+                    encode({key: record[key] for key in columns if key in record})
+                    + "\n"
+                    for record in records
+                ]
+            )
+
+    return render
+
+
+def csv_renderer(columns, dialect):
+    """
+    Render records as rows of a CSV file with the given columns,
+    missing attributes are empty.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, dialect, lineterminator="\n")
+
+    def render(records):
+        writer.writerows(
+            [[record.get(key, "") for key in columns] for record in records]
+        )
+        result = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return result
+
+    header = render([{key: key for key in columns}])
+    return render, header
+
+
+class Output:
+    """
+    Writes text to the binary buffer of a stream, the text for
+    all records in a batch is encoded and written at once.
+    """
+
+    def __init__(self, stream, encoding=None):
+        stream.flush()
+        self._write = stream.buffer.write
+        self._flush = stream.buffer.flush
+        self._encoding = encoding or stream.encoding or "utf-8"
+        self._errors = "strict" if encoding else stream.errors or "strict"
+
+    def write(self, text):
+        if text:
+            self._write(text.encode(self._encoding, self._errors))
+
+    def flush(self):
+        self._flush()
+
+
+def iter_batches(response, limit=None, batch=FETCH_BATCH):
+    """
+    Yield the records of a search result as lists of at most *batch*
+    :class:`asl.Record` objects, stopping after *limit* records.
+    """
+    while limit is None or limit > 0:
+        count = batch if limit is None else min(batch, limit)
+        records = response.fetch_records(count)
+        if not records:
+            break
+        if limit is not None:
+            limit -= len(records)
+        yield records
+
+
+def build_query(opts):
+    """
+    Return the query for the "-C", "-k" and "-e" options
+    """
+    query = asl.Query()
     if opts.show_console:
-        msg.set_query(asl.ASL_KEY_FACILITY, "com.apple.console", asl.ASL_QUERY_OP_EQUAL)
+        query = asl.Field(asl.ASL_KEY_FACILITY) == "com.apple.console"
 
     # Other search parameters
-    if opts.query:
-        valid = True
-        for key, op, value in opts.query:
-            try:
-                msg.set_query(key, value, OP_MAP[op])
+    try:
+        if opts.query:
+            valid = True
+            for key, op, value in opts.query:
+                try:
+                    query = query.where(key, value, OP_MAP[op])
+
+                except KeyError:
+                    valid = False
+                    print("Invalid query operation:", op, file=sys.stderr)
+
+            if not valid:
+                sys.exit(1)
+
+        if opts.exists:
+            for key in opts.exists:
+                query = query & asl.Field(key).exists()
+
+    except ValueError as exc:
+        print("Invalid query:", exc, file=sys.stderr)
+        sys.exit(1)
+
+    return query
 
-            except KeyError:
-                valid = False
-                print("Invalid query operation:", op, file=sys.stderr)
 
-        if not valid:
+def do_query(opts):
+    cli = asl.aslclient(ident=None, facility="user", options=0)
+    query = build_query(opts)
+
+    if opts.follow:
+        if any(key == asl.ASL_KEY_MSG_ID for key, _, _ in query):
+            print(
+                "Cannot use --follow with a query on",
+                asl.ASL_KEY_MSG_ID,
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if opts.max_interval <= 0:
+            print("The maximum interval must be greater than 0", file=sys.stderr)
             sys.exit(1)
 
-    if opts.exists:
-        for key in opts.exists:
-            msg.set_query(key, "", asl.ASL_QUERY_OP_TRUE)
+    if opts.format is not None and (opts.output != "text" or opts.fields):
+        print("Cannot use -f with --output or --fields", file=sys.stderr)
+        sys.exit(1)
 
-    for record in cli.search(msg):
-        if opts.format is None:
-            for key in sorted(record.keys()):
-                print("{} {}".format(key, record[key]))
-            print()
+    # The columns and the attributes that are fetched are
+    # determined before searching.
+    columns = opts.fields
+    header = ""
+    encoding = None
+    if opts.format is not None:
+        # Only fetch the attributes used in the format string
+        render, fields = format_renderer(opts.format)
 
+    else:
+        if opts.output == "text":
+            render = text_renderer(columns)
+        elif opts.output == "jsonl":
+            render = jsonl_renderer(columns)
+            encoding = "utf-8"
+        else:
+            if columns is None:
+                columns = list(DEFAULT_COLUMNS)
+            render, header = csv_renderer(
+                columns, csv.excel if opts.output == "csv" else csv.excel_tab
+            )
+            encoding = "utf-8"
+        fields = None if columns is None else list(columns)
+
+    if opts.follow and fields is not None and asl.ASL_KEY_MSG_ID not in fields:
+        fields.append(asl.ASL_KEY_MSG_ID)
+
+    out = Output(sys.stdout, encoding)
+    out.write(header)
+
+    limit = opts.limit
+    try:
+        last, count = show_records(query.search(cli, fields), render, out, limit)
+        if opts.follow and (limit is None or count < limit):
+            if limit is not None:
+                limit -= count
+            follow(cli, query, fields, render, out, last, limit, opts.max_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        out.flush()
+
+
+def show_records(response, render, out, limit=None):
+    """
+    Write the records in *response* to *out*, stopping after *limit*
+    records. Returns the highest message ID of those records (or 0
+    when there are none) and the number of records.
+    """
+    last = 0
+    count = 0
+    for records in iter_batches(response, limit):
+        out.write(render(records))
+        count += len(records)
+        last = max(
+            last, max(int(record.get(asl.ASL_KEY_MSG_ID, 0)) for record in records)
+        )
+    return last, count
+
+
+def follow_query(query, last):
+    """
+    Return the query message for records matching *query* with
+    a message ID greater than *last*.
+    """
+    # The query is not compiled using Query.compile() because that
+    # would add a query for every search to its cache.
+    msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+    for key, value, op in query:
+        msg.set_query(key, value, op)
+    msg.set_query(
+        asl.ASL_KEY_MSG_ID,
+        str(last),
+        asl.ASL_QUERY_OP_GREATER | asl.ASL_QUERY_OP_NUMERIC,
+    )
+    return msg
+
+
+def follow(cli, query, fields, render, out, last, limit, max_interval):
+    """
+    Write records logged after message ID *last* to *out*, until
+    interrupted or until *limit* records have been written.
+
+    Searches only look for records with a higher message ID than
+    the last record shown. The interval between searches starts
+    at FOLLOW_MIN_INTERVAL and is doubled after every search that
+    does not find records, up to *max_interval*.
+    """
+    interval = min(FOLLOW_MIN_INTERVAL, max_interval)
+    while limit is None or limit > 0:
+        out.flush()
+        time.sleep(interval)
+
+        newest, count = show_records(
+            cli.search(follow_query(query, last), fields), render, out, limit
+        )
+        if limit is not None:
+            limit -= count
+        if newest > last:
+            last = newest
+            interval = min(FOLLOW_MIN_INTERVAL, max_interval)
         else:
-            fmt_arg: collections.defaultdict = collections.defaultdict(str)
-            fmt_arg.update({k: record[k] for k in record.keys()})
+            interval = min(interval * 2, max_interval)
+
+
+class TopCounter:
+    """
+    Approximate counts of the most frequent keys, using at most
+    *capacity* counters (the "Space-Saving" algorithm).
+
+    When a key is counted while all counters are in use, the counter
+    of the key with the lowest count is reused for the new key and
+    is incremented. Counts are therefore never too low, and are at
+    most :attr:`max_error` too high. Every key that is counted more
+    often than the total count divided by *capacity* has a counter.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.max_error = 0
+
+        # A heap with an item for every key, the count in
+        # a heap item can be lower than the actual count.
+        self._heap = []
+        self._seq = itertools.count()
+
+    def update(self, keys):
+        counts = self.counts
+        for key in keys:
+            if key in counts:
+                counts[key] += 1
+            elif len(counts) < self.capacity:
+                counts[key] = 1
+                heapq.heappush(self._heap, (1, next(self._seq), key))
+            else:
+                self._replace(key)
+
+    def _replace(self, key):
+        heap = self._heap
+        counts = self.counts
+        while True:
+            count, _, lowest = heap[0]
+            current = counts[lowest]
+            if current == count:
+                break
+            heapq.heapreplace(heap, (current, next(self._seq), lowest))
+
+        del counts[lowest]
+        counts[key] = count + 1
+        heapq.heapreplace(heap, (count + 1, next(self._seq), key))
+        self.max_error = max(self.max_error, count)
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self.counts.items(), key=operator.itemgetter(1))
+
+
+def iter_groups(response, interval):
+    """
+    Yield the group of every row in *response*: the tuple of values
+    of the fields of the search. With *interval* the last field is
+    the Time, which is replaced by the start of its interval.
+    """
+    while True:
+        rows = response.fetch(FETCH_BATCH)
+        if not rows:
+            break
+
+        if interval is None:
+            yield from rows
+            continue
+
+        buckets: typing.Dict[typing.Any, typing.Optional[int]] = {}
+        for row in rows:
+            value = row[-1]
+            try:
+                bucket = buckets[value]
+            except KeyError:
+                try:
+                    bucket = int(value) // interval * interval
+                except (TypeError, ValueError):
+                    bucket = None
+                bucket = buckets[value] = bucket
+            yield row[:-1] + (bucket,)
+
+
+def stats_sort_key(item):
+    # Groups can contain None for missing attributes
+    return tuple((value is not None, value) for value in item[0])
+
+
+def stats_text(columns, rows):
+    """
+    Render rows as a table with aligned columns, the start of
+    a Time interval is shown as a local time.
+    """
+
+    def text(column, value):
+        if value is None:
+            return ""
+        if column == asl.ASL_KEY_TIME and isinstance(value, int):
+            # The start of an interval, with "--by Time" the value
+            # is the attribute value.
+            return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+        return str(value)
+
+    table = [columns]
+    for row in rows:
+        table.append([text(column, row.get(column)) for column in columns])
+
+    widths = [max(len(line[i]) for line in table) for i in range(len(columns))]
+    return "".join(
+        "  ".join(value.ljust(width) for value, width in zip(line, widths)).rstrip()
+        + "\n"
+        for line in table
+    )
+
+
+def do_stats(opts):
+    cli = asl.aslclient(ident=None, facility="user", options=0)
+    query = build_query(opts)
 
-            print(opts.format.format_map(fmt_arg))
+    if opts.interval is not None and asl.ASL_KEY_TIME in opts.by:
+        print("Cannot use --interval with --by", asl.ASL_KEY_TIME, file=sys.stderr)
+        sys.exit(1)
+    if opts.top is not None and opts.max_groups < opts.top:
+        print("The maximum number of groups is less than --top", file=sys.stderr)
+        sys.exit(1)
+
+    # Only the attributes used for grouping are fetched, without
+    # converting rows to records.
+    group_by = list(opts.by)
+    if opts.interval is not None:
+        group_by.append(asl.ASL_KEY_TIME)
+    fields = group_by or [asl.ASL_KEY_MSG_ID]
+
+    groups = iter_groups(query.search(cli, fields), opts.interval)
+    if not group_by:
+        groups = (() for _ in groups)
+
+    if opts.top is None:
+        counter: typing.Counter[typing.Tuple] = collections.Counter()
+        counter.update(groups)
+        items = sorted(counter.items(), key=stats_sort_key)
+    else:
+        top = TopCounter(opts.max_groups)
+        top.update(groups)
+        items = top.most_common(opts.top)
+        if top.max_error:
+            print(
+                "Counts are approximate, and can be up to %d too high"
+                % (top.max_error,),
+                file=sys.stderr,
+            )
+
+    columns = group_by + [STATS_COUNT]
+    rows = []
+    for group, count in items:
+        row = dict(zip(group_by, group))
+        row[STATS_COUNT] = count
+        rows.append(row)
+
+    out = Output(sys.stdout, None if opts.output == "text" else "utf-8")
+    if opts.output == "text":
+        out.write(stats_text(columns, rows))
+    elif opts.output == "jsonl":
+        out.write(jsonl_renderer(columns)(rows))
+    else:
+        render, header = csv_renderer(
+            columns, csv.excel if opts.output == "csv" else csv.excel_tab
+        )
+        out.write(header)
+        out.write(render(rows))
+    out.flush()
 
 
 def main():
@@ -193,6 +963,9 @@ def main():
     elif opts.action == "query":
         do_query(opts)
 
+    elif opts.action == "stats":
+        do_stats(opts)
+
     else:
         raise NotImplementedError("Action: %s" % (opts.action,))
 
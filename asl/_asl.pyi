@@ -1,19 +1,49 @@
+import array
 import typing
 
 import typing_extensions
 
+from ._record import Record
+
+_ColumnTypes = typing.Dict[str, typing.Optional[typing_extensions.Literal["q", "d"]]]
+_Columns = typing.Dict[
+    str, typing.Union[typing.List[typing.Optional[str]], array.array]
+]
+
 class aslmsg:
-    def __new__(self, type: int) -> "aslmsg": ...
+    def __new__(
+        self,
+        type: int,
+        mapping: typing.Union[
+            None,
+            "aslmsg",
+            typing.Mapping[str, str],
+            typing.Iterable[typing.Tuple[str, str]],
+        ] = None,
+    ) -> "aslmsg": ...
+    def update(
+        self,
+        mapping: typing.Union[
+            "aslmsg", typing.Mapping[str, str], typing.Iterable[typing.Tuple[str, str]]
+        ] = ...,
+        **kwds: str,
+    ) -> None: ...
+    def copy(self) -> "aslmsg": ...
     def keys(self) -> typing.Iterable[str]: ...
     def asdict(self) -> typing.Dict[str, str]: ...
     def set_query(self, key: str, value: str, operation: int) -> None: ...
+    def query_items(self) -> typing.List[typing.Tuple[str, str, int]]: ...
     def __getitem__(self, key: str) -> str: ...
     def __setitem__(self, key: str, value: str) -> None: ...
     def __delitem__(self, key: str) -> None: ...
 
 class aslresponse:
+    fields: typing.Optional[typing.Tuple[str, ...]]
     def __iter__(self) -> "aslresponse": ...
-    def __next__(self) -> aslmsg: ...
+    def __next__(self) -> typing.Any: ...
+    def fetch(self, n: int = -1) -> typing.List[typing.Any]: ...
+    def fetch_dicts(self, n: int = -1) -> typing.List[typing.Dict[str, str]]: ...
+    def fetch_records(self, n: int = -1) -> typing.List[Record]: ...
 
 class aslclient:
     def __new__(
@@ -22,9 +52,37 @@ class aslclient:
     def add_log_file(self, fd: int): ...
     def remove_log_file(self, fd: int): ...
     def set_filter(self, filter: int): ...
-    def log(self, msg: typing.Optional[aslmsg], level: int, text: str): ...
+    def is_enabled(self, level: int) -> bool: ...
+    def log(
+        self, msg: typing.Optional[aslmsg], level: int, text: str, *args: typing.Any
+    ): ...
     def send(self, msg: typing.Optional[aslmsg]): ...
-    def search(self, msg: typing.Optional[aslmsg]): ...
+    def send_many(
+        self,
+        messages: typing.Iterable[typing.Union[aslmsg, typing.Dict[str, str]]],
+        release_gil: bool = True,
+    ) -> int: ...
+    def search(
+        self, msg: aslmsg, fields: typing.Optional[typing.Iterable[str]] = None
+    ) -> aslresponse: ...
+    @typing.overload
+    def search_columns(
+        self,
+        msg: aslmsg,
+        fields: typing.Iterable[str],
+        types: typing.Optional[_ColumnTypes] = None,
+        *,
+        masks: typing_extensions.Literal[False] = False,
+    ) -> _Columns: ...
+    @typing.overload
+    def search_columns(
+        self,
+        msg: aslmsg,
+        fields: typing.Iterable[str],
+        types: typing.Optional[_ColumnTypes] = None,
+        *,
+        masks: typing_extensions.Literal[True],
+    ) -> typing.Tuple[_Columns, typing.Dict[str, array.array]]: ...
     def log_descriptor(
         self, msg: typing.Optional[aslmsg], level: int, fd: int, fd_type: int
     ): ...
@@ -43,3 +101,13 @@ def close_auxiliary_file(fd: int) -> None: ...
 def open_from_file(
     fd: int, ident: typing.Optional[str], facility: str
 ) -> aslclient: ...
+
+class _ValueCacheInfo(typing.NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+def set_value_cache(maxsize: int) -> None: ...
+def value_cache_info() -> _ValueCacheInfo: ...
+def value_cache_clear() -> None: ...
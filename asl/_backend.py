@@ -0,0 +1,78 @@
+"""
+Selection of the implementation of the core API
+
+The C extension (_asl) is used when it is available. The portable
+implementation in _pyasl is used on platforms without the ASL library,
+or when the environment variable ASL_BACKEND is set to "python".
+"""
+import os
+import typing
+
+if typing.TYPE_CHECKING:
+    # Both implementations provide the API described in _asl.pyi
+    from ._asl import (  # noqa: F401
+        aslclient,
+        aslmsg,
+        aslresponse,
+        close_auxiliary_file,
+        create_auxiliary_file,
+        log_auxiliary_location,
+        open_from_file,
+        set_value_cache,
+        value_cache_clear,
+        value_cache_info,
+    )
+
+    BACKEND: str
+
+    __all__ = [
+        "aslmsg",
+        "aslresponse",
+        "aslclient",
+        "open_from_file",
+        "create_auxiliary_file",
+        "log_auxiliary_location",
+        "close_auxiliary_file",
+        "set_value_cache",
+        "value_cache_info",
+        "value_cache_clear",
+        "BACKEND",
+    ]
+
+elif os.environ.get("ASL_BACKEND") == "python":
+    from ._pyasl import *  # noqa: F401, F403
+
+    BACKEND = "python"
+
+else:
+    try:
+        from ._asl import *  # noqa: F401, F403
+
+    except ImportError:
+        from ._pyasl import *  # noqa: F401, F403
+
+        BACKEND = "python"
+
+    else:
+        BACKEND = "libasl"
+
+if not typing.TYPE_CHECKING:
+    # Not all functions are available with older versions of the
+    # ASL library.
+    __all__ = [
+        name
+        for name in (
+            "aslmsg",
+            "aslresponse",
+            "aslclient",
+            "open_from_file",
+            "create_auxiliary_file",
+            "log_auxiliary_location",
+            "close_auxiliary_file",
+            "set_value_cache",
+            "value_cache_info",
+            "value_cache_clear",
+            "BACKEND",
+        )
+        if name in globals()
+    ]
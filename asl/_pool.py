@@ -0,0 +1,275 @@
+"""
+Pool of clients
+
+An :class:`aslclient` serializes calls from multiple threads on a
+lock. A :class:`ClientPool` gives every thread, or asyncio task, its
+own client instead.
+"""
+import collections
+import sys
+import threading
+import time
+import typing
+import weakref
+
+from ._backend import aslclient
+
+__all__ = ("ClientPool",)
+
+PoolInfo = collections.namedtuple(
+    "PoolInfo", ("opens", "reuses", "closes", "live"), module="asl"
+)
+
+
+# Interval for closing clients of threads and tasks that have
+# exited when there is no idle timeout.
+REAP_INTERVAL = 30.0
+
+
+class _Entry:
+    __slots__ = ("client", "owner", "last_used", "reuses", "closed")
+
+    def __init__(self, client: aslclient, owner: typing.Any, last_used: float):
+        self.client = client
+        self.owner = weakref.ref(owner)
+        self.last_used = last_used
+        self.reuses = 0
+        self.closed = False
+
+    def owner_alive(self) -> bool:
+        owner = self.owner()
+        if owner is None:
+            return False
+        if isinstance(owner, threading.Thread):
+            return owner.is_alive()
+        return not owner.done()
+
+
+def _current_task() -> typing.Any:
+    """
+    Return the current asyncio task, or None when not running in a task
+    """
+    # Avoid importing asyncio in programs that don't use it
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return None
+
+    get_running_loop = getattr(asyncio, "get_running_loop", None)
+    if get_running_loop is None:
+        # Python 3.6, returns None when no task is running and raises
+        # RuntimeError in threads without an event loop.
+        try:
+            return asyncio.Task.current_task()
+        except RuntimeError:
+            return None
+
+    try:
+        get_running_loop()
+    except RuntimeError:
+        return None
+    return asyncio.current_task()
+
+
+class ClientPool:
+    """
+    A pool of clients with the same *ident*, *facility* and *options*,
+    with a separate client for every thread or asyncio task.
+
+    Clients are opened when they are first used, and closed when they
+    have not been used for *idle_timeout* seconds or when the thread or
+    task has exited. There is no background thread, idle clients are
+    only closed when the pool is used again or by :meth:`close_idle`.
+    """
+
+    def __init__(
+        self,
+        ident: typing.Optional[str] = None,
+        facility: str = "user",
+        options: int = 0,
+        *,
+        idle_timeout: typing.Optional[float] = 60.0,
+    ):
+        if idle_timeout is not None and idle_timeout <= 0:
+            raise ValueError("idle_timeout must be greater than 0")
+
+        self._args = (ident, facility, options)
+        self.idle_timeout = idle_timeout
+        self._filter: typing.Optional[int] = None
+
+        # The entries for threads are stored in a thread local, all
+        # entries are stored in '_entries'.
+        self._local = threading.local()
+        self._tasks: "weakref.WeakKeyDictionary[typing.Any, _Entry]"
+        self._tasks = weakref.WeakKeyDictionary()
+        self._entries: typing.Set[_Entry] = set()
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._next_reap = time.monotonic() + self._reap_interval()
+        self._opens = 0
+        self._reuses = 0
+        self._closes = 0
+
+    def _reap_interval(self) -> float:
+        if self.idle_timeout is None:
+            return REAP_INTERVAL
+        return min(self.idle_timeout / 2, REAP_INTERVAL)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def client(self) -> aslclient:
+        """
+        Return the client for the current thread or asyncio task.
+
+        The client should not be used after an idle period, call
+        this method again instead of keeping a reference.
+        """
+        now = time.monotonic()
+        task = _current_task()
+        if task is None:
+            entry = getattr(self._local, "entry", None)
+        else:
+            entry = self._tasks.get(task)
+
+        if entry is not None:
+            with self._lock:
+                # _reap() retires entries with the lock held, updating
+                # last_used here keeps it from retiring an entry that
+                # is about to be reused.
+                if entry.closed:
+                    entry = None
+                else:
+                    entry.last_used = now
+                    entry.reuses += 1
+
+        if entry is None:
+            entry = self._open(task, now)
+
+        if now >= self._next_reap:
+            self._reap(now)
+        return entry.client
+
+    def _open(self, task: typing.Any, now: float) -> _Entry:
+        if self._closed:
+            raise ValueError("Pool is closed")
+
+        cli = aslclient(*self._args)
+        owner = task if task is not None else threading.current_thread()
+        entry = _Entry(cli, owner, now)
+        with self._lock:
+            if self._closed:
+                cli.close()
+                raise ValueError("Pool is closed")
+            if self._filter is not None:
+                cli.set_filter(self._filter)
+            self._entries.add(entry)
+            self._opens += 1
+
+        if task is None:
+            self._local.entry = entry
+        else:
+            self._tasks[task] = entry
+        return entry
+
+    def _retire(self, entries: typing.Iterable[_Entry]) -> None:
+        # Called with the lock held
+        for entry in entries:
+            entry.closed = True
+            self._entries.discard(entry)
+            self._reuses += entry.reuses
+            self._closes += 1
+
+    def _reap(self, now: float) -> None:
+        with self._lock:
+            if now < self._next_reap:
+                return
+            self._next_reap = now + self._reap_interval()
+
+            timeout = self.idle_timeout
+            idle = [
+                entry
+                for entry in self._entries
+                if (timeout is not None and now - entry.last_used >= timeout)
+                or not entry.owner_alive()
+            ]
+            self._retire(idle)
+
+        for entry in idle:
+            entry.client.close()
+
+    def close_idle(self) -> int:
+        """
+        Close clients that have been idle for more than the idle
+        timeout, and clients of threads and tasks that have exited.
+        Returns the number of closed clients.
+        """
+        with self._lock:
+            closes = self._closes
+            self._next_reap = 0
+        self._reap(time.monotonic())
+        return self._closes - closes
+
+    def set_filter(self, filter: int) -> None:  # noqa: A002
+        """
+        Set the filter mask of all clients, including clients
+        that are opened later.
+        """
+        if not isinstance(filter, int):
+            raise TypeError(
+                "Expecting an integer, got instance of '%s'" % (type(filter).__name__,)
+            )
+        with self._lock:
+            if self._closed:
+                raise ValueError("Pool is closed")
+            self._filter = filter
+            for entry in list(self._entries):
+                entry.client.set_filter(filter)
+
+    def is_enabled(self, level: int) -> bool:
+        return self.client().is_enabled(level)
+
+    def log(self, msg: typing.Any, level: int, text: str, *args: typing.Any) -> None:
+        """
+        Shorthand for ``pool.client().log(msg, level, text, *args)``
+        """
+        self.client().log(msg, level, text, *args)
+
+    def send(self, msg: typing.Any) -> None:
+        """
+        Shorthand for ``pool.client().send(msg)``
+        """
+        self.client().send(msg)
+
+    def info(self) -> PoolInfo:
+        """
+        Statistics for the pool: the number of opened clients, the
+        number of times an open client was reused, the number of
+        clients closed by the pool and the number of open clients.
+        """
+        with self._lock:
+            return PoolInfo(
+                self._opens,
+                self._reuses + sum(entry.reuses for entry in self._entries),
+                self._closes,
+                len(self._entries),
+            )
+
+    def close(self) -> None:
+        """
+        Close all clients
+        """
+        with self._lock:
+            self._closed = True
+            entries = list(self._entries)
+            self._retire(entries)
+
+        for entry in entries:
+            entry.client.close()
+
+    def __enter__(self) -> "ClientPool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        self.close()
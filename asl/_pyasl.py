@@ -0,0 +1,993 @@
+"""
+Portable implementation of the _asl extension
+
+This module implements the API of the _asl extension (see _asl.pyi)
+in Python, for platforms without the ASL library. Messages are kept
+in an in-process store that can be searched, with the same filter and
+query semantics as the ASL library.
+
+By default the store is kept in memory and contains the last
+ASL_PYTHON_MAX_RECORDS messages (default: 100000). When the environment
+variable ASL_PYTHON_STORE is set it is the path of a file where messages
+are appended as JSON lines, this file can be shared between processes.
+"""
+import array
+import base64
+import collections
+import errno
+import itertools
+import json
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+import typing
+
+from ._constants import (
+    ASL_KEY_AUX_DATA,
+    ASL_KEY_AUX_TITLE,
+    ASL_KEY_AUX_URL,
+    ASL_KEY_AUX_UTI,
+    ASL_KEY_FACILITY,
+    ASL_KEY_GID,
+    ASL_KEY_HOST,
+    ASL_KEY_LEVEL,
+    ASL_KEY_MSG,
+    ASL_KEY_MSG_ID,
+    ASL_KEY_PID,
+    ASL_KEY_READ_GID,
+    ASL_KEY_READ_UID,
+    ASL_KEY_REF_PID,
+    ASL_KEY_SENDER,
+    ASL_KEY_TIME,
+    ASL_KEY_TIME_NSEC,
+    ASL_KEY_UID,
+    ASL_LEVEL_DEBUG,
+    ASL_LEVEL_NOTICE,
+    ASL_LOG_DESCRIPTOR_READ,
+    ASL_LOG_DESCRIPTOR_WRITE,
+    ASL_OPT_STDERR,
+    ASL_QUERY_OP_EQUAL,
+    ASL_STRING_ALERT,
+    ASL_STRING_CRIT,
+    ASL_STRING_DEBUG,
+    ASL_STRING_EMERG,
+    ASL_STRING_ERR,
+    ASL_STRING_INFO,
+    ASL_STRING_NOTICE,
+    ASL_STRING_WARNING,
+    ASL_TYPE_MSG,
+    ASL_TYPE_QUERY,
+)
+from ._record import _from_fetch
+
+__all__ = (
+    "aslmsg",
+    "aslresponse",
+    "aslclient",
+    "open_from_file",
+    "create_auxiliary_file",
+    "log_auxiliary_location",
+    "close_auxiliary_file",
+    "set_value_cache",
+    "value_cache_info",
+    "value_cache_clear",
+)
+
+Record = typing.Dict[str, str]
+
+_LEVEL_NAMES = [
+    ASL_STRING_EMERG,
+    ASL_STRING_ALERT,
+    ASL_STRING_CRIT,
+    ASL_STRING_ERR,
+    ASL_STRING_WARNING,
+    ASL_STRING_NOTICE,
+    ASL_STRING_INFO,
+    ASL_STRING_DEBUG,
+]
+
+# The default filter of a client: messages up to ASL_LEVEL_NOTICE
+_DEFAULT_FILTER = (1 << (ASL_LEVEL_NOTICE + 1)) - 1
+
+# Attributes that are numeric columns in search_columns() by default
+_NUMERIC_KEYS = frozenset(
+    [
+        ASL_KEY_TIME,
+        ASL_KEY_TIME_NSEC,
+        ASL_KEY_PID,
+        ASL_KEY_UID,
+        ASL_KEY_GID,
+        ASL_KEY_LEVEL,
+        ASL_KEY_READ_UID,
+        ASL_KEY_READ_GID,
+        ASL_KEY_MSG_ID,
+        ASL_KEY_REF_PID,
+    ]
+)
+
+# Attributes whose values are (nearly) unique for every message,
+# these bypass the value cache
+_UNSHARED_KEYS = frozenset(
+    [ASL_KEY_MSG, ASL_KEY_TIME, ASL_KEY_TIME_NSEC, ASL_KEY_MSG_ID]
+)
+
+_LEADING_INT = re.compile(r"\s*[-+]?[0-9]+")
+
+# Values in integer columns of search_columns(), like strtoll(3)
+_INT = re.compile(r"\s*[-+]?[0-9]+\Z")
+_INT_MIN = -(2 ** 63)
+_INT_MAX = 2 ** 63 - 1
+
+
+def _check_str(value: typing.Any, allow_none: bool = False) -> None:
+    if isinstance(value, str) or (allow_none and value is None):
+        return
+    raise TypeError(
+        "Expecting a string, got instance of '%s'" % (type(value).__name__,)
+    )
+
+
+def _check_int(value: typing.Any) -> None:
+    if not isinstance(value, int):
+        raise TypeError(
+            "an integer is required (got type %s)" % (type(value).__name__,)
+        )
+
+
+def _check_message(value: typing.Any, allow_none: bool = False) -> None:
+    if isinstance(value, aslmsg) or (allow_none and value is None):
+        return
+    raise TypeError(
+        "Expected aslmsg instance%s, got instance of '%s'"
+        % (" or None" if allow_none else "", type(value).__name__)
+    )
+
+
+def _level_of(value: typing.Optional[str]) -> int:
+    if value is None:
+        return ASL_LEVEL_NOTICE
+    if value in _LEVEL_NAMES:
+        return _LEVEL_NAMES.index(value)
+    m = _LEADING_INT.match(value)
+    return int(m.group(0)) if m is not None else 0
+
+
+#
+# Cache of attribute values
+#
+
+ValueCacheInfo = collections.namedtuple(
+    "ValueCacheInfo", "hits misses maxsize currsize", module="asl"
+)
+
+
+class _ValueCache:
+    """
+    LRU cache of attribute values, used to share str objects
+    for values that occur in a lot of messages.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, value: str) -> str:
+        if key in _UNSHARED_KEYS:
+            return value
+
+        with self._lock:
+            try:
+                result = self._values[value]
+            except KeyError:
+                self.misses += 1
+                self._values[value] = value
+                if len(self._values) > self.maxsize:
+                    self._values.popitem(last=False)
+                return value
+
+            self.hits += 1
+            self._values.move_to_end(value)
+            return result
+
+    def record(self, record: Record) -> Record:
+        """
+        Return a copy of *record* using cached values
+        """
+        if not self.maxsize:
+            return dict(record)
+        get = self.get
+        return {k: get(k, v) for k, v in record.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self.hits = self.misses = 0
+
+
+_value_cache = _ValueCache(0)
+
+
+def set_value_cache(maxsize: int) -> None:
+    global _value_cache
+
+    _check_int(maxsize)
+    if maxsize < 0:
+        raise ValueError("maxsize must not be negative")
+    _value_cache = _ValueCache(maxsize)
+
+
+def value_cache_info() -> ValueCacheInfo:
+    cache = _value_cache
+    return ValueCacheInfo(cache.hits, cache.misses, cache.maxsize, len(cache._values))
+
+
+def value_cache_clear() -> None:
+    _value_cache.clear()
+
+
+#
+# Messages
+#
+
+
+class aslmsg:
+    """
+    ASL message or query
+    """
+
+    __slots__ = ("_type", "_values", "_ops", "__weakref__")
+
+    def __init__(self, type: int, mapping: typing.Any = None):  # noqa: A002
+        _check_int(type)
+        if type not in (ASL_TYPE_MSG, ASL_TYPE_QUERY):
+            raise ValueError("Invalid message type")
+
+        self._type = type
+        self._values: Record = {}
+        self._ops: typing.Dict[str, int] = {}
+
+        if mapping is not None:
+            self._update_from(mapping)
+
+    def _update_from(self, mapping: typing.Any) -> None:
+        if isinstance(mapping, aslmsg):
+            self._values.update(mapping._values)
+            if self._type == ASL_TYPE_QUERY:
+                self._ops.update(mapping._ops)
+            else:
+                self._ops.update(dict.fromkeys(mapping._values, ASL_QUERY_OP_EQUAL))
+            return
+
+        if hasattr(mapping, "keys"):
+            items = [(k, mapping[k]) for k in mapping.keys()]
+        else:
+            try:
+                items = list(mapping)
+            except TypeError:
+                raise TypeError(
+                    "Expecting a mapping or iterable, got instance of '%s'"
+                    % (type(mapping).__name__,)
+                ) from None
+
+        for item in items:
+            if not isinstance(item, tuple) or len(item) != 2:
+                raise TypeError("Expecting a sequence of (key, value) tuples")
+            self[item[0]] = item[1]
+
+    def update(self, *args: typing.Any, **kwds: str) -> None:
+        if len(args) > 1:
+            raise TypeError("update expected at most 1 argument, got %d" % (len(args),))
+        if args:
+            self._update_from(args[0])
+        if kwds:
+            self._update_from(kwds)
+
+    def copy(self) -> "aslmsg":
+        result = aslmsg(self._type)
+        result._values = dict(self._values)
+        result._ops = dict(self._ops)
+        return result
+
+    def keys(self) -> typing.Set[str]:
+        return set(self._values)
+
+    def asdict(self) -> Record:
+        return _value_cache.record(self._values)
+
+    def set_query(self, key: str, value: str, operation: int) -> None:
+        _check_str(key)
+        _check_str(value)
+        _check_int(operation)
+        self._values[key] = value
+        self._ops[key] = operation
+
+    def query_items(self) -> typing.List[typing.Tuple[str, str, int]]:
+        return [(k, v, self._ops[k]) for k, v in self._values.items()]
+
+    def __getitem__(self, key: str) -> str:
+        _check_str(key)
+        value = self._values[key]
+        if _value_cache.maxsize:
+            return _value_cache.get(key, value)
+        return value
+
+    def __setitem__(self, key: str, value: str) -> None:
+        _check_str(key)
+        _check_str(value)
+        self._values[key] = value
+        self._ops[key] = ASL_QUERY_OP_EQUAL
+
+    def __delitem__(self, key: str) -> None:
+        _check_str(key)
+        self._values.pop(key, None)
+        self._ops.pop(key, None)
+
+
+def _message_from(values: Record) -> aslmsg:
+    msg = aslmsg(ASL_TYPE_MSG)
+    msg._values = dict(values)
+    msg._ops = dict.fromkeys(values, ASL_QUERY_OP_EQUAL)
+    return msg
+
+
+#
+# Search results
+#
+
+
+class aslresponse:
+    """
+    The result of aslclient.search
+    """
+
+    __slots__ = ("fields", "_records")
+
+    fields: typing.Optional[typing.Tuple[str, ...]]
+
+    def __init__(
+        self,
+        records: typing.Iterable[Record],
+        fields: typing.Optional[typing.Tuple[str, ...]] = None,
+    ):
+        self._records = iter(records)
+        self.fields = fields
+
+    def __iter__(self) -> "aslresponse":
+        return self
+
+    def __next__(self) -> typing.Any:
+        record = next(self._records)
+        if self.fields is not None:
+            return _row(record, self.fields)
+        return _message_from(record)
+
+    def _take(self, n: int) -> typing.List[Record]:
+        if n < 0:
+            return list(self._records)
+        return list(itertools.islice(self._records, n))
+
+    def fetch(self, n: int = -1) -> typing.List[typing.Any]:
+        _check_int(n)
+        records = self._take(n)
+        if self.fields is not None:
+            fields = self.fields
+            return [_row(r, fields) for r in records]
+
+        result = []
+        keys: typing.Tuple[str, ...] = ()
+        for record in records:
+            if tuple(record) != keys:
+                keys = tuple(record)
+            result.append((keys, tuple(_value_cache.record(record).values())))
+        return result
+
+    def fetch_dicts(self, n: int = -1) -> typing.List[Record]:
+        _check_int(n)
+        records = self._take(n)
+        if self.fields is not None:
+            fields = self.fields
+            return [
+                _value_cache.record({k: r[k] for k in fields if k in r})
+                for r in records
+            ]
+        return [_value_cache.record(r) for r in records]
+
+    def fetch_records(self, n: int = -1) -> typing.List[typing.Any]:
+        return _from_fetch(self.fields, self.fetch(n))
+
+
+def _row(record: Record, fields: typing.Tuple[str, ...]) -> typing.Tuple:
+    if not _value_cache.maxsize:
+        return tuple(record.get(k) for k in fields)
+
+    get = _value_cache.get
+    return tuple(None if k not in record else get(k, record[k]) for k in fields)
+
+
+#
+# Message stores
+#
+
+
+class _MemoryStore:
+    """
+    Bounded in-memory message store
+    """
+
+    def __init__(self, maxlen: int):
+        self._lock = threading.Lock()
+        self._records: typing.Deque[Record] = collections.deque(maxlen=maxlen)
+        self._next_id = 1
+
+    def append(self, records: typing.List[Record]) -> None:
+        with self._lock:
+            for record in records:
+                record[ASL_KEY_MSG_ID] = str(self._next_id)
+                self._next_id += 1
+            self._records.extend(records)
+
+    def records(self) -> typing.List[Record]:
+        with self._lock:
+            return list(self._records)
+
+
+class _FileStore:
+    """
+    Message store in a file with a JSON object per line. The file
+    can be appended to by other processes, writers use flock(2) to
+    assign unique message IDs.
+    """
+
+    def __init__(self, fd: int):
+        self._fd = fd
+        self._lock = threading.Lock()
+        self._records: typing.List[Record] = []
+        self._offset = 0
+        self._partial = b""
+
+    def _catch_up(self) -> None:
+        while True:
+            data = os.pread(self._fd, 1 << 16, self._offset)
+            if not data:
+                break
+            self._offset += len(data)
+            lines = (self._partial + data).split(b"\n")
+            self._partial = lines.pop()
+            for line in lines:
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    # Ignore lines that aren't valid records
+                    continue
+                if isinstance(record, dict):
+                    self._records.append(record)
+
+    def append(self, records: typing.List[Record]) -> None:
+        import fcntl
+
+        with self._lock:
+            # The file lock keeps other processes from appending between
+            # reading the last message ID and writing the new records.
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._catch_up()
+                next_id = len(self._records) + 1
+                for record in records:
+                    record[ASL_KEY_MSG_ID] = str(next_id)
+                    next_id += 1
+
+                data = "".join(
+                    json.dumps(record, separators=(",", ":")) + "\n"
+                    for record in records
+                ).encode("utf-8")
+
+                # Always append, also when the descriptor was not opened
+                # with O_APPEND.
+                offset = os.lseek(self._fd, 0, os.SEEK_END)
+                written = 0
+                while written < len(data):
+                    written += os.pwrite(self._fd, data[written:], offset + written)
+
+                self._catch_up()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def records(self) -> typing.List[Record]:
+        with self._lock:
+            self._catch_up()
+            return list(self._records)
+
+
+_store_lock = threading.Lock()
+_store: typing.Optional[typing.Union[_MemoryStore, _FileStore]] = None
+
+
+def _default_store() -> typing.Union[_MemoryStore, _FileStore]:
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            path = os.environ.get("ASL_PYTHON_STORE")
+            if path:
+                fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+                _store = _FileStore(fd)
+            else:
+                maxlen = int(os.environ.get("ASL_PYTHON_MAX_RECORDS", "100000"))
+                _store = _MemoryStore(maxlen)
+        return _store
+
+
+def _readable(record: Record, uid: int, groups: typing.Container[int]) -> bool:
+    """
+    Check the read access restrictions of a record
+    """
+    read_uid = record.get(ASL_KEY_READ_UID)
+    read_gid = record.get(ASL_KEY_READ_GID)
+    if uid == 0 or (read_uid is None and read_gid is None):
+        return True
+    if read_uid is not None and read_uid == str(uid):
+        return True
+    if read_gid is not None and read_gid.isdigit() and int(read_gid) in groups:
+        return True
+    return False
+
+
+def _format_line(record: Record) -> str:
+    """
+    Format a message like the "std" format of the ASL library
+    """
+    try:
+        timestamp = int(record.get(ASL_KEY_TIME, "0"))
+    except ValueError:
+        timestamp = 0
+
+    level = _level_of(record.get(ASL_KEY_LEVEL))
+    return "%s %s %s[%s] <%s>: %s\n" % (
+        time.strftime("%b %d %H:%M:%S", time.localtime(timestamp)),
+        record.get(ASL_KEY_HOST, ""),
+        record.get(ASL_KEY_SENDER, ""),
+        record.get(ASL_KEY_PID, ""),
+        _LEVEL_NAMES[level] if 0 <= level <= ASL_LEVEL_DEBUG else level,
+        record.get(ASL_KEY_MSG, ""),
+    )
+
+
+def _default_ident() -> str:
+    if sys.argv and sys.argv[0]:
+        return os.path.basename(sys.argv[0])
+    return "python"
+
+
+#
+# Client
+#
+
+
+class aslclient:
+    """
+    Connection to the ASL backend
+    """
+
+    __slots__ = (
+        "_ident",
+        "_facility",
+        "_options",
+        "_filter",
+        "_filter_set",
+        "_log_files",
+        "_store",
+        "_lock",
+        "_closed",
+    )
+
+    def __init__(self, ident: typing.Optional[str], facility: str, options: int):
+        _check_str(ident, allow_none=True)
+        _check_str(facility)
+        _check_int(options)
+
+        self._ident = ident if ident is not None else _default_ident()
+        self._facility = facility
+        self._options = options
+        self._filter = _DEFAULT_FILTER
+        self._filter_set = False
+        self._log_files: typing.Set[int] = set()
+        if options & ASL_OPT_STDERR:
+            self._log_files.add(2)
+        self._store: typing.Optional[typing.Union[_MemoryStore, _FileStore]] = None
+        self._lock = threading.RLock()
+        self._closed = False
+
+    def _check_open(self) -> None:
+        if self._closed:
+            raise ValueError("Client is closed")
+
+    def _get_store(self) -> typing.Union[_MemoryStore, _FileStore]:
+        if self._store is None:
+            self._store = _default_store()
+        return self._store
+
+    def _prepare(self, values: Record, level: int) -> Record:
+        record = dict(values)
+        now = time.time()
+        record[ASL_KEY_TIME] = str(int(now))
+        record[ASL_KEY_TIME_NSEC] = str(int((now % 1) * 1e9))
+        record.setdefault(ASL_KEY_HOST, socket.gethostname())
+        record.setdefault(ASL_KEY_SENDER, self._ident)
+        record.setdefault(ASL_KEY_FACILITY, self._facility)
+        record[ASL_KEY_PID] = str(os.getpid())
+        record[ASL_KEY_UID] = str(os.getuid())
+        record[ASL_KEY_GID] = str(os.getgid())
+        record[ASL_KEY_LEVEL] = str(level)
+        return record
+
+    def _submit(self, records: typing.List[typing.Tuple[Record, int]]) -> None:
+        """
+        Store messages that pass the filter, and write all messages
+        to the additional log files.
+        """
+        with self._lock:
+            self._check_open()
+            prepared = [self._prepare(values, level) for values, level in records]
+
+            accepted = [
+                record
+                for record, (_, level) in zip(prepared, records)
+                if 0 <= level <= 31 and self._filter & (1 << level)
+            ]
+            if accepted:
+                self._get_store().append(accepted)
+
+            for fd in list(self._log_files):
+                try:
+                    os.write(fd, "".join(map(_format_line, prepared)).encode("utf-8"))
+                except OSError:
+                    pass
+
+    def add_log_file(self, fd: int) -> None:
+        _check_int(fd)
+        with self._lock:
+            self._check_open()
+            self._log_files.add(fd)
+
+    def remove_log_file(self, fd: int) -> None:
+        _check_int(fd)
+        with self._lock:
+            self._check_open()
+            self._log_files.discard(fd)
+
+    def set_filter(self, filter: int) -> int:  # noqa: A002
+        _check_int(filter)
+        with self._lock:
+            self._check_open()
+            result = self._filter
+            self._filter = filter
+            self._filter_set = True
+            return result
+
+    def _enabled(self, level: int) -> bool:
+        # Like the extension the default filter is only applied when
+        # the message is sent.
+        if self._log_files:
+            return True
+        if not 0 <= level <= 31:
+            return False
+        return not self._filter_set or bool(self._filter & (1 << level))
+
+    def is_enabled(self, level: int) -> bool:
+        _check_int(level)
+        self._check_open()
+        return self._enabled(level)
+
+    def log(
+        self, msg: typing.Optional[aslmsg], level: int, text: str, *args: typing.Any
+    ) -> None:
+        _check_message(msg, allow_none=True)
+        _check_int(level)
+        _check_str(text)
+        self._check_open()
+
+        if not self._enabled(level):
+            # Filtered out, don't format the message
+            return
+
+        if args:
+            # Like the logging package a single mapping is used
+            # for named formatting arguments.
+            if len(args) == 1 and isinstance(args[0], dict) and args[0]:
+                text = text % args[0]
+            else:
+                text = text % args
+
+        values = msg.asdict() if msg is not None else {}
+        values[ASL_KEY_MSG] = text
+        self._submit([(values, level)])
+
+    def send(self, msg: aslmsg) -> None:
+        _check_message(msg)
+        self._submit([(msg.asdict(), _level_of(msg._values.get(ASL_KEY_LEVEL)))])
+
+    def send_many(
+        self, messages: typing.Iterable[typing.Any], release_gil: bool = True
+    ) -> int:
+        self._check_open()
+
+        records = []
+        for item in list(messages):
+            if not isinstance(item, aslmsg):
+                if not isinstance(item, dict):
+                    _check_message(item)
+                item = aslmsg(ASL_TYPE_MSG, item)
+            records.append((item.asdict(), _level_of(item._values.get(ASL_KEY_LEVEL))))
+
+        for index, record in enumerate(records):
+            try:
+                self._submit([record])
+            except OSError as exc:
+                exc.index = index  # type: ignore
+                raise
+        return len(records)
+
+    def _search(self, msg: aslmsg) -> typing.List[Record]:
+        from . import match
+
+        _check_message(msg)
+        with self._lock:
+            self._check_open()
+            store = self._get_store()
+
+        predicate = match.compile(msg.query_items())
+        uid = os.getuid()
+        groups = set(os.getgroups()) | {os.getgid()}
+        return [
+            record
+            for record in store.records()
+            if _readable(record, uid, groups) and predicate(record)
+        ]
+
+    def search(
+        self, msg: aslmsg, fields: typing.Optional[typing.Iterable[str]] = None
+    ) -> aslresponse:
+        if fields is not None:
+            if isinstance(fields, str):
+                raise TypeError("fields must be a sequence of strings, not a string")
+            fields = tuple(fields)
+            for name in fields:
+                _check_str(name)
+        return aslresponse(self._search(msg), fields)
+
+    def search_columns(
+        self,
+        msg: aslmsg,
+        fields: typing.Iterable[str],
+        types: typing.Optional[typing.Dict[str, typing.Optional[str]]] = None,
+        *,
+        masks: bool = False,
+    ) -> typing.Any:
+        if isinstance(fields, str):
+            raise TypeError("fields must be a sequence of strings, not a string")
+        fields = tuple(fields)
+        for name in fields:
+            _check_str(name)
+
+        if types is not None and not isinstance(types, dict):
+            raise TypeError(
+                "Expecting a dict for types, got instance of '%s'"
+                % (type(types).__name__,)
+            )
+
+        codes = {}
+        for name in fields:
+            code: typing.Optional[str] = "q" if name in _NUMERIC_KEYS else None
+            if types is not None and name in types:
+                code = types[name]
+                if code not in (None, "q", "d"):
+                    raise ValueError(
+                        "Invalid column type for '%s', expecting 'q', 'd' or None"
+                        % (name,)
+                    )
+            codes[name] = code
+
+        records = self._search(msg)
+
+        result: typing.Dict[str, typing.Any] = {}
+        valid: typing.Dict[str, array.array] = {}
+        for name in fields:
+            values = [r.get(name) for r in records]
+            code = codes[name]
+            if code is None:
+                if _value_cache.maxsize:
+                    get = _value_cache.get
+                    values = [None if v is None else get(name, v) for v in values]
+                result[name] = values
+                continue
+
+            numbers: typing.List[typing.Any]
+            if code == "q":
+                numbers = [_as_int(v) for v in values]
+                missing: typing.Union[int, float] = 0
+            else:
+                numbers = [_as_float(v) for v in values]
+                missing = float("nan")
+
+            result[name] = array.array(
+                code, [missing if v is None else v for v in numbers]
+            )
+            if masks:
+                valid[name] = array.array("B", [v is not None for v in numbers])
+
+        if masks:
+            return result, valid
+        return result
+
+    def log_descriptor(
+        self, msg: typing.Optional[aslmsg], level: int, fd: int, fd_type: int
+    ) -> None:
+        _check_message(msg, allow_none=True)
+        _check_int(level)
+        _check_int(fd)
+        _check_int(fd_type)
+        self._check_open()
+
+        if fd_type == ASL_LOG_DESCRIPTOR_READ:
+            source = fd
+
+        elif fd_type == ASL_LOG_DESCRIPTOR_WRITE:
+            # Replace the descriptor by a pipe, and log what is
+            # written to that pipe.
+            source, sink = os.pipe()
+            os.dup2(sink, fd)
+            os.close(sink)
+
+        else:
+            raise ValueError("Invalid fd_type")
+
+        values = msg.asdict() if msg is not None else {}
+        thread = threading.Thread(
+            target=self._log_lines, args=(values, level, source), daemon=True
+        )
+        thread.start()
+
+    def _log_lines(self, values: Record, level: int, fd: int) -> None:
+        with os.fdopen(fd, "rb") as stream:
+            for line in stream:
+                record = dict(values)
+                record[ASL_KEY_MSG] = line.rstrip(b"\n").decode("utf-8", "replace")
+                try:
+                    self._submit([(record, level)])
+                except ValueError:
+                    # The client is closed
+                    break
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+
+    def __enter__(self) -> "aslclient":
+        self._check_open()
+        return self
+
+    def __exit__(self, type, value, tb) -> None:  # noqa: A002
+        self.close()
+
+
+def _as_int(value: typing.Optional[str]) -> typing.Optional[int]:
+    """
+    Return the value of an integer column, or None for missing
+    and invalid values.
+    """
+    if value is None or _INT.match(value) is None:
+        return None
+    result = int(value)
+    if not _INT_MIN <= result <= _INT_MAX:
+        return None
+    return result
+
+
+def _as_float(value: typing.Optional[str]) -> typing.Optional[float]:
+    """
+    Return the value of a floating point column, or None for missing
+    and invalid values.
+    """
+    # float() also accepts whitespace and underscores,
+    # PyOS_string_to_double() in the C extension doesn't.
+    if value is None or value != value.strip() or "_" in value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+#
+# Global functions
+#
+
+
+def open_from_file(fd: int, ident: typing.Optional[str], facility: str) -> aslclient:
+    """
+    Return a client that reads and writes messages in the file
+    for descriptor *fd*.
+    """
+    import fcntl
+
+    _check_int(fd)
+    _check_str(ident, allow_none=True)
+    _check_str(facility)
+
+    mode = fcntl.fcntl(fd, fcntl.F_GETFL) & os.O_ACCMODE
+    if mode != os.O_RDWR:
+        raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+
+    cli = aslclient(ident, facility, 0)
+    cli._store = _FileStore(fd)
+    return cli
+
+
+_default_client: typing.Optional[aslclient] = None
+_auxiliary_files: typing.Dict[int, typing.Tuple[Record, str, str, str]] = {}
+
+
+def _log_default(values: Record) -> None:
+    global _default_client
+
+    with _store_lock:
+        if _default_client is None:
+            _default_client = aslclient(None, "user", 0)
+    _default_client._submit([(values, _level_of(values.get(ASL_KEY_LEVEL)))])
+
+
+def log_auxiliary_location(
+    msg: aslmsg, title: str, uti: typing.Optional[str], url: str
+) -> None:
+    _check_message(msg)
+    _check_str(title)
+    _check_str(uti, allow_none=True)
+    _check_str(url)
+
+    values = msg.asdict()
+    values[ASL_KEY_AUX_TITLE] = title
+    values[ASL_KEY_AUX_UTI] = uti if uti is not None else "public.data"
+    values[ASL_KEY_AUX_URL] = url
+    _log_default(values)
+
+
+def create_auxiliary_file(msg: aslmsg, title: str, uti: typing.Optional[str]) -> int:
+    _check_message(msg)
+    _check_str(title)
+    _check_str(uti, allow_none=True)
+
+    fd, path = tempfile.mkstemp(prefix="asl-aux-")
+    _auxiliary_files[fd] = (
+        msg.asdict(),
+        title,
+        uti if uti is not None else "public.data",
+        path,
+    )
+    return fd
+
+
+def close_auxiliary_file(fd: int) -> None:
+    _check_int(fd)
+    try:
+        values, title, uti, path = _auxiliary_files.pop(fd)
+    except KeyError:
+        raise OSError(errno.EBADF, os.strerror(errno.EBADF)) from None
+
+    os.close(fd)
+    try:
+        with open(path, "rb") as stream:
+            data = stream.read()
+    finally:
+        os.unlink(path)
+
+    values[ASL_KEY_AUX_TITLE] = title
+    values[ASL_KEY_AUX_UTI] = uti
+    values[ASL_KEY_AUX_DATA] = base64.b64encode(data).decode("ascii")
+    _log_default(values)
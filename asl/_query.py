@@ -0,0 +1,239 @@
+"""
+Query builder
+
+A :class:`Query` is an immutable description of an ASL query that
+can be compiled to an :class:`aslmsg` of type ASL_TYPE_QUERY. Compiled
+queries are cached, repeatedly searching with the same query does not
+rebuild the query message.
+"""
+import functools
+import typing
+
+from ._backend import aslmsg
+from ._constants import (
+    ASL_QUERY_OP_CASEFOLD,
+    ASL_QUERY_OP_EQUAL,
+    ASL_QUERY_OP_GREATER,
+    ASL_QUERY_OP_GREATER_EQUAL,
+    ASL_QUERY_OP_LESS,
+    ASL_QUERY_OP_LESS_EQUAL,
+    ASL_QUERY_OP_NOT_EQUAL,
+    ASL_QUERY_OP_NUMERIC,
+    ASL_QUERY_OP_PREFIX,
+    ASL_QUERY_OP_REGEX,
+    ASL_QUERY_OP_SUBSTRING,
+    ASL_QUERY_OP_SUFFIX,
+    ASL_QUERY_OP_TRUE,
+    ASL_TYPE_QUERY,
+)
+
+__all__ = ("Field", "Query")
+
+# Maximum number of compiled queries that are kept alive
+COMPILE_CACHE_SIZE = 128
+
+Term = typing.Tuple[str, str, int]
+
+
+class Field:
+    """
+    An attribute in a query, comparing a field with a value
+    creates a :class:`Query`.
+
+    Comparisons with an integer use numeric comparison
+    (ASL_QUERY_OP_NUMERIC), other values must be strings.
+    """
+
+    __slots__ = ("name", "_flags")
+
+    name: str
+    _flags: int
+
+    def __init__(self, name: str, *, casefold: bool = False):
+        if not isinstance(name, str):
+            raise TypeError(
+                "Expecting a string, got instance of '%s'" % (type(name).__name__,)
+            )
+        self.name = name
+        self._flags = ASL_QUERY_OP_CASEFOLD if casefold else 0
+
+    def __repr__(self) -> str:
+        if self._flags:
+            return "Field(%r, casefold=True)" % (self.name,)
+        return "Field(%r)" % (self.name,)
+
+    @property
+    def casefold(self) -> "Field":
+        """
+        This field with case-insensitive string comparison
+        """
+        return Field(self.name, casefold=True)
+
+    def _term(self, op: int, value: typing.Union[str, int]) -> "Query":
+        if isinstance(value, int) and not isinstance(value, bool):
+            op |= ASL_QUERY_OP_NUMERIC
+            value = str(value)
+
+        elif not isinstance(value, str):
+            raise TypeError(
+                "Expecting a string or integer, got instance of '%s'"
+                % (type(value).__name__,)
+            )
+        return Query((self.name, value, op | self._flags))
+
+    def __eq__(self, value):  # type: ignore
+        return self._term(ASL_QUERY_OP_EQUAL, value)
+
+    def __ne__(self, value):  # type: ignore
+        return self._term(ASL_QUERY_OP_NOT_EQUAL, value)
+
+    def __lt__(self, value: typing.Union[str, int]) -> "Query":
+        return self._term(ASL_QUERY_OP_LESS, value)
+
+    def __le__(self, value: typing.Union[str, int]) -> "Query":
+        return self._term(ASL_QUERY_OP_LESS_EQUAL, value)
+
+    def __gt__(self, value: typing.Union[str, int]) -> "Query":
+        return self._term(ASL_QUERY_OP_GREATER, value)
+
+    def __ge__(self, value: typing.Union[str, int]) -> "Query":
+        return self._term(ASL_QUERY_OP_GREATER_EQUAL, value)
+
+    __hash__ = None  # type: ignore
+
+    def startswith(self, value: str) -> "Query":
+        return self._term(ASL_QUERY_OP_EQUAL | ASL_QUERY_OP_PREFIX, value)
+
+    def endswith(self, value: str) -> "Query":
+        return self._term(ASL_QUERY_OP_EQUAL | ASL_QUERY_OP_SUFFIX, value)
+
+    def contains(self, value: str) -> "Query":
+        return self._term(ASL_QUERY_OP_EQUAL | ASL_QUERY_OP_SUBSTRING, value)
+
+    def regex(self, pattern: str) -> "Query":
+        """
+        Match the value with a POSIX extended regular expression
+        """
+        return self._term(ASL_QUERY_OP_EQUAL | ASL_QUERY_OP_REGEX, pattern)
+
+    def exists(self) -> "Query":
+        return self._term(ASL_QUERY_OP_TRUE, "")
+
+
+@functools.lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def _compile(terms: typing.Tuple[Term, ...]) -> aslmsg:
+    msg = aslmsg(ASL_TYPE_QUERY)
+    for key, value, op in terms:
+        msg.set_query(key, value, op)
+    return msg
+
+
+class Query:
+    """
+    An immutable ASL query: the conjunction of a number of
+    conditions, each of which is a (key, value, operation) tuple.
+
+    Queries are combined with "&". ASL queries cannot contain
+    more than one condition for the same attribute.
+    """
+
+    __slots__ = ("_terms", "_hash")
+
+    _terms: typing.Tuple[Term, ...]
+    _hash: int
+
+    def __init__(self, *terms: typing.Union["Query", Term]):
+        result: typing.Dict[str, Term] = {}
+        for term in terms:
+            if isinstance(term, Query):
+                parts = term._terms
+            else:
+                key, value, op = term
+                if not isinstance(key, str) or not isinstance(value, str):
+                    raise TypeError("Query key and value must be strings")
+                if not isinstance(op, int):
+                    raise TypeError("Query operation must be an integer")
+                parts = ((key, value, op),)
+
+            for part in parts:
+                if part[0] in result and result[part[0]] != part:
+                    raise ValueError(
+                        "Query has multiple conditions for %r" % (part[0],)
+                    )
+                result[part[0]] = part
+
+        # Terms are sorted to make the compiled query independent
+        # of the order in which a query is constructed.
+        object.__setattr__(self, "_terms", tuple(sorted(result.values())))
+        object.__setattr__(self, "_hash", hash(self._terms))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Query objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Query objects are immutable")
+
+    def __repr__(self) -> str:
+        return "Query(%s)" % (", ".join(repr(t) for t in self._terms))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Query):
+            return NotImplemented
+        return self._terms == other._terms
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __and__(self, other: "Query") -> "Query":
+        if not isinstance(other, Query):
+            return NotImplemented
+        return Query(self, other)
+
+    def __iter__(self) -> typing.Iterator[Term]:
+        return iter(self._terms)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    @property
+    def terms(self) -> typing.Tuple[Term, ...]:
+        """
+        The conditions of this query as (key, value, operation) tuples
+        """
+        return self._terms
+
+    def where(self, key: str, value: str, operation: int) -> "Query":
+        """
+        Return a query with an additional condition
+        """
+        return Query(self, (key, value, operation))
+
+    def compile(self) -> aslmsg:
+        """
+        Return a query message for this query.
+
+        The result is a copy of the cached message for equal
+        queries, and can be modified.
+        """
+        return _compile(self._terms).copy()
+
+    def _message(self) -> aslmsg:
+        # The cached message, which is shared and must not be modified
+        return _compile(self._terms)
+
+    def search(self, client, fields: typing.Optional[typing.Iterable[str]] = None):
+        """
+        Shorthand for ``client.search(query.compile(), fields)``
+        """
+        return client.search(_compile(self._terms), fields)
+
+    @staticmethod
+    def cache_info():
+        """
+        Statistics for the cache of compiled queries
+        """
+        return _compile.cache_info()
+
+    @staticmethod
+    def cache_clear() -> None:
+        _compile.cache_clear()
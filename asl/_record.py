@@ -0,0 +1,174 @@
+"""
+Compact read-only records
+
+A :class:`Record` stores the values of a message in a tuple, the
+attribute names are stored in a schema that is shared by all records
+with the same attribute names in the same order.
+"""
+import collections.abc
+import threading
+import typing
+
+__all__ = ("Record",)
+
+# Maximum number of schemas that are kept alive by the schema cache
+SCHEMA_CACHE_SIZE = 1024
+
+
+class _Schema:
+    """
+    The attribute names of a record, and the index of
+    the value of every attribute.
+    """
+
+    __slots__ = ("keys", "index")
+
+    keys: typing.Tuple[str, ...]
+    index: typing.Dict[str, int]
+
+    def __init__(self, keys: typing.Tuple[str, ...]):
+        self.keys = keys
+        self.index = {k: i for i, k in enumerate(keys)}
+        if len(self.index) != len(keys):
+            raise ValueError("Duplicate attribute names")
+
+
+_schemas: typing.Dict[typing.Tuple[str, ...], _Schema] = {}
+_schemas_lock = threading.Lock()
+
+
+def _schema(keys: typing.Tuple[str, ...]) -> _Schema:
+    try:
+        return _schemas[keys]
+    except KeyError:
+        pass
+
+    for key in keys:
+        if not isinstance(key, str):
+            raise TypeError(
+                "Expecting a string, got instance of '%s'" % (type(key).__name__,)
+            )
+
+    schema = _Schema(keys)
+    with _schemas_lock:
+        if len(_schemas) >= SCHEMA_CACHE_SIZE:
+            _schemas.clear()
+        return _schemas.setdefault(keys, schema)
+
+
+class Record(collections.abc.Mapping):
+    """
+    A read-only mapping from attribute names to values, with
+    a compact representation for large numbers of records.
+    """
+
+    __slots__ = ("_schema", "_values")
+
+    _schema: _Schema
+    _values: typing.Tuple[str, ...]
+
+    def __init__(self, mapping: typing.Any = (), **kwds: str):
+        values = dict(mapping, **kwds)
+        for value in values.values():
+            if not isinstance(value, str):
+                raise TypeError(
+                    "Expecting a string, got instance of '%s'" % (type(value).__name__,)
+                )
+        self._schema = _schema(tuple(values))
+        self._values = tuple(values.values())
+
+    @classmethod
+    def from_items(
+        cls, keys: typing.Tuple[str, ...], values: typing.Tuple[str, ...]
+    ) -> "Record":
+        """
+        Create a record from a tuple of attribute names and a tuple
+        of values, such as the items returned by
+        :meth:`aslresponse.fetch`. Values are not checked.
+        """
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        record = cls.__new__(cls)
+        record._schema = _schema(tuple(keys))
+        record._values = tuple(values)
+        return record
+
+    def __getitem__(self, key: str) -> str:
+        return self._values[self._schema.index[key]]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._schema.index
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._schema.keys)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Record):
+            if self._schema is other._schema:
+                return self._values == other._values
+            return self.asdict() == other.asdict()
+        return super().__eq__(other)
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return "Record(%r)" % (self.asdict(),)
+
+    def __reduce__(self) -> typing.Tuple[typing.Any, ...]:
+        return (Record.from_items, (self._schema.keys, self._values))
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        try:
+            return self._values[self._schema.index[key]]
+        except KeyError:
+            return default
+
+    def asdict(self) -> typing.Dict[str, str]:
+        return dict(zip(self._schema.keys, self._values))
+
+
+def _from_fetch(
+    fields: typing.Optional[typing.Tuple[str, ...]], rows: typing.List[typing.Any]
+) -> typing.List[Record]:
+    """
+    Convert the result of aslresponse.fetch() to a list of records
+    """
+    result = []
+    new = Record.__new__
+
+    if fields is None:
+        last_keys = None
+        schema: typing.Optional[_Schema] = None
+        for keys, values in rows:
+            # fetch() reuses the keys tuple for consecutive records
+            # with the same attributes.
+            if keys is not last_keys:
+                schema = _schema(keys)
+                last_keys = keys
+            assert schema is not None
+
+            record = new(Record)
+            record._schema = schema
+            record._values = values
+            result.append(record)
+
+    else:
+        full = _schema(fields)
+        for values in rows:
+            if None in values:
+                result.append(
+                    Record.from_items(
+                        tuple(k for k, v in zip(fields, values) if v is not None),
+                        tuple(v for v in values if v is not None),
+                    )
+                )
+            else:
+                record = new(Record)
+                record._schema = full
+                record._values = values
+                result.append(record)
+
+    return result
@@ -0,0 +1,263 @@
+"""
+asyncio support
+
+Calls that communicate with syslogd block until syslogd has processed
+the request. :class:`AsyncClient` runs those calls in a dedicated pool
+of threads, every thread uses its own :class:`aslclient` to avoid
+serializing calls on the lock of a shared client.
+"""
+import asyncio
+import concurrent.futures
+import threading
+import typing
+
+from ._backend import aslclient, aslmsg
+from ._query import Query
+from ._record import Record
+
+__all__ = ("AsyncClient", "AsyncResponse")
+
+try:
+    _get_running_loop = asyncio.get_running_loop
+except AttributeError:
+    # Python 3.6, get_event_loop() returns the running loop in
+    # coroutines and callbacks.
+    _get_running_loop = asyncio.get_event_loop
+
+# Default number of records fetched at a time by AsyncResponse
+PREFETCH = 256
+
+
+class AsyncClient:
+    """
+    An ASL client for use with asyncio. The arguments *ident*,
+    *facility* and *options* are those of :class:`aslclient`,
+    *max_workers* is the number of threads used for calls.
+    """
+
+    def __init__(
+        self,
+        ident: typing.Optional[str] = None,
+        facility: str = "user",
+        options: int = 0,
+        *,
+        max_workers: int = 1,
+        prefetch: int = PREFETCH,
+    ):
+        if max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0")
+        if prefetch <= 0:
+            raise ValueError("prefetch must be greater than 0")
+
+        # Check the arguments before starting threads
+        aslclient(ident, facility, options).close()
+
+        self._args = (ident, facility, options)
+        self._prefetch = prefetch
+        self._filter: typing.Optional[int] = None
+        self._local = threading.local()
+        self._clients: typing.List[aslclient] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="asl.aio"
+        )
+
+    def _client(self) -> aslclient:
+        # Called in a worker thread
+        try:
+            cli = self._local.client
+        except AttributeError:
+            cli = self._local.client = aslclient(*self._args)
+            self._local.filter = None
+            with self._lock:
+                self._clients.append(cli)
+
+        if self._filter is not None and self._local.filter != self._filter:
+            self._local.filter = self._filter
+            cli.set_filter(self._filter)
+        return cli
+
+    def _call(self, name: str, *args: typing.Any) -> typing.Any:
+        return getattr(self._client(), name)(*args)
+
+    def _run(self, function: typing.Callable, *args: typing.Any) -> "asyncio.Future":
+        if self._closed:
+            raise ValueError("Client is closed")
+        # run_in_executor() already returns a future, ensure_future() makes
+        # that explicit for the type checker.
+        return asyncio.ensure_future(
+            _get_running_loop().run_in_executor(self._executor, function, *args)
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def set_filter(self, filter: int) -> None:
+        """
+        Set the filter mask of the clients, the mask is applied
+        on the next call in every thread.
+        """
+        if self._closed:
+            raise ValueError("Client is closed")
+        if not isinstance(filter, int):
+            raise TypeError(
+                "Expecting an integer, got instance of '%s'" % (type(filter).__name__,)
+            )
+        self._filter = filter
+
+    async def send(self, msg: typing.Optional[aslmsg]) -> None:
+        """
+        Send a message, like :meth:`aslclient.send`. The message
+        cannot be modified until the call is done.
+        """
+        await self._run(self._call, "send", msg)
+
+    async def log(
+        self, msg: typing.Optional[aslmsg], level: int, text: str, *args: typing.Any
+    ) -> None:
+        """
+        Log a message, like :meth:`aslclient.log`
+        """
+        await self._run(self._call, "log", msg, level, text, *args)
+
+    async def send_many(
+        self, messages: typing.Iterable[typing.Union[aslmsg, typing.Dict[str, str]]]
+    ) -> int:
+        """
+        Send a batch of messages, like :meth:`aslclient.send_many`
+        """
+        return await self._run(self._call, "send_many", list(messages))
+
+    def search(
+        self,
+        query: typing.Union[aslmsg, Query],
+        fields: typing.Optional[typing.Iterable[str]] = None,
+        *,
+        prefetch: typing.Optional[int] = None,
+    ) -> "AsyncResponse":
+        """
+        Search for messages, the result is an asynchronous iterator
+        that yields :class:`Record` objects.
+        """
+        if self._closed:
+            raise ValueError("Client is closed")
+        if isinstance(query, Query):
+            query = query._message()
+        if fields is not None:
+            fields = tuple(fields)
+        if prefetch is None:
+            prefetch = self._prefetch
+        elif prefetch <= 0:
+            raise ValueError("prefetch must be greater than 0")
+        return AsyncResponse(self, query, fields, prefetch)
+
+    async def close(self) -> None:
+        """
+        Wait for pending calls and close the clients
+        """
+        if self._closed:
+            return
+        self._closed = True
+        await _get_running_loop().run_in_executor(None, self._shutdown)
+
+    def _shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            clients = self._clients
+            self._clients = []
+        for cli in clients:
+            cli.close()
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb) -> None:
+        await self.close()
+
+
+class AsyncResponse:
+    """
+    The result of :meth:`AsyncClient.search`
+
+    Records are fetched in batches of *prefetch* records, the next
+    batch is fetched while the current batch is consumed. At most
+    two batches are kept in memory.
+    """
+
+    def __init__(
+        self,
+        client: AsyncClient,
+        query: aslmsg,
+        fields: typing.Optional[typing.Tuple[str, ...]],
+        prefetch: int,
+    ):
+        self._client = client
+        self._query = query
+        self._fields = fields
+        self._prefetch = prefetch
+        self._response: typing.Any = None
+        self._batch: typing.List[Record] = []
+        self._pos = 0
+        self._pending: typing.Optional[asyncio.Future] = None
+        self._done = False
+
+    def _fetch(self) -> typing.List[Record]:
+        # Called in a worker thread
+        if self._response is None:
+            self._response = self._client._call("search", self._query, self._fields)
+        return self._response.fetch_records(self._prefetch)
+
+    def __aiter__(self) -> "AsyncResponse":
+        return self
+
+    async def __anext__(self) -> Record:
+        if self._pos < len(self._batch):
+            record = self._batch[self._pos]
+            self._pos += 1
+            return record
+
+        if self._done:
+            raise StopAsyncIteration
+
+        if self._pending is None:
+            self._pending = self._client._run(self._fetch)
+
+        try:
+            batch = await self._pending
+        finally:
+            self._pending = None
+
+        if len(batch) < self._prefetch:
+            self._done = True
+        if not batch:
+            raise StopAsyncIteration
+
+        if not self._done:
+            self._pending = self._client._run(self._fetch)
+
+        self._batch = batch
+        self._pos = 1
+        return batch[0]
+
+    async def fetch(self) -> typing.List[Record]:
+        """
+        Return all remaining records
+        """
+        result = self._batch[self._pos :]  # noqa: E203
+        self._batch = []
+        self._pos = 0
+        async for record in self:
+            result.append(record)
+        return result
+
+    async def aclose(self) -> None:
+        """
+        Stop fetching records
+        """
+        self._done = True
+        self._batch = []
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,420 @@
+"""
+Integration with the :mod:`logging` package
+
+:class:`ASLHandler` sends log records to ASL without blocking the
+thread that logs: records are queued and sent in batches by a
+background thread.
+"""
+import collections
+import logging
+import os
+import threading
+import typing
+import weakref
+
+from ._backend import aslclient
+from ._constants import (
+    ASL_KEY_FACILITY,
+    ASL_KEY_LEVEL,
+    ASL_KEY_MSG,
+    ASL_KEY_READ_UID,
+    ASL_LEVEL_ALERT,
+    ASL_LEVEL_CRIT,
+    ASL_LEVEL_DEBUG,
+    ASL_LEVEL_ERR,
+    ASL_LEVEL_INFO,
+    ASL_LEVEL_WARNING,
+)
+
+__all__ = (
+    "ASLHandler",
+    "DEFAULT_FIELDS",
+    "OVERFLOW_BLOCK",
+    "OVERFLOW_DROP_NEWEST",
+    "OVERFLOW_DROP_OLDEST",
+    "asl_level",
+    "compile_fields",
+)
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+
+_OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+_LOGGING2ASL = (
+    (logging.CRITICAL + 1, ASL_LEVEL_ALERT),
+    (logging.CRITICAL, ASL_LEVEL_CRIT),
+    (logging.ERROR, ASL_LEVEL_ERR),
+    (logging.WARNING, ASL_LEVEL_WARNING),
+    (logging.INFO, ASL_LEVEL_INFO),
+)
+
+
+# Attributes of a LogRecord that are not set using "extra",
+# including those set by logging.Formatter.format().
+_RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None))
+) | {"message", "asctime"}
+
+Converter = typing.Callable[[typing.Any], str]
+FieldSpec = typing.Union[str, typing.Tuple[str, str], typing.Tuple[str, str, Converter]]
+CompiledFields = typing.Tuple[typing.Tuple[str, str, Converter], ...]
+
+# LogRecord attributes that are added to messages by default
+DEFAULT_FIELDS = (
+    "name",
+    "pathname",
+    "lineno",
+    "funcName",
+    "module",
+    "process",
+    "processName",
+    "thread",
+    "threadName",
+)
+
+
+def compile_fields(spec: typing.Iterable[FieldSpec]) -> CompiledFields:
+    """
+    Compile a field mapping for :class:`ASLHandler` to a tuple of
+    (attribute, key, converter) tuples.
+
+    An entry in *spec* is the name of a LogRecord attribute, which is
+    stored in the message as "py.<name>", or an (attribute, key) or
+    (attribute, key, converter) tuple. The default converter is
+    :func:`str`.
+    """
+    if isinstance(spec, str):
+        raise TypeError("spec must be a sequence, not a string")
+
+    result: typing.List[typing.Tuple[str, str, Converter]] = []
+    seen: typing.Set[str] = set()
+    for entry in spec:
+        # Entries are checked below, they need not match FieldSpec
+        field: typing.Tuple[typing.Any, ...]
+        if isinstance(entry, str):
+            field = (entry, "py." + entry, str)
+        elif isinstance(entry, tuple) and len(entry) == 2:
+            field = (entry[0], entry[1], str)
+        elif not isinstance(entry, tuple) or len(entry) != 3:
+            raise TypeError("Invalid field specification: %r" % (entry,))
+        else:
+            field = entry
+
+        attribute, key, converter = field
+        if not isinstance(attribute, str) or not isinstance(key, str):
+            raise TypeError("Invalid field specification: %r" % (entry,))
+        if not callable(converter):
+            raise TypeError("Converter for %r is not callable" % (attribute,))
+        if key in (ASL_KEY_MSG, ASL_KEY_LEVEL):
+            raise ValueError("Key %r is set by the handler" % (key,))
+        if key in seen:
+            raise ValueError("Duplicate key %r" % (key,))
+        seen.add(key)
+        result.append((attribute, key, converter))
+
+    return tuple(result)
+
+
+def asl_level(levelno: int) -> int:
+    """
+    Return the ASL priority level for a :mod:`logging` level
+    """
+    for lower, level in _LOGGING2ASL:
+        if levelno >= lower:
+            return level
+    return ASL_LEVEL_DEBUG
+
+
+class ASLHandler(logging.Handler):
+    """
+    A logging handler that sends records to ASL.
+
+    :meth:`emit` formats the record and adds it to a queue of at most
+    *queue_size* records, a background thread sends the queued records
+    in batches of at most *batch_size* records. The *overflow* policy
+    determines what happens when the queue is full.
+
+    The attributes of the record that are added to the message are
+    specified by *fields*, see :func:`compile_fields`. Attributes set
+    using the *extra* argument of the logging functions are ignored
+    unless *extra* is true, which adds all of them as "py.<name>", or
+    a field specification for the attributes that should be added.
+    """
+
+    def __init__(
+        self,
+        ident: typing.Optional[str] = None,
+        facility: str = "com.apple.console",
+        level: int = logging.NOTSET,
+        *,
+        read_uid: typing.Optional[int] = None,
+        queue_size: int = 1024,
+        batch_size: int = 64,
+        overflow: str = OVERFLOW_BLOCK,
+        fields: typing.Iterable[FieldSpec] = DEFAULT_FIELDS,
+        extra: typing.Union[bool, typing.Iterable[FieldSpec]] = False,
+    ):
+        if queue_size <= 0:
+            raise ValueError("queue_size must be greater than 0")
+        if batch_size <= 0:
+            raise ValueError("batch_size must be greater than 0")
+        if overflow not in _OVERFLOW_POLICIES:
+            raise ValueError("Invalid overflow policy: %r" % (overflow,))
+
+        super().__init__(level)
+
+        # Check the arguments before queueing records
+        aslclient(ident, facility, 0).close()
+
+        self.ident = ident
+        self.facility = facility
+        self.read_uid = read_uid
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.overflow = overflow
+
+        self._fields = compile_fields(fields)
+        self._extra: typing.Union[bool, CompiledFields]
+        if isinstance(extra, bool):
+            self._extra = extra
+        else:
+            self._extra = compile_fields(extra)
+
+        # Attributes that are the same for all messages
+        self._base = {ASL_KEY_FACILITY: facility}
+        if read_uid is not None:
+            self._base[ASL_KEY_READ_UID] = str(read_uid)
+        self._levels = {
+            levelno: str(asl_level(levelno))
+            for levelno in (
+                logging.DEBUG,
+                logging.INFO,
+                logging.WARNING,
+                logging.ERROR,
+                logging.CRITICAL,
+            )
+        }
+
+        self._queue: typing.Deque[
+            typing.Tuple[logging.LogRecord, str]
+        ] = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._unfinished = 0
+        self._closing = False
+        self._thread: typing.Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        _handlers.add(self)
+
+        self.queued = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Queue a record, the record is formatted before it is queued
+        """
+        try:
+            text = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._cond:
+            if self._closing:
+                self.dropped += 1
+                return
+
+            if self._thread is None or self._pid != os.getpid():
+                self._start()
+
+            if len(self._queue) >= self.queue_size:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return
+
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self._unfinished -= 1
+                    self.dropped += 1
+
+                elif threading.current_thread() is self._thread:
+                    # Logging from the background thread, waiting
+                    # would deadlock.
+                    self.dropped += 1
+                    return
+
+                else:
+                    while len(self._queue) >= self.queue_size and not self._closing:
+                        self._cond.wait()
+                    if self._closing:
+                        self.dropped += 1
+                        return
+
+            self._queue.append((record, text))
+            self._unfinished += 1
+            self.queued += 1
+            self._cond.notify_all()
+
+    def _start(self) -> None:
+        # Called with the condition locked. After a fork the
+        # background thread of the parent does not exist in the
+        # child, records queued before the fork are not sent.
+        self._queue.clear()
+        self._unfinished = 0
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="asl.logging.ASLHandler", daemon=True
+        )
+        self._thread.start()
+
+    def _after_fork(self) -> None:
+        # Called in the child process after a fork, the lock might
+        # have been held by another thread of the parent.
+        self._cond = threading.Condition(threading.Lock())
+        self._queue.clear()
+        self._unfinished = 0
+        self._thread = None
+        self._pid = os.getpid()
+
+    def _run(self) -> None:
+        cli = aslclient(self.ident, self.facility, 0)
+        try:
+            # Records are filtered by the logging level
+            cli.set_filter((1 << (ASL_LEVEL_DEBUG + 1)) - 1)
+
+            while True:
+                with self._cond:
+                    while not self._queue and not self._closing:
+                        self._cond.wait()
+                    if not self._queue:
+                        return
+
+                    count = min(len(self._queue), self.batch_size)
+                    batch = [self._queue.popleft() for _ in range(count)]
+                    self._cond.notify_all()
+
+                sent = dropped = 0
+                try:
+                    sent, dropped = self._send(cli, batch)
+                finally:
+                    with self._cond:
+                        self.sent += sent
+                        self.dropped += dropped
+                        self._unfinished -= count
+                        self._cond.notify_all()
+        finally:
+            cli.close()
+
+    def _send(
+        self, cli: aslclient, batch: typing.List[typing.Tuple[logging.LogRecord, str]]
+    ) -> typing.Tuple[int, int]:
+        """
+        Send *batch*, returns the number of records that were sent and
+        the number of records that were dropped because sending failed.
+        """
+        sent = dropped = 0
+        while batch:
+            try:
+                sent += cli.send_many([self._message(r, text) for r, text in batch])
+                break
+            except Exception as exc:
+                index = getattr(exc, "index", None)
+                if index is None and len(batch) > 1:
+                    # Nothing was sent, send the records one at a time
+                    # to only drop those that fail.
+                    for item in batch:
+                        item_sent, item_dropped = self._send(cli, [item])
+                        sent += item_sent
+                        dropped += item_dropped
+                    break
+
+                # Records before the failing one have been sent, the
+                # records after it are tried again.
+                index = index or 0
+                self.handleError(batch[index][0])
+                sent += index
+                dropped += 1
+                batch = batch[index + 1 :]  # noqa: E203
+
+        return sent, dropped
+
+    def _message(self, record: logging.LogRecord, text: str) -> typing.Dict[str, str]:
+        msg = self._base.copy()
+        values = record.__dict__
+
+        for attribute, key, converter in self._fields:
+            value = values.get(attribute)
+            if value is not None:
+                msg[key] = converter(value)
+
+        extra = self._extra
+        if extra is True:
+            for attribute, value in values.items():
+                if attribute not in _RECORD_ATTRIBUTES and value is not None:
+                    msg["py." + attribute] = str(value)
+        elif extra:
+            for attribute, key, converter in extra:  # type: ignore
+                value = values.get(attribute)
+                if value is not None:
+                    msg[key] = converter(value)
+
+        try:
+            msg[ASL_KEY_LEVEL] = self._levels[record.levelno]
+        except KeyError:
+            msg[ASL_KEY_LEVEL] = str(asl_level(record.levelno))
+        msg[ASL_KEY_MSG] = text
+        return msg
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of records that are queued or being sent
+        """
+        with self._cond:
+            return self._unfinished
+
+    def wait(self, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait until all queued records are sent, returns False
+        when *timeout* expires first.
+        """
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                return True
+            return self._cond.wait_for(lambda: not self._unfinished, timeout)
+
+    def flush(self) -> None:
+        """
+        Wait until all queued records are sent
+        """
+        self.wait()
+
+    def close(self) -> None:
+        """
+        Send the queued records and stop the background thread
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        super().close()
+
+
+# Handlers that are reinitialised in the child process after a fork,
+# the _pid checks in ASLHandler cover Python versions without
+# os.register_at_fork().
+_handlers: "weakref.WeakSet[ASLHandler]" = weakref.WeakSet()
+
+
+def _after_fork() -> None:
+    for handler in list(_handlers):
+        handler._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
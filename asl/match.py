@@ -0,0 +1,460 @@
+"""
+Pure-Python evaluation of ASL queries
+
+This module evaluates ASL queries against records that are already
+available in Python, such as the dicts returned by
+:meth:`aslmsg.asdict` or exported JSON records, using the same
+semantics as the ASL library uses for :meth:`aslclient.search`.
+
+A query is compiled once into a predicate, regular expressions and
+numeric query values are converted during compilation.
+"""
+import calendar
+import functools
+import operator
+import re
+import string
+import time
+import typing
+
+from ._constants import (
+    ASL_KEY_TIME,
+    ASL_QUERY_OP_CASEFOLD,
+    ASL_QUERY_OP_EQUAL,
+    ASL_QUERY_OP_GREATER,
+    ASL_QUERY_OP_GREATER_EQUAL,
+    ASL_QUERY_OP_LESS,
+    ASL_QUERY_OP_LESS_EQUAL,
+    ASL_QUERY_OP_NOT_EQUAL,
+    ASL_QUERY_OP_NUMERIC,
+    ASL_QUERY_OP_PREFIX,
+    ASL_QUERY_OP_REGEX,
+    ASL_QUERY_OP_SUBSTRING,
+    ASL_QUERY_OP_SUFFIX,
+    ASL_QUERY_OP_TRUE,
+)
+from ._query import Query
+
+__all__ = ("compile", "matches", "filter", "evaluate")
+
+Term = typing.Tuple[str, str, int]
+Record = typing.Mapping[str, str]
+Predicate = typing.Callable[[Record], bool]
+
+# Tests that a key is not present. Not exported by <asl.h>.
+_OP_FALSE = 0
+
+_NUMBER = re.compile(r"[-+]?[0-9]+\Z")
+
+# strcasecmp(3) only folds ASCII letters
+_ASCII_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+_POSIX_CLASSES = {
+    "[:alnum:]": "a-zA-Z0-9",
+    "[:alpha:]": "a-zA-Z",
+    "[:blank:]": " \\t",
+    "[:cntrl:]": "\\x00-\\x1f\\x7f",
+    "[:digit:]": "0-9",
+    "[:graph:]": "\\x21-\\x7e",
+    "[:lower:]": "a-z",
+    "[:print:]": "\\x20-\\x7e",
+    "[:punct:]": "!-/:-@\\[-`{-~",
+    "[:space:]": " \\t\\n\\r\\f\\v",
+    "[:upper:]": "A-Z",
+    "[:xdigit:]": "0-9A-Fa-f",
+}
+_POSIX_CLASS_RE = re.compile("|".join(re.escape(k) for k in _POSIX_CLASSES))
+
+
+def _fold(value: str) -> str:
+    return value.translate(_ASCII_FOLD)
+
+
+def _cmp(a: str, b: str) -> int:
+    return (a > b) - (a < b)
+
+
+def _result(t: int, cmp: int) -> bool:
+    if t == ASL_QUERY_OP_EQUAL:
+        return cmp == 0
+    elif t == ASL_QUERY_OP_GREATER:
+        return cmp > 0
+    elif t == ASL_QUERY_OP_GREATER_EQUAL:
+        return cmp >= 0
+    elif t == ASL_QUERY_OP_LESS:
+        return cmp < 0
+    elif t == ASL_QUERY_OP_LESS_EQUAL:
+        return cmp <= 0
+    elif t == ASL_QUERY_OP_NOT_EQUAL:
+        return cmp != 0
+    return False
+
+
+@functools.lru_cache(maxsize=256)
+def _regex(pattern: str, casefold: bool) -> typing.Optional[typing.Pattern]:
+    """
+    Compile a POSIX extended regular expression, returns None
+    for an invalid expression.
+    """
+    pattern = _POSIX_CLASS_RE.sub(lambda m: _POSIX_CLASSES[m.group(0)], pattern)
+    try:
+        return re.compile(pattern, re.IGNORECASE if casefold else 0)
+    except re.error:
+        return None
+
+
+def _parse_time(value: str, now: typing.Optional[float] = None) -> int:
+    """
+    Parse a time value like the ASL library: seconds since the epoch,
+    a time relative to now ("-1h", "+30m") or a UTC timestamp
+    ("2020-01-31T12:00:00Z" or "2020.01.31 12:00:00 UTC").
+
+    Returns -1 for values that cannot be parsed.
+    """
+    if value.isdigit():
+        return int(value)
+
+    m = _TIME_RELATIVE.match(value)
+    if m is not None:
+        if now is None:
+            now = time.time()
+        delta = int(m.group(2)) * _TIME_UNITS[m.group(3).lower()]
+        return int(now) + (delta if m.group(1) == "+" else -delta)
+
+    m = _TIME_ISO.match(value) or _TIME_ASL.match(value)
+    if m is not None:
+        fields = [int(v) for v in m.groups()[:6]]
+        try:
+            result = calendar.timegm(tuple(fields) + (0, 0, 0))  # type: ignore
+        except (ValueError, OverflowError):
+            return -1
+
+        if m.lastindex is not None and m.lastindex > 6 and m.group(7):
+            sign = -1 if m.group(7) == "+" else 1
+            result += sign * (int(m.group(8)) * 3600 + int(m.group(9)) * 60)
+        return result
+
+    return -1
+
+
+_TIME_RELATIVE = re.compile(r"([-+])([0-9]+)([smhdwSMHDW]?)\Z")
+_TIME_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_TIME_ISO = re.compile(
+    r"([0-9]{4})-([0-9]{2})-([0-9]{2})[T ]([0-9]{2}):([0-9]{2}):([0-9]{2})"
+    r"(?:Z|([-+])([0-9]{2}):?([0-9]{2}))?\Z"
+)
+_TIME_ASL = re.compile(
+    r"([0-9]{4})\.([0-9]{2})\.([0-9]{2}) ([0-9]{2}):([0-9]{2}):([0-9]{2}) UTC\Z"
+)
+
+
+#
+# Reference implementation of the expression tests, these mirror
+# the tests in the ASL library. The compiled predicates below use
+# these for uncommon combinations of flags.
+#
+
+
+def _basic_test(op: int, q: str, m: str, n: int) -> bool:
+    t = op & ASL_QUERY_OP_TRUE
+
+    if op & ASL_QUERY_OP_REGEX:
+        if t in (ASL_QUERY_OP_GREATER, ASL_QUERY_OP_LESS):
+            return False
+
+        regex = _regex(q, bool(op & ASL_QUERY_OP_CASEFOLD))
+        if regex is None:
+            # An invalid regular expression matches nothing
+            return bool(t & ASL_QUERY_OP_NOT_EQUAL)
+
+        found = regex.search(m) is not None
+        if t == ASL_QUERY_OP_NOT_EQUAL:
+            return not found
+        return found
+
+    if op & ASL_QUERY_OP_NUMERIC:
+        if _NUMBER.match(q) is None or _NUMBER.match(m) is None:
+            return t == ASL_QUERY_OP_NOT_EQUAL
+
+        nq = int(q)
+        nm = int(m)
+        return _result(t, (nm > nq) - (nm < nq))
+
+    if n:
+        m = m[:n]
+        q = q[:n]
+
+    if op & ASL_QUERY_OP_CASEFOLD:
+        return _result(t, _cmp(_fold(m), _fold(q)))
+    return _result(t, _cmp(m, q))
+
+
+def _test_substring(op: int, q: str, m: str) -> bool:
+    t = op & ASL_QUERY_OP_TRUE
+
+    lq = len(q)
+    lm = len(m)
+
+    # The empty string is a substring of any string
+    if lq == 0:
+        return bool(t & ASL_QUERY_OP_EQUAL)
+
+    if lq > lm:
+        return t == ASL_QUERY_OP_NOT_EQUAL
+
+    if t in (ASL_QUERY_OP_GREATER, ASL_QUERY_OP_LESS):
+        return False
+
+    newop = (op & 0xFF0) | ASL_QUERY_OP_EQUAL
+    found = any(_basic_test(newop, q, m[i:], lq) for i in range(lm - lq + 1))
+    if t & ASL_QUERY_OP_EQUAL:
+        return found
+    return not found
+
+
+def _test_affix(op: int, q: str, m: str) -> bool:
+    t = op & ASL_QUERY_OP_TRUE
+
+    lq = len(q)
+    lm = len(m)
+
+    if lq == 0:
+        return bool(t & ASL_QUERY_OP_EQUAL)
+
+    if lq > lm:
+        return t == ASL_QUERY_OP_NOT_EQUAL
+
+    if op & ASL_QUERY_OP_PREFIX:
+        return _basic_test(op, q, m, lq)
+    return _basic_test(op, q, m[lm - lq :], lq)  # noqa: E203
+
+
+def _test_expression(op: int, q: str, m: str) -> bool:
+    if op & ASL_QUERY_OP_TRUE == ASL_QUERY_OP_TRUE:
+        return True
+
+    if op & ASL_QUERY_OP_PREFIX and op & ASL_QUERY_OP_SUFFIX:
+        return _test_substring(op, q, m)
+
+    if op & (ASL_QUERY_OP_PREFIX | ASL_QUERY_OP_SUFFIX):
+        return _test_affix(op, q, m)
+
+    return _basic_test(op, q, m, 0)
+
+
+def _test_time_expression(op: int, q: str, m: str) -> bool:
+    if op & (ASL_QUERY_OP_PREFIX | ASL_QUERY_OP_SUFFIX | ASL_QUERY_OP_REGEX):
+        return _test_expression(op, q, m)
+
+    tq = _parse_time(q)
+    tm = _parse_time(m) if tq >= 0 else -1
+    if tq < 0 or tm < 0:
+        return _test_expression(op, q, m)
+
+    return _result(op & ASL_QUERY_OP_TRUE, (tm > tq) - (tm < tq))
+
+
+def evaluate(
+    operation: int, query_value: str, value: typing.Optional[str], key: str = ""
+) -> bool:
+    """
+    Test a single query condition against a record value, *value*
+    is None when the record doesn't have the attribute.
+    """
+    t = operation & ASL_QUERY_OP_TRUE
+    if t == ASL_QUERY_OP_TRUE:
+        return value is not None
+    elif t == _OP_FALSE:
+        return value is None
+    elif value is None:
+        return t == ASL_QUERY_OP_NOT_EQUAL
+    elif key == ASL_KEY_TIME:
+        return _test_time_expression(operation, query_value, value)
+    return _test_expression(operation, query_value, value)
+
+
+#
+# Query compilation
+#
+
+_COMPARE_OPS = {
+    ASL_QUERY_OP_EQUAL: "==",
+    ASL_QUERY_OP_GREATER: ">",
+    ASL_QUERY_OP_GREATER_EQUAL: ">=",
+    ASL_QUERY_OP_LESS: "<",
+    ASL_QUERY_OP_LESS_EQUAL: "<=",
+    ASL_QUERY_OP_NOT_EQUAL: "!=",
+}
+
+_COMPARE_FUNCS: typing.Dict[int, typing.Callable[[typing.Any, typing.Any], bool]] = {
+    ASL_QUERY_OP_EQUAL: operator.eq,
+    ASL_QUERY_OP_GREATER: operator.gt,
+    ASL_QUERY_OP_GREATER_EQUAL: operator.ge,
+    ASL_QUERY_OP_LESS: operator.lt,
+    ASL_QUERY_OP_LESS_EQUAL: operator.le,
+    ASL_QUERY_OP_NOT_EQUAL: operator.ne,
+}
+
+
+def _compile_value_test(key: str, q: str, op: int) -> typing.Callable[[str], bool]:
+    """
+    Return a function that tests a present attribute value
+    """
+    t = op & ASL_QUERY_OP_TRUE
+    flags = op & ~ASL_QUERY_OP_TRUE
+    casefold = bool(op & ASL_QUERY_OP_CASEFOLD)
+
+    if key == ASL_KEY_TIME and not flags & (
+        ASL_QUERY_OP_PREFIX | ASL_QUERY_OP_SUFFIX | ASL_QUERY_OP_REGEX
+    ):
+        tq = _parse_time(q)
+        if tq >= 0:
+            fallback = _compile_value_test("", q, op)
+
+            def time_test(m: str) -> bool:
+                tm = _parse_time(m)
+                if tm < 0:
+                    return fallback(m)
+                return _result(t, (tm > tq) - (tm < tq))
+
+            return time_test
+
+    if flags & ~ASL_QUERY_OP_CASEFOLD == ASL_QUERY_OP_REGEX and t in _COMPARE_OPS:
+        if t in (ASL_QUERY_OP_GREATER, ASL_QUERY_OP_LESS):
+            return lambda m: False
+
+        regex = _regex(q, casefold)
+        if regex is None:
+            result = bool(t & ASL_QUERY_OP_NOT_EQUAL)
+            return lambda m: result
+
+        search = regex.search
+        if t == ASL_QUERY_OP_NOT_EQUAL:
+            return lambda m: search(m) is None
+        return lambda m: search(m) is not None
+
+    if flags == ASL_QUERY_OP_NUMERIC and t in _COMPARE_OPS:
+        if _NUMBER.match(q) is None:
+            result = t == ASL_QUERY_OP_NOT_EQUAL
+            return lambda m: result
+
+        nq = int(q)
+        number = _NUMBER.match
+        invalid = t == ASL_QUERY_OP_NOT_EQUAL
+        compare = _COMPARE_FUNCS[t]
+        return lambda m: compare(int(m), nq) if number(m) is not None else invalid
+
+    if flags == ASL_QUERY_OP_CASEFOLD and t in _COMPARE_OPS:
+        fq = _fold(q)
+        compare = _COMPARE_FUNCS[t]
+        return lambda m: compare(_fold(m), fq)
+
+    if flags == 0 and t in _COMPARE_OPS:
+        compare = _COMPARE_FUNCS[t]
+        return lambda m: compare(m, q)
+
+    base = flags & ~ASL_QUERY_OP_CASEFOLD
+    if base in (ASL_QUERY_OP_PREFIX, ASL_QUERY_OP_SUFFIX, ASL_QUERY_OP_SUBSTRING) and q:
+        method: typing.Callable[[str, str], bool]
+        if base == ASL_QUERY_OP_PREFIX:
+            method = str.startswith
+        elif base == ASL_QUERY_OP_SUFFIX:
+            method = str.endswith
+        else:
+            method = str.__contains__
+
+        if t in (ASL_QUERY_OP_EQUAL, ASL_QUERY_OP_NOT_EQUAL) or (
+            base == ASL_QUERY_OP_SUBSTRING and t in _COMPARE_OPS
+        ):
+            if t in (ASL_QUERY_OP_GREATER, ASL_QUERY_OP_LESS):
+                return lambda m: False
+
+            # For substring tests ">=" and "<=" are the same as "=="
+            expected = bool(t & ASL_QUERY_OP_EQUAL)
+            if casefold:
+                fq = _fold(q)
+                return lambda m: method(_fold(m), fq) is expected
+            return lambda m: method(m, q) is expected
+
+    return lambda m: _test_expression(op, q, m)
+
+
+def _terms(query) -> typing.Iterable[Term]:
+    if isinstance(query, Query):
+        return query.terms
+
+    query_items = getattr(query, "query_items", None)
+    if query_items is not None:
+        return query_items()
+
+    return query
+
+
+def compile(query) -> Predicate:
+    """
+    Compile *query* into a predicate that returns true when a record
+    matches the query.
+
+    The query is a :class:`asl.Query`, an :class:`asl.aslmsg` of type
+    ASL_TYPE_QUERY or an iterable of (key, value, operation) tuples.
+    """
+    namespace: typing.Dict[str, typing.Any] = {}
+    clauses = []
+
+    for idx, (key, value, op) in enumerate(_terms(query)):
+        if not isinstance(key, str) or not isinstance(value, str):
+            raise TypeError("Query key and value must be strings")
+
+        t = op & ASL_QUERY_OP_TRUE
+        namespace["k%d" % (idx,)] = key
+        if t == ASL_QUERY_OP_TRUE:
+            clauses.append("k%d in r" % (idx,))
+
+        elif t == _OP_FALSE:
+            clauses.append("k%d not in r" % (idx,))
+
+        elif op in (ASL_QUERY_OP_EQUAL, ASL_QUERY_OP_NOT_EQUAL) and key != ASL_KEY_TIME:
+            # A missing attribute matches "not equal", and doesn't
+            # match "equal".
+            namespace["v%d" % (idx,)] = value
+            clauses.append("r.get(k%d) %s v%d" % (idx, _COMPARE_OPS[op], idx))
+
+        elif op in _COMPARE_OPS and key != ASL_KEY_TIME:
+            namespace["v%d" % (idx,)] = value
+            clauses.append(
+                "(k%d in r and r[k%d] %s v%d)" % (idx, idx, _COMPARE_OPS[op], idx)
+            )
+
+        else:
+            namespace["t%d" % (idx,)] = _compile_value_test(key, value, op)
+            if t == ASL_QUERY_OP_NOT_EQUAL:
+                # A missing attribute matches "not equal"
+                clauses.append("(k%d not in r or t%d(r[k%d]))" % (idx, idx, idx))
+            else:
+                clauses.append("(k%d in r and t%d(r[k%d]))" % (idx, idx, idx))
+
+    source = "lambda r: %s" % (" and ".join(clauses) or "True",)
+    return typing.cast(Predicate, eval(source, namespace))
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_cached(terms: typing.Tuple[Term, ...]) -> Predicate:
+    return compile(terms)
+
+
+def matches(query, record: Record) -> bool:
+    """
+    Return true if *record* matches *query*. Compiled queries are
+    cached, but use :func:`compile` when testing a lot of records.
+    """
+    return _compile_cached(tuple(_terms(query)))(record)
+
+
+def filter(query, records: typing.Iterable[Record]) -> typing.Iterator[Record]:
+    """
+    Yield the records from *records* that match *query*
+    """
+    predicate = compile(query)
+    for record in records:
+        if predicate(record):
+            yield record
@@ -0,0 +1,916 @@
+"""
+Reader for ASL store files
+
+The ASL library stores messages in files with a binary format, such
+as the files in /var/log/asl. This module reads those files without
+using the ASL library, which makes it possible to analyze archived
+log files on other platforms.
+
+The file is mapped into memory. Records are decoded when they are
+read, strings that are shared between records are decoded once.
+"""
+import bisect
+import concurrent.futures
+import fnmatch
+import heapq
+import mmap
+import operator
+import os
+import struct
+import sys
+import typing
+
+from ._constants import (
+    ASL_KEY_FACILITY,
+    ASL_KEY_GID,
+    ASL_KEY_HOST,
+    ASL_KEY_LEVEL,
+    ASL_KEY_MSG,
+    ASL_KEY_MSG_ID,
+    ASL_KEY_PID,
+    ASL_KEY_READ_GID,
+    ASL_KEY_READ_UID,
+    ASL_KEY_REF_PID,
+    ASL_KEY_REF_PROC,
+    ASL_KEY_SENDER,
+    ASL_KEY_SESSION,
+    ASL_KEY_TIME,
+    ASL_KEY_TIME_NSEC,
+    ASL_KEY_UID,
+    ASL_MATCH_DIRECTION_FORWARD,
+    ASL_MATCH_DIRECTION_REVERSE,
+    ASL_QUERY_OP_EQUAL,
+    ASL_QUERY_OP_GREATER,
+    ASL_QUERY_OP_GREATER_EQUAL,
+    ASL_QUERY_OP_LESS,
+    ASL_QUERY_OP_LESS_EQUAL,
+    ASL_QUERY_OP_NUMERIC,
+    ASL_TYPE_MSG,
+)
+
+__all__ = ("ASLFileReader", "search_dir")
+
+Record = typing.Dict[str, str]
+Timestamp = typing.Tuple[int, int]
+TimeValue = typing.Union[int, float, str]
+
+# Maximum number of decoded strings that are cached per file
+STRING_CACHE_SIZE = 4096
+
+# Number of records per block in the time index
+INDEX_INTERVAL = 1024
+
+# Number of index blocks that search_dir searches in one task
+SEARCH_CHUNK_BLOCKS = 16
+
+# All integers are stored in big-endian byte order.
+#
+# File header: cookie, version, offset of the first record, creation
+# time, string cache size, filter mask, offset of the last record.
+_HEADER = struct.Struct(">12sIQQIBQ")
+_HEADER_LEN = 80
+_COOKIE = b"ASL DB".ljust(12, b"\0")
+_VERSION = 2
+
+_TYPE_MSG = 0
+_TYPE_STR = 1
+
+# Message record: type, length, next, ID, ReadUID, ReadGID, Time,
+# TimeNanoSec, Level, flags, PID, UID, GID, RefPID, number of items
+# in the key/value list, and string references for Host, Sender,
+# Facility, Message, RefProc and Session. These are followed by the
+# key/value list and the offset of the previous record.
+_RECORD = struct.Struct(">HIQQIIQIHHIIIIIQQQQQQ")
+_NEXT = struct.Struct(">6xQ")
+_TIME = struct.Struct(">30xQI")
+_KVCOUNT = struct.Struct(">62xI")
+_STRING = struct.Struct(">HI")
+_XID = struct.Struct(">Q")
+
+_FLAG_READ_UID_SET = 0x1
+_FLAG_READ_GID_SET = 0x2
+
+# Strings of up to 7 bytes are stored in the reference itself
+_IMMEDIATE = 0x8000000000000000
+
+# Persistent time index: magic, size, creation time and offset of the
+# last record of the indexed file, number of blocks. Followed by the
+# blocks: offset of the first and last record, number of records,
+# minimum and maximum Time.
+_INDEX_HEADER = struct.Struct(">8sQQQI")
+_INDEX_BLOCK = struct.Struct(">QQIqq")
+_INDEX_MAGIC = b"ASLTIDX1"
+
+
+class ASLFileReader:
+    """
+    Reader for an ASL store file.
+
+    Iterating over the reader yields all records in the file,
+    in the order they were written, as dicts.
+
+    Reading records in a time window uses a sparse index of the file,
+    which is built when needed. The index is stored in *index_path*
+    when that is not None, and read from that file when it is
+    up-to-date.
+    """
+
+    def __init__(
+        self,
+        path: typing.Union[str, "os.PathLike[str]"],
+        index_path: typing.Optional[typing.Union[str, "os.PathLike[str]"]] = None,
+    ):
+        self.path = os.fspath(path)
+        self.index_path = None if index_path is None else os.fspath(index_path)
+        self._index: typing.Optional[_TimeIndex] = None
+        self._strings = _StringTable(self._read_string)
+        self._kvlist: typing.Dict[int, struct.Struct] = {}
+
+        with open(self.path, "rb") as stream:
+            if os.fstat(stream.fileno()).st_size < _HEADER_LEN:
+                raise ValueError("%r is not an ASL store file" % (self.path,))
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        cookie, version, first, created, _, _, last = _HEADER.unpack_from(self._map)
+        if cookie != _COOKIE:
+            self.close()
+            raise ValueError("%r is not an ASL store file" % (self.path,))
+        if version != _VERSION:
+            self.close()
+            raise ValueError("Unsupported ASL store version %d" % (version,))
+
+        #: The version of the file format
+        self.version: int = version
+
+        #: The creation time of the file (seconds since the epoch)
+        self.created: int = created
+
+        self._first = first
+        self._last = last
+
+    def __repr__(self) -> str:
+        return "<%s %r>" % (type(self).__name__, self.path)
+
+    def __enter__(self) -> "ASLFileReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._map.closed
+
+    def close(self) -> None:
+        """
+        Close the reader, records cannot be read after this
+        """
+        self._map.close()
+        self._strings.clear()
+
+    def __iter__(self) -> typing.Iterator[Record]:
+        return self.records()
+
+    def _next(self, offset: int) -> int:
+        try:
+            (next_offset,) = _NEXT.unpack_from(self._map, offset)
+        except struct.error:
+            next_offset = -1
+        if next_offset and next_offset <= offset:
+            # Records are only appended, a link to an earlier
+            # record means the file is corrupt.
+            raise ValueError("Invalid ASL store record at offset %d" % (offset,))
+        return next_offset
+
+    def _prev(self, offset: int) -> int:
+        try:
+            (kvcount,) = _KVCOUNT.unpack_from(self._map, offset)
+            (prev_offset,) = _XID.unpack_from(
+                self._map, offset + _RECORD.size + 8 * kvcount
+            )
+        except struct.error:
+            prev_offset = -1
+        if prev_offset and not (_HEADER_LEN <= prev_offset < offset):
+            raise ValueError("Invalid ASL store record at offset %d" % (offset,))
+        return prev_offset
+
+    def _offsets(
+        self,
+        lower: typing.Optional[Timestamp] = None,
+        upper: typing.Optional[Timestamp] = None,
+        direction: int = ASL_MATCH_DIRECTION_FORWARD,
+    ) -> typing.Iterator[int]:
+        """
+        Yield the offsets of the records with a time in the
+        range [lower, upper), in the order given by *direction*.
+        """
+        if direction not in (ASL_MATCH_DIRECTION_FORWARD, ASL_MATCH_DIRECTION_REVERSE):
+            raise ValueError("Invalid direction %r" % (direction,))
+
+        if lower is None and upper is None:
+            if direction == ASL_MATCH_DIRECTION_FORWARD:
+                offset, step = self._first, self._next
+            else:
+                offset, step = self._last, self._prev
+
+            while offset:
+                yield offset
+                offset = step(offset)
+            return
+
+        if self._index is None:
+            self.build_index()
+        assert self._index is not None
+
+        lower_sec = None if lower is None else lower[0]
+        upper_sec = None if upper is None else upper[0]
+        if direction == ASL_MATCH_DIRECTION_FORWARD:
+            blocks = self._index.forward(lower_sec, upper_sec)
+        else:
+            blocks = self._index.reverse(lower_sec, upper_sec)
+
+        yield from self._block_offsets(blocks, lower, upper, direction)
+
+    def _block_offsets(
+        self,
+        blocks: typing.Iterable[typing.Tuple[int, int, int]],
+        lower: typing.Optional[Timestamp],
+        upper: typing.Optional[Timestamp],
+        direction: int,
+    ) -> typing.Iterator[int]:
+        """
+        Yield the offsets of the records in *blocks* (see _TimeIndex)
+        with a time in the range [lower, upper).
+        """
+        unpack_time = _TIME.unpack_from
+        for first, last, count in blocks:
+            if direction == ASL_MATCH_DIRECTION_FORWARD:
+                offset, step = first, self._next
+            else:
+                offset, step = last, self._prev
+
+            for idx in range(count):
+                if idx:
+                    offset = step(offset)
+                try:
+                    timestamp = unpack_time(self._map, offset)
+                except struct.error:
+                    raise ValueError(
+                        "Invalid ASL store record at offset %d" % (offset,)
+                    ) from None
+                if (lower is None or timestamp >= lower) and (
+                    upper is None or timestamp < upper
+                ):
+                    yield offset
+
+    def build_index(self) -> None:
+        """
+        Build the time index, or read it from *index_path* when that
+        is up-to-date. The index is written to *index_path* when it
+        is built.
+        """
+        if self.index_path is not None:
+            self._index = self._load_index(self.index_path)
+            if self._index is not None:
+                return
+
+        blocks = []
+        count = first = last = tmin = tmax = 0
+        for offset in self._offsets():
+            try:
+                (seconds, _) = _TIME.unpack_from(self._map, offset)
+            except struct.error:
+                raise ValueError(
+                    "Invalid ASL store record at offset %d" % (offset,)
+                ) from None
+
+            if count == 0:
+                first = offset
+                tmin = tmax = seconds
+            elif seconds < tmin:
+                tmin = seconds
+            elif seconds > tmax:
+                tmax = seconds
+
+            last = offset
+            count += 1
+            if count == INDEX_INTERVAL:
+                blocks.append((first, last, count, tmin, tmax))
+                count = 0
+
+        if count:
+            blocks.append((first, last, count, tmin, tmax))
+
+        self._index = _TimeIndex(blocks)
+        if self.index_path is not None:
+            self._save_index(self.index_path, self._index)
+
+    def _load_index(self, path: str) -> typing.Optional["_TimeIndex"]:
+        try:
+            with open(path, "rb") as stream:
+                data = stream.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            magic, size, created, last, count = _INDEX_HEADER.unpack_from(data)
+            if magic != _INDEX_MAGIC or (size, created, last) != (
+                len(self._map),
+                self.created,
+                self._last,
+            ):
+                return None
+
+            blocks: typing.List[typing.Tuple[int, int, int, int, int]] = [
+                _INDEX_BLOCK.unpack_from(
+                    data, _INDEX_HEADER.size + idx * _INDEX_BLOCK.size
+                )
+                for idx in range(count)
+            ]
+        except struct.error:
+            return None
+
+        return _TimeIndex(blocks)
+
+    def _save_index(self, path: str, index: "_TimeIndex") -> None:
+        data = bytearray(
+            _INDEX_HEADER.pack(
+                _INDEX_MAGIC,
+                len(self._map),
+                self.created,
+                self._last,
+                len(index.blocks),
+            )
+        )
+        for block in index.blocks:
+            data += _INDEX_BLOCK.pack(*block)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as stream:
+            stream.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_string(self, xid: int) -> str:
+        if xid & _IMMEDIATE:
+            length = (xid >> 56) & 0x0F
+            data = _XID.pack(xid)[1 : 1 + length]  # noqa: E203
+            return data.decode("utf-8", "replace")
+
+        try:
+            kind, length = _STRING.unpack_from(self._map, xid)
+        except struct.error:
+            kind = length = -1
+        if kind != _TYPE_STR or xid + _STRING.size + length > len(self._map):
+            raise ValueError("Invalid ASL store string at offset %d" % (xid,))
+
+        start = xid + _STRING.size
+        data = self._map[start : start + length]  # noqa: E203
+        if data.endswith(b"\0"):
+            data = data[:-1]
+        return data.decode("utf-8", "replace")
+
+    def _decode(
+        self, offset: int, wanted: typing.Optional[typing.Container[str]] = None
+    ) -> Record:
+        """
+        Decode the record at *offset*. When *wanted* is not None strings
+        are only decoded for attributes in *wanted*, other attributes
+        might be included as well.
+        """
+        try:
+            (
+                kind,
+                _,
+                _,
+                msgid,
+                ruid,
+                rgid,
+                seconds,
+                nsec,
+                level,
+                flags,
+                pid,
+                uid,
+                gid,
+                refpid,
+                kvcount,
+                host,
+                sender,
+                facility,
+                message,
+                refproc,
+                session,
+            ) = _RECORD.unpack_from(self._map, offset)
+        except struct.error:
+            kind = -1
+
+        if kind != _TYPE_MSG:
+            raise ValueError("Invalid ASL store record at offset %d" % (offset,))
+
+        record = {
+            ASL_KEY_MSG_ID: str(msgid),
+            ASL_KEY_TIME: str(seconds),
+            ASL_KEY_TIME_NSEC: str(nsec),
+            ASL_KEY_LEVEL: str(level),
+            ASL_KEY_PID: str(pid),
+            ASL_KEY_UID: str(uid),
+            ASL_KEY_GID: str(gid),
+        }
+        if flags & _FLAG_READ_UID_SET:
+            record[ASL_KEY_READ_UID] = str(ruid)
+        if flags & _FLAG_READ_GID_SET:
+            record[ASL_KEY_READ_GID] = str(rgid)
+        if refpid:
+            record[ASL_KEY_REF_PID] = str(refpid)
+
+        strings = self._strings
+        if host and (wanted is None or ASL_KEY_HOST in wanted):
+            record[ASL_KEY_HOST] = strings[host]
+        if sender and (wanted is None or ASL_KEY_SENDER in wanted):
+            record[ASL_KEY_SENDER] = strings[sender]
+        if facility and (wanted is None or ASL_KEY_FACILITY in wanted):
+            record[ASL_KEY_FACILITY] = strings[facility]
+        if message and (wanted is None or ASL_KEY_MSG in wanted):
+            # Messages are rarely shared, don't pollute the cache with them
+            record[ASL_KEY_MSG] = self._read_string(message)
+        if refproc and (wanted is None or ASL_KEY_REF_PROC in wanted):
+            record[ASL_KEY_REF_PROC] = strings[refproc]
+        if session and (wanted is None or ASL_KEY_SESSION in wanted):
+            record[ASL_KEY_SESSION] = strings[session]
+
+        if kvcount > 1:
+            try:
+                kvlist = self._kvlist[kvcount]
+            except KeyError:
+                kvlist = self._kvlist[kvcount] = struct.Struct(">%dQ" % (kvcount,))
+
+            try:
+                xids = kvlist.unpack_from(self._map, offset + _RECORD.size)
+            except struct.error:
+                raise ValueError(
+                    "Invalid ASL store record at offset %d" % (offset,)
+                ) from None
+
+            for idx in range(0, kvcount - 1, 2):
+                key = xids[idx]
+                if not key:
+                    continue
+                name = strings[key]
+                if wanted is None or name in wanted:
+                    value = xids[idx + 1]
+                    record[name] = strings[value] if value else ""
+
+        return record
+
+    def records(
+        self,
+        fields: typing.Optional[typing.Sequence[str]] = None,
+        *,
+        start: typing.Optional[TimeValue] = None,
+        end: typing.Optional[TimeValue] = None,
+        direction: int = ASL_MATCH_DIRECTION_FORWARD,
+    ) -> typing.Iterator[typing.Any]:
+        """
+        Yield all records as dicts, or as tuples with the values of
+        *fields* (None for missing attributes) when *fields* is not None.
+
+        Only records with a time in [start, end) are returned when
+        *start* or *end* is not None. The records are returned in the
+        order they were written, or in reverse order when *direction*
+        is ASL_MATCH_DIRECTION_REVERSE.
+        """
+        offsets = self._offsets(_time_bound(start), _time_bound(end), direction)
+        if fields is None:
+            for offset in offsets:
+                yield self._decode(offset)
+
+        else:
+            fields = _check_fields(fields)
+            wanted = frozenset(fields)
+            for offset in offsets:
+                record = self._decode(offset, wanted)
+                yield tuple(record.get(name) for name in fields)
+
+    def messages(self, **kwds: typing.Any) -> typing.Iterator[typing.Any]:
+        """
+        Yield records as :class:`asl.aslmsg` instances, the keyword
+        arguments are those of :meth:`records`.
+        """
+        from ._backend import aslmsg
+
+        for record in self.records(**kwds):
+            yield aslmsg(ASL_TYPE_MSG, record)
+
+    def search(
+        self,
+        query,
+        fields: typing.Optional[typing.Sequence[str]] = None,
+        *,
+        start: typing.Optional[TimeValue] = None,
+        end: typing.Optional[TimeValue] = None,
+        direction: int = ASL_MATCH_DIRECTION_FORWARD,
+    ) -> typing.Iterator[typing.Any]:
+        """
+        Yield the records that match *query* (see :mod:`asl.match`),
+        as dicts or as tuples when *fields* is not None. The other
+        arguments are those of :meth:`records`.
+
+        Conditions on the Time attribute in the query are used to limit
+        the records that are read, like *start* and *end*.
+        """
+        from . import match
+
+        terms = tuple(match._terms(query))
+        lower, upper = _search_window(terms, start, end)
+        yield from self._search(terms, fields, lower, upper, direction)
+
+    def _search(
+        self,
+        terms: typing.Tuple[typing.Tuple[str, str, int], ...],
+        fields: typing.Optional[typing.Sequence[str]],
+        lower: typing.Optional[Timestamp],
+        upper: typing.Optional[Timestamp],
+        direction: int = ASL_MATCH_DIRECTION_FORWARD,
+        blocks: typing.Optional[typing.Iterable[typing.Tuple[int, int, int]]] = None,
+    ) -> typing.Iterator[typing.Any]:
+        from . import match
+
+        predicate = match.compile(terms)
+        if blocks is None:
+            offsets = self._offsets(lower, upper, direction)
+        else:
+            offsets = self._block_offsets(blocks, lower, upper, direction)
+        if fields is None:
+            for offset in offsets:
+                record = self._decode(offset)
+                if predicate(record):
+                    yield record
+
+        else:
+            fields = _check_fields(fields)
+            wanted = frozenset(fields).union(term[0] for term in terms)
+            for offset in offsets:
+                record = self._decode(offset, wanted)
+                if predicate(record):
+                    yield tuple(record.get(name) for name in fields)
+
+
+def search_dir(
+    path: typing.Union[str, "os.PathLike[str]"],
+    query,
+    fields: typing.Optional[typing.Sequence[str]] = None,
+    *,
+    workers: typing.Optional[int] = None,
+    start: typing.Optional[TimeValue] = None,
+    end: typing.Optional[TimeValue] = None,
+    pattern: str = "*.asl",
+) -> typing.Generator[typing.Any, None, None]:
+    """
+    Yield the records that match *query* in all ASL store files in
+    directory *path* whose name matches *pattern*, ordered by time.
+
+    Files are searched in a pool of *workers* processes, in chunks of
+    SEARCH_CHUNK_BLOCKS index blocks. Records are yielded as soon as no
+    chunk that is still being searched can contain an earlier record.
+    The other arguments are those of :meth:`ASLFileReader.search`.
+    """
+    from . import match
+
+    # Check the arguments before starting workers
+    terms = tuple(match._terms(query))
+    match.compile(terms)
+    lower, upper = _search_window(terms, start, end)
+    if fields is not None:
+        fields = _check_fields(fields)
+
+    path = os.fspath(path)
+    paths = sorted(
+        os.path.join(path, name)
+        for name in os.listdir(path)
+        if fnmatch.fnmatch(name, pattern)
+    )
+    if not paths:
+        return
+
+    executor = concurrent.futures.ProcessPoolExecutor(workers)
+    futures: typing.Dict[concurrent.futures.Future, typing.Tuple[int, int]] = {}
+    try:
+        # Searching starts with building the time index of every file,
+        # this is cheap compared to decoding records. The index is used
+        # to skip blocks outside of the time window and to split the
+        # search of large files into chunks.
+        lower_sec = None if lower is None else lower[0]
+        upper_sec = None if upper is None else upper[0]
+        for file_path, blocks in zip(paths, executor.map(_file_index, paths)):
+            blocks = [
+                block
+                for block in blocks
+                if (lower_sec is None or block[4] >= lower_sec)
+                and (upper_sec is None or block[3] <= upper_sec)
+            ]
+            for idx in range(0, len(blocks), SEARCH_CHUNK_BLOCKS):
+                chunk = blocks[idx : idx + SEARCH_CHUNK_BLOCKS]  # noqa: E203
+                future = executor.submit(
+                    _search_file,
+                    file_path,
+                    [block[:3] for block in chunk],
+                    terms,
+                    fields,
+                    lower,
+                    upper,
+                )
+                futures[future] = (len(futures), min(block[3] for block in chunk))
+
+        yield from _merge(futures)
+
+    finally:
+        # Don't wait for searches whose results are no longer needed
+        for future in futures:
+            future.cancel()
+        if sys.version_info >= (3, 9):
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            executor.shutdown(wait=False)
+
+
+def _file_index(path: str) -> typing.Sequence[typing.Tuple[int, int, int, int, int]]:
+    with ASLFileReader(path) as reader:
+        reader.build_index()
+        assert reader._index is not None
+        return reader._index.blocks
+
+
+def _search_file(
+    path: str,
+    blocks: typing.List[typing.Tuple[int, int, int]],
+    terms: typing.Tuple[typing.Tuple[str, str, int], ...],
+    fields: typing.Optional[typing.Tuple[str, ...]],
+    lower: typing.Optional[Timestamp],
+    upper: typing.Optional[Timestamp],
+) -> typing.List[typing.Tuple[Timestamp, typing.Any]]:
+    """
+    Search *blocks* of one file, returns a list of (timestamp, result)
+    sorted by timestamp.
+    """
+    with ASLFileReader(path) as reader:
+        if fields is None:
+            results = [
+                ((int(record[ASL_KEY_TIME]), int(record[ASL_KEY_TIME_NSEC])), record)
+                for record in reader._search(terms, None, lower, upper, blocks=blocks)
+            ]
+        else:
+            results = [
+                ((int(row[-2]), int(row[-1])), row[:-2])
+                for row in reader._search(
+                    terms,
+                    fields + (ASL_KEY_TIME, ASL_KEY_TIME_NSEC),
+                    lower,
+                    upper,
+                    blocks=blocks,
+                )
+            ]
+
+    results.sort(key=operator.itemgetter(0))
+    return results
+
+
+def _merge(
+    futures: typing.Dict[concurrent.futures.Future, typing.Tuple[int, int]]
+) -> typing.Iterator[typing.Any]:
+    """
+    Merge the results of *futures* (see _search_file) as they complete.
+    *futures* maps a future to the number of the chunk, in file order,
+    and the minimum time of the records in that chunk.
+    """
+    pending = dict(futures)
+    heap: typing.List[typing.Tuple[Timestamp, int, int, list]] = []
+
+    for future in concurrent.futures.as_completed(futures):
+        chunkno, _ = pending.pop(future)
+        results = future.result()
+        if results:
+            heapq.heappush(heap, (results[0][0], chunkno, 0, results))
+
+        frontier = min((tmin for _, tmin in pending.values()), default=None)
+        while heap and (frontier is None or heap[0][0][0] < frontier):
+            _, chunkno, pos, results = heapq.heappop(heap)
+            yield results[pos][1]
+
+            pos += 1
+            if pos < len(results):
+                heapq.heappush(heap, (results[pos][0], chunkno, pos, results))
+
+
+class _TimeIndex:
+    """
+    Sparse index of a store file. The file is split into blocks of
+    consecutive records, for every block the index contains the offsets
+    of the first and last record, the number of records and the minimum
+    and maximum Time of the records.
+
+    Time is not necessarily increasing in a file, the running maximum
+    and minimum of block times are used to find the range of blocks
+    that can contain records for a time window.
+    """
+
+    def __init__(self, blocks: typing.Sequence[typing.Tuple[int, int, int, int, int]]):
+        self.blocks = blocks
+
+        self._prefix_max: typing.List[int] = []
+        for block in blocks:
+            if self._prefix_max and self._prefix_max[-1] > block[4]:
+                self._prefix_max.append(self._prefix_max[-1])
+            else:
+                self._prefix_max.append(block[4])
+
+        self._suffix_min: typing.List[int] = []
+        for block in reversed(blocks):
+            if self._suffix_min and self._suffix_min[-1] < block[3]:
+                self._suffix_min.append(self._suffix_min[-1])
+            else:
+                self._suffix_min.append(block[3])
+        self._suffix_min.reverse()
+
+    def _matches(
+        self, idx: int, lower: typing.Optional[int], upper: typing.Optional[int]
+    ) -> bool:
+        _, _, _, tmin, tmax = self.blocks[idx]
+        return (lower is None or tmax >= lower) and (upper is None or tmin <= upper)
+
+    def forward(
+        self, lower: typing.Optional[int], upper: typing.Optional[int]
+    ) -> typing.Iterator[typing.Tuple[int, int, int]]:
+        """
+        Yield (first, last, count) for the blocks that can contain
+        records with a time in [lower, upper], in file order.
+        """
+        if lower is None:
+            idx = 0
+        else:
+            # All earlier blocks only contain records before lower
+            idx = bisect.bisect_left(self._prefix_max, lower)
+
+        while idx < len(self.blocks):
+            if upper is not None and self._suffix_min[idx] > upper:
+                # All later blocks only contain records after upper
+                break
+            if self._matches(idx, lower, upper):
+                yield self.blocks[idx][:3]
+            idx += 1
+
+    def reverse(
+        self, lower: typing.Optional[int], upper: typing.Optional[int]
+    ) -> typing.Iterator[typing.Tuple[int, int, int]]:
+        """
+        Yield (first, last, count) for the blocks that can contain
+        records with a time in [lower, upper], in reverse file order.
+        """
+        if upper is None:
+            idx = len(self.blocks) - 1
+        else:
+            idx = bisect.bisect_right(self._suffix_min, upper) - 1
+
+        while idx >= 0:
+            if lower is not None and self._prefix_max[idx] < lower:
+                break
+            if self._matches(idx, lower, upper):
+                yield self.blocks[idx][:3]
+            idx -= 1
+
+
+def _time_bound(value: typing.Optional[TimeValue]) -> typing.Optional[Timestamp]:
+    """
+    Convert a time to a (seconds, nanoseconds) tuple. Strings are
+    parsed like values for the Time attribute in queries.
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, str):
+        from . import match
+
+        seconds = match._parse_time(value)
+        if seconds == -1:
+            raise ValueError("Invalid time %r" % (value,))
+        return (seconds, 0)
+
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(
+            "Expecting a number or string, got instance of '%s'"
+            % (type(value).__name__,)
+        )
+
+    seconds = int(value // 1)
+    return (seconds, int((value - seconds) * 1000000000))
+
+
+def _search_window(
+    terms: typing.Iterable[typing.Tuple[str, str, int]],
+    start: typing.Optional[TimeValue],
+    end: typing.Optional[TimeValue],
+) -> typing.Tuple[typing.Optional[Timestamp], typing.Optional[Timestamp]]:
+    """
+    Return the time window [lower, upper) for a search with
+    a query and an explicit start and end time.
+    """
+    lower, upper = _query_window(terms)
+
+    start_bound = _time_bound(start)
+    if start_bound is not None and (lower is None or start_bound > lower):
+        lower = start_bound
+
+    end_bound = _time_bound(end)
+    if end_bound is not None and (upper is None or end_bound < upper):
+        upper = end_bound
+
+    return lower, upper
+
+
+def _query_window(
+    terms: typing.Iterable[typing.Tuple[str, str, int]]
+) -> typing.Tuple[typing.Optional[Timestamp], typing.Optional[Timestamp]]:
+    """
+    Return the time window [lower, upper) for the conditions on the
+    Time attribute in a query. The window can be larger than the set of
+    matching times, it is only used to skip records.
+    """
+    from . import match
+
+    lower: typing.Optional[int] = None
+    upper: typing.Optional[int] = None
+    for key, value, op in terms:
+        if key != ASL_KEY_TIME:
+            continue
+
+        op &= ~ASL_QUERY_OP_NUMERIC
+        if op not in (
+            ASL_QUERY_OP_EQUAL,
+            ASL_QUERY_OP_GREATER,
+            ASL_QUERY_OP_GREATER_EQUAL,
+            ASL_QUERY_OP_LESS,
+            ASL_QUERY_OP_LESS_EQUAL,
+        ):
+            continue
+
+        seconds = match._parse_time(value)
+        if seconds == -1:
+            continue
+
+        # Relative times are evaluated again when the query is compiled
+        slack = 1 if value[:1] in ("+", "-") else 0
+
+        low: typing.Optional[int]
+        high: typing.Optional[int]
+        if op in (ASL_QUERY_OP_EQUAL, ASL_QUERY_OP_GREATER_EQUAL):
+            low = seconds - slack
+        elif op == ASL_QUERY_OP_GREATER:
+            low = seconds + 1 - slack
+        else:
+            low = None
+
+        if op in (ASL_QUERY_OP_EQUAL, ASL_QUERY_OP_LESS_EQUAL):
+            high = seconds + 1 + slack
+        elif op == ASL_QUERY_OP_LESS:
+            high = seconds + slack
+        else:
+            high = None
+
+        if low is not None and (lower is None or low > lower):
+            lower = low
+        if high is not None and (upper is None or high < upper):
+            upper = high
+
+    return (
+        None if lower is None else (lower, 0),
+        None if upper is None else (upper, 0),
+    )
+
+
+class _StringTable(dict):
+    """
+    Cache of decoded strings, keyed by string reference. The cache
+    is cleared when it contains STRING_CACHE_SIZE strings.
+    """
+
+    def __init__(self, read: typing.Callable[[int], str]):
+        super().__init__()
+        self._read = read
+
+    def __missing__(self, xid: int) -> str:
+        value = self._read(xid)
+        if len(self) >= STRING_CACHE_SIZE:
+            self.clear()
+        self[xid] = value
+        return value
+
+
+def _check_fields(fields: typing.Sequence[str]) -> typing.Tuple[str, ...]:
+    if isinstance(fields, str):
+        raise TypeError("fields must be a sequence of strings, not a string")
+    fields = tuple(fields)
+    for name in fields:
+        if not isinstance(name, str):
+            raise TypeError(
+                "Expecting a string, got instance of '%s'" % (type(name).__name__,)
+            )
+    return fields
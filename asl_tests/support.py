@@ -0,0 +1,21 @@
+"""
+Helpers shared by the asl unit tests
+"""
+import asl
+
+
+def has_feature(name):
+    """
+    True if the asl module provides *name*, a module attribute or
+    a dotted name like "aslclient.log_descriptor".
+
+    Features that require a newer macOS release are left out of the
+    extension when it is built for an older release, the pure Python
+    backend (``asl.BACKEND == "python"``) provides all of them.
+    """
+    obj = asl
+    for part in name.split("."):
+        if not hasattr(obj, part):
+            return False
+        obj = getattr(obj, part)
+    return True
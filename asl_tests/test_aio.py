@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+import unittest
+from unittest import mock
+
+import asl
+import asl.aio
+
+
+class TestAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def query(self, tag):
+        return asl.Field(asl.ASL_KEY_MSG).startswith(tag)
+
+    def test_send_search(self):
+        tag = "aio %d %d " % (os.getpid(), id(self))
+
+        async def main():
+            async with asl.aio.AsyncClient("ident", "facility") as cli:
+                self.assertFalse(cli.closed)
+                cli.set_filter(asl.ASL_FILTER_MASK_UPTO(asl.ASL_LEVEL_DEBUG))
+
+                await cli.send(asl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_MSG: tag}))
+                await asyncio.gather(
+                    *[
+                        cli.log(None, asl.ASL_LEVEL_ERR, "%s%d", tag, i)
+                        for i in range(10)
+                    ]
+                )
+                self.assertEqual(
+                    await cli.send_many([{asl.ASL_KEY_MSG: "%smany" % (tag,)}] * 2), 2
+                )
+
+                records = []
+                async for record in cli.search(self.query(tag), prefetch=3):
+                    records.append(record)
+
+                rows = await cli.search(
+                    self.query(tag).compile(), fields=[asl.ASL_KEY_MSG]
+                ).fetch()
+
+            self.assertTrue(cli.closed)
+            return records, rows
+
+        records, rows = self.run_async(main())
+
+        self.assertEqual(len(records), 13)
+        for record in records:
+            self.assertIsInstance(record, asl.Record)
+            self.assertEqual(record[asl.ASL_KEY_SENDER], "ident")
+        self.assertEqual(records[0][asl.ASL_KEY_MSG], tag)
+        self.assertEqual(
+            sorted(r[asl.ASL_KEY_MSG] for r in records[1:11]),
+            sorted("%s%d" % (tag, i) for i in range(10)),
+        )
+
+        self.assertEqual(
+            [r.asdict() for r in rows],
+            [{asl.ASL_KEY_MSG: r[asl.ASL_KEY_MSG]} for r in records],
+        )
+
+    def test_worker_threads(self):
+        threads = set()
+
+        async def main():
+            cli = asl.aio.AsyncClient(max_workers=2)
+            original = cli._call
+
+            def _call(*args):
+                threads.add(threading.get_ident())
+                return original(*args)
+
+            try:
+                with mock.patch.object(cli, "_call", _call):
+                    await cli.search(self.query("aio-none")).fetch()
+            finally:
+                await cli.close()
+
+            with self.assertRaises(ValueError):
+                await cli.log(None, asl.ASL_LEVEL_ERR, "closed")
+            self.assertRaises(ValueError, cli.search, self.query("aio"))
+            self.assertRaises(ValueError, cli.set_filter, 0)
+
+        self.run_async(main())
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_early_close(self):
+        tag = "aio-close %d %d " % (os.getpid(), id(self))
+
+        async def main():
+            async with asl.aio.AsyncClient() as cli:
+                await cli.send_many([{asl.ASL_KEY_MSG: tag}] * 5)
+                response = cli.search(self.query(tag), prefetch=2)
+                first = await response.__anext__()
+                await response.aclose()
+                with self.assertRaises(StopAsyncIteration):
+                    await response.__anext__()
+                return first
+
+        self.assertEqual(self.run_async(main())[asl.ASL_KEY_MSG], tag)
+
+    def test_arguments(self):
+        self.assertRaises(TypeError, asl.aio.AsyncClient, 42)
+        self.assertRaises(ValueError, asl.aio.AsyncClient, max_workers=0)
+        self.assertRaises(ValueError, asl.aio.AsyncClient, prefetch=0)
+
+        async def main():
+            async with asl.aio.AsyncClient() as cli:
+                self.assertRaises(TypeError, cli.set_filter, "0")
+                self.assertRaises(ValueError, cli.search, self.query("aio"), prefetch=0)
+
+        self.run_async(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,320 @@
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+import unittest
+from unittest import mock
+
+import asl
+from asl import __main__ as cli_main
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tag = "asl-cli-%d-%d" % (os.getpid(), time.time() * 1e6)
+        self.client = asl.aslclient(self.tag, "user", 0)
+        self.addCleanup(self.client.close)
+
+    def log(self, text, **kwds):
+        msg = asl.aslmsg(asl.ASL_TYPE_MSG, kwds)
+        msg[asl.ASL_KEY_READ_UID] = str(os.getuid())
+        self.client.log(msg, asl.ASL_LEVEL_ERR, text)
+
+    def run_main(self, *args, stdin=b""):
+        buffer = io.BytesIO()
+        stdout = io.TextIOWrapper(buffer, encoding="utf-8")
+        with mock.patch.object(sys, "argv", ["asl"] + list(args)):
+            with mock.patch.object(
+                sys, "stdin", io.TextIOWrapper(io.BytesIO(stdin), encoding="utf-8")
+            ):
+                with mock.patch.object(sys, "stdout", stdout):
+                    cli_main.main()
+                    stdout.flush()
+        return buffer.getvalue().decode("utf-8")
+
+    def messages(self):
+        query = asl.Field(asl.ASL_KEY_SENDER) == self.tag
+        return [r[asl.ASL_KEY_MSG] for r in query.search(self.client).fetch_records()]
+
+    def test_query_format(self):
+        self.log("first")
+        self.log("second")
+
+        output = self.run_main(
+            "query", "-k", asl.ASL_KEY_SENDER, "eq", self.tag, "-f", "{Message}"
+        )
+        self.assertEqual(output, "first\nsecond\n")
+
+    def test_sendlog_stdin(self):
+        stdin = "\n".join(
+            [
+                '{"Message": "json", "Level": 3, "py.extra": "value"}',
+                "",
+                "Message=kv Level=3",
+                "Message='quoted kv' Level=7",
+                'Message="\u00e9t\u00e9"',
+            ]
+        ).encode("utf-8")
+
+        stderr = io.StringIO()
+        with mock.patch.object(sys, "stderr", stderr):
+            self.run_main(
+                "sendlog",
+                "--stdin",
+                "--batch-size",
+                "2",
+                "-k",
+                asl.ASL_KEY_SENDER,
+                self.tag,
+                "-k",
+                asl.ASL_KEY_READ_UID,
+                str(os.getuid()),
+                "-k",
+                asl.ASL_KEY_LEVEL,
+                "5",
+                stdin=stdin,
+            )
+        self.assertTrue(stderr.getvalue().startswith("Sent 4 messages in "))
+        self.assertEqual(self.messages(), ["json", "kv", "quoted kv", "\u00e9t\u00e9"])
+
+        query = asl.Field(asl.ASL_KEY_SENDER) == self.tag
+        query &= asl.Field("py.extra").exists()
+        records = query.search(self.client).fetch_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][asl.ASL_KEY_LEVEL], "3")
+
+    def test_sendlog_invalid(self):
+        stdin = b"\n".join(
+            [
+                b"Message=first",
+                b"[1, 2]",
+                b'{"Message": null}',
+                b"no-value",
+                b"Message=second",
+            ]
+        )
+
+        stderr = io.StringIO()
+        with mock.patch.object(sys, "stderr", stderr):
+            with self.assertRaises(SystemExit) as cm:
+                self.run_main(
+                    "sendlog",
+                    "--stdin",
+                    "--input-format",
+                    "kv",
+                    "-k",
+                    asl.ASL_KEY_SENDER,
+                    self.tag,
+                    "-k",
+                    asl.ASL_KEY_READ_UID,
+                    str(os.getuid()),
+                    stdin=stdin,
+                )
+        self.assertEqual(cm.exception.code, 1)
+        self.assertEqual(self.messages(), ["first", "second"])
+
+        lines = stderr.getvalue().splitlines()
+        self.assertEqual(
+            [line.split(":")[0] for line in lines[:3]], ["line 2", "line 3", "line 4"]
+        )
+        self.assertEqual(lines[-1], "Skipped 3 invalid records")
+
+    def test_compile_format(self):
+        template, fields = cli_main.compile_format(
+            "{{x}} {Sender!r:>{Width}} {Time[0]}{Sender.upper}"
+        )
+        self.assertEqual(template, "{{x}} {0!r:>{1}} {2[0]}{0.upper}")
+        self.assertEqual(fields, ["Sender", "Width", "Time"])
+
+    def test_query_text(self):
+        self.log("first")
+
+        output = self.run_main("query", "-k", asl.ASL_KEY_SENDER, "eq", self.tag)
+        lines = output.splitlines()
+        self.assertEqual(lines[-1], "")
+        self.assertEqual(lines[:-1], sorted(lines[:-1]))
+        self.assertIn("Message first", lines)
+
+        output = self.run_main(
+            "query",
+            "-k",
+            asl.ASL_KEY_SENDER,
+            "eq",
+            self.tag,
+            "--fields",
+            "Message,NoSuchKey,Sender",
+        )
+        self.assertEqual(output, "Message first\nSender %s\n\n" % (self.tag,))
+
+    def test_query_jsonl(self):
+        self.log("first")
+        self.log("second")
+
+        output = self.run_main(
+            "query", "-k", asl.ASL_KEY_SENDER, "eq", self.tag, "--output", "jsonl"
+        )
+        records = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([r[asl.ASL_KEY_MSG] for r in records], ["first", "second"])
+        self.assertEqual(records[0][asl.ASL_KEY_SENDER], self.tag)
+
+        output = self.run_main(
+            "query",
+            "-k",
+            asl.ASL_KEY_SENDER,
+            "eq",
+            self.tag,
+            "--output",
+            "jsonl",
+            "--fields",
+            "Message,NoSuchKey",
+            "--limit",
+            "1",
+        )
+        self.assertEqual(output, '{"Message":"first"}\n')
+
+    def test_query_csv(self):
+        self.log('first, "quoted"')
+        self.log("second\tline")
+
+        output = self.run_main(
+            "query",
+            "-k",
+            asl.ASL_KEY_SENDER,
+            "eq",
+            self.tag,
+            "--output",
+            "csv",
+            "--fields",
+            "Message,NoSuchKey",
+        )
+        self.assertEqual(
+            list(csv.reader(io.StringIO(output))),
+            [["Message", "NoSuchKey"], ['first, "quoted"', ""], ["second\tline", ""]],
+        )
+
+        output = self.run_main(
+            "query", "-k", asl.ASL_KEY_SENDER, "eq", self.tag, "--output", "tsv"
+        )
+        rows = list(csv.reader(io.StringIO(output), csv.excel_tab))
+        self.assertEqual(rows[0], list(cli_main.DEFAULT_COLUMNS))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[2][rows[0].index(asl.ASL_KEY_MSG)], "second\tline")
+
+    def test_stats(self):
+        for kind, count in (("a", 3), ("b", 1), ("c", 2)):
+            for _ in range(count):
+                self.log("message", **{"py.kind": kind, "py.other": "x"})
+        self.log("message")
+
+        args = ("stats", "-k", asl.ASL_KEY_SENDER, "eq", self.tag)
+
+        output = self.run_main(*args, "--by", "py.kind", "--output", "jsonl")
+        self.assertEqual(
+            [json.loads(line) for line in output.splitlines()],
+            [
+                {"py.kind": None, "Count": 1},
+                {"py.kind": "a", "Count": 3},
+                {"py.kind": "b", "Count": 1},
+                {"py.kind": "c", "Count": 2},
+            ],
+        )
+
+        output = self.run_main(*args, "--by", "py.other,py.kind", "--top", "2")
+        self.assertEqual(
+            output.splitlines(),
+            [
+                "py.other  py.kind  Count",
+                "x         a        3",
+                "x         c        2",
+            ],
+        )
+
+        output = self.run_main(*args, "--output", "csv")
+        self.assertEqual(output, "Count\n7\n")
+
+        output = self.run_main(*args, "--interval", "1d", "--output", "tsv")
+        rows = list(csv.reader(io.StringIO(output), csv.excel_tab))
+        self.assertEqual(rows[0], [asl.ASL_KEY_TIME, "Count"])
+        self.assertEqual(sum(int(row[1]) for row in rows[1:]), 7)
+        for row in rows[1:]:
+            self.assertEqual(int(row[0]) % 86400, 0)
+
+        output = self.run_main(*args, "--interval", "1d")
+        lines = output.splitlines()
+        self.assertEqual(lines[0].split(), [asl.ASL_KEY_TIME, "Count"])
+        for line in lines[1:]:
+            time.strptime(line.rsplit(None, 1)[0].strip(), "%Y-%m-%d %H:%M:%S")
+
+        output = self.run_main(*args, "--by", asl.ASL_KEY_TIME)
+        lines = output.splitlines()
+        self.assertEqual(lines[0].split(), [asl.ASL_KEY_TIME, "Count"])
+        self.assertEqual(sum(int(line.split()[1]) for line in lines[1:]), 7)
+        for line in lines[1:]:
+            self.assertTrue(line.split()[0].isdigit())
+
+    def test_top_counter(self):
+        counter = cli_main.TopCounter(10)
+        counter.update("aababcabcd")
+        self.assertEqual(counter.max_error, 0)
+        self.assertEqual(counter.most_common(2), [("a", 4), ("b", 3)])
+
+        # Frequent keys are found with fewer counters than keys, with
+        # counts that are at most max_error too high.
+        rnd = random.Random(42)
+        keys = [rnd.choice("abc") for _ in range(3000)]
+        keys += [str(i) for i in range(1000)]
+        rnd.shuffle(keys)
+
+        counter = cli_main.TopCounter(20)
+        counter.update(keys)
+        self.assertLessEqual(len(counter.counts), 20)
+        self.assertGreater(counter.max_error, 0)
+
+        top = dict(counter.most_common(3))
+        self.assertEqual(set(top), {"a", "b", "c"})
+        for key, count in top.items():
+            self.assertGreaterEqual(count, keys.count(key))
+            self.assertLessEqual(count, keys.count(key) + counter.max_error)
+
+    def test_follow(self):
+        self.log("first")
+
+        intervals = []
+
+        def sleep(interval):
+            intervals.append(interval)
+            if len(intervals) == 1:
+                self.log("second")
+            elif len(intervals) == 4:
+                self.log("third")
+            elif len(intervals) == 6:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(cli_main.time, "sleep", sleep):
+            output = self.run_main(
+                "query",
+                "-k",
+                asl.ASL_KEY_SENDER,
+                "eq",
+                self.tag,
+                "-f",
+                "{Message}",
+                "--follow",
+                "--max-interval",
+                "0.15",
+            )
+
+        self.assertEqual(output, "first\nsecond\nthird\n")
+        self.assertEqual(intervals, [0.05, 0.05, 0.1, 0.15, 0.05, 0.1])
+
+    def test_follow_message_id(self):
+        with mock.patch.object(sys, "stderr", io.StringIO()):
+            with self.assertRaises(SystemExit):
+                self.run_main("query", "-k", asl.ASL_KEY_MSG_ID, ">", "1", "--follow")
+
+
+if __name__ == "__main__":
+    unittest.main()
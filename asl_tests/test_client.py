@@ -1,10 +1,13 @@
+import array
 import os
-import platform
+import threading
+import typing
 import unittest
-from distutils.version import LooseVersion
 
 import asl
 
+from .support import has_feature
+
 
 class TestASLClient(unittest.TestCase):
     def test_basic_creation(self):
@@ -32,6 +35,97 @@ class TestASLClient(unittest.TestCase):
         cli.close()
         self.assertRaises(ValueError, cli.set_filter, 0)
 
+    def test_log_template(self):
+        tag = "template %d %d" % (os.getpid(), id(self))
+        cli = asl.aslclient("ident", "facility", 0)
+        template = asl.aslmsg(
+            asl.ASL_TYPE_MSG, {asl.ASL_KEY_FACILITY: "org.example", "tag": tag}
+        )
+        cli.log(template, asl.ASL_LEVEL_ERR, "%s %d", tag, 1)
+        cli.log(template, asl.ASL_LEVEL_WARNING, "%s %d", tag, 2)
+
+        # The template is not modified
+        self.assertEqual(
+            template.asdict(), {asl.ASL_KEY_FACILITY: "org.example", "tag": tag}
+        )
+
+        query = asl.Field("tag") == tag
+        records = query.search(cli).fetch_dicts()
+        self.assertEqual(
+            [(r[asl.ASL_KEY_MSG], r[asl.ASL_KEY_LEVEL]) for r in records],
+            [(tag + " 1", "3"), (tag + " 2", "4")],
+        )
+        for record in records:
+            self.assertEqual(record[asl.ASL_KEY_FACILITY], "org.example")
+
+    def test_is_enabled(self):
+        cli = asl.aslclient("ident", "facility", 0)
+
+        # Until set_filter is called the filter of the library is used,
+        # which can be changed by the system administrator.
+        self.assertTrue(cli.is_enabled(asl.ASL_LEVEL_DEBUG))
+        self.assertTrue(cli.is_enabled(asl.ASL_LEVEL_EMERG))
+        self.assertFalse(cli.is_enabled(-1))
+
+        cli.set_filter(asl.ASL_FILTER_MASK_UPTO(asl.ASL_LEVEL_WARNING))
+        self.assertTrue(cli.is_enabled(asl.ASL_LEVEL_ERR))
+        self.assertTrue(cli.is_enabled(asl.ASL_LEVEL_WARNING))
+        self.assertFalse(cli.is_enabled(asl.ASL_LEVEL_NOTICE))
+        self.assertFalse(cli.is_enabled(asl.ASL_LEVEL_DEBUG))
+        self.assertFalse(cli.is_enabled(-1))
+        self.assertFalse(cli.is_enabled(64))
+
+        cli.set_filter(asl.ASL_FILTER_MASK(asl.ASL_LEVEL_DEBUG))
+        self.assertFalse(cli.is_enabled(asl.ASL_LEVEL_ERR))
+        self.assertTrue(cli.is_enabled(asl.ASL_LEVEL_DEBUG))
+
+        self.assertRaises(TypeError, cli.is_enabled, "debug")
+
+        # Messages are always written to additional log files
+        rd, wr = os.pipe()
+        self.addCleanup(os.close, rd)
+        self.addCleanup(os.close, wr)
+        cli.add_log_file(wr)
+        self.assertTrue(cli.is_enabled(asl.ASL_LEVEL_ERR))
+        cli.remove_log_file(wr)
+        self.assertFalse(cli.is_enabled(asl.ASL_LEVEL_ERR))
+
+        cli.close()
+        self.assertRaises(ValueError, cli.is_enabled, asl.ASL_LEVEL_ERR)
+
+    def test_lazy_format(self):
+        class Arg:
+            def __init__(self):
+                self.count = 0
+
+            def __str__(self):
+                self.count += 1
+                return "arg"
+
+        tag = "lazy %d %d" % (os.getpid(), id(self))
+        cli = asl.aslclient("ident", "facility", 0)
+        cli.set_filter(asl.ASL_FILTER_MASK_UPTO(asl.ASL_LEVEL_ERR))
+
+        arg = Arg()
+        cli.log(None, asl.ASL_LEVEL_DEBUG, "%s %s", tag, arg)
+        self.assertEqual(arg.count, 0)
+
+        # Not formatted, even when the format is invalid
+        cli.log(None, asl.ASL_LEVEL_DEBUG, "%d", "not a number")
+
+        cli.log(None, asl.ASL_LEVEL_ERR, "%s %s", tag, arg)
+        self.assertEqual(arg.count, 1)
+        cli.log(None, asl.ASL_LEVEL_ERR, "%(tag)s %(value)d", {"tag": tag, "value": 42})
+        cli.log(None, asl.ASL_LEVEL_ERR, "%s %%", tag)
+
+        self.assertRaises(TypeError, cli.log, None, asl.ASL_LEVEL_ERR, "%s %s", tag)
+
+        query = asl.Field(asl.ASL_KEY_MSG).startswith(tag)
+        self.assertEqual(
+            [r[asl.ASL_KEY_MSG] for r in query.search(cli).fetch_dicts()],
+            [tag + " arg", tag + " 42", tag + " %"],
+        )
+
     def test_context(self):
 
         with asl.aslclient("ident", "facility", 0) as cli:
@@ -53,8 +147,10 @@ class TestASLClient(unittest.TestCase):
         msg = asl.aslmsg(asl.ASL_TYPE_MSG)
         cli.log(msg, asl.ASL_LEVEL_NOTICE, "hello world")
 
+        # Extra arguments are formatting arguments
+        cli.log(msg, asl.ASL_LEVEL_NOTICE, "hello world %s", "extra")
         self.assertRaises(
-            TypeError, cli.log, msg, asl.ASL_LEVEL_NOTICE, "hello world %s", "extra"
+            TypeError, cli.log, msg, asl.ASL_LEVEL_NOTICE, "hello world %d", "extra"
         )
         self.assertRaises(TypeError, cli.log, msg, asl.ASL_LEVEL_NOTICE)
 
@@ -70,6 +166,61 @@ class TestASLClient(unittest.TestCase):
         self.assertRaises(TypeError, cli.send, None)
         self.assertRaises(TypeError, cli.send, "hello")
 
+    def test_send_many(self):
+        cli = asl.aslclient("ident", "facility", 0)
+        self.assertIsInstance(cli, asl.aslclient)
+
+        msg = asl.aslmsg(asl.ASL_TYPE_MSG)
+        msg[asl.ASL_KEY_MSG] = "Batched message"
+
+        self.assertEqual(cli.send_many([]), 0)
+        self.assertEqual(cli.send_many([msg, msg]), 2)
+        messages: typing.List[typing.Union[asl.aslmsg, typing.Dict[str, str]]] = [
+            msg,
+            {asl.ASL_KEY_MSG: "Batched dict"},
+        ]
+        self.assertEqual(cli.send_many(iter(messages), release_gil=False), 2)
+
+        self.assertRaises(TypeError, cli.send_many, None)
+        self.assertRaises(TypeError, cli.send_many, [msg, "hello"])
+        self.assertRaises(TypeError, cli.send_many, [{"key": 42}])
+        self.assertRaises(TypeError, cli.send_many, [{42: "value"}])
+
+        # The message is usable again after a failed batch
+        msg[asl.ASL_KEY_MSG] = "Updated"
+
+        cli.close()
+        self.assertRaises(ValueError, cli.send_many, [msg])
+
+    def test_threaded_send(self):
+        cli = asl.aslclient("ident", "facility", 0)
+        self.assertIsInstance(cli, asl.aslclient)
+
+        msg = asl.aslmsg(asl.ASL_TYPE_MSG)
+        msg[asl.ASL_KEY_MSG] = "Threaded message"
+
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(50):
+                    cli.send(msg)
+                    cli.log(None, asl.ASL_LEVEL_NOTICE, "hello world")
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+
+        cli.close()
+        self.assertRaises(ValueError, cli.send, msg)
+        self.assertRaises(ValueError, cli.log, None, asl.ASL_LEVEL_NOTICE, "hello")
+
     def test_no_bytes(self):
         self.assertRaises(TypeError, asl.aslclient, "ident", b"faclity", 0)
         self.assertRaises(TypeError, asl.aslclient, b"ident", "faclity", 0)
@@ -101,6 +252,12 @@ class TestASLClient(unittest.TestCase):
         cli = asl.aslclient("ident", "facility", 0)
         self.assertIsInstance(cli, asl.aslclient)
 
+        # Ensure that there is at least one console message
+        msg = asl.aslmsg(asl.ASL_TYPE_MSG)
+        msg[asl.ASL_KEY_FACILITY] = "com.apple.console"
+        msg[asl.ASL_KEY_MSG] = "Search test"
+        cli.send(msg)
+
         msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
         msg.set_query(asl.ASL_KEY_FACILITY, "com.apple.console", asl.ASL_QUERY_OP_EQUAL)
 
@@ -120,8 +277,222 @@ class TestASLClient(unittest.TestCase):
         msg.set_query(asl.ASL_KEY_FACILITY, "com.apple.console", asl.ASL_QUERY_OP_EQUAL)
         self.assertNotEqual(list(cli.search(msg)), [])
 
+    def test_fetch(self):
+        cli = asl.aslclient("ident", "facility", 0)
+        self.assertIsInstance(cli, asl.aslclient)
+
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(asl.ASL_KEY_FACILITY, "com.apple.console", asl.ASL_QUERY_OP_EQUAL)
+
+        expected = [info.asdict() for info in cli.search(msg)]
+
+        response = cli.search(msg)
+        self.assertEqual(response.fetch(0), [])
+        self.assertEqual(response.fetch_dicts(0), [])
+
+        records = response.fetch(1)
+        self.assertLessEqual(len(records), 1)
+        for keys, values in records:
+            self.assertIsInstance(keys, tuple)
+            self.assertIsInstance(values, tuple)
+            self.assertEqual(len(keys), len(values))
+
+        records = [dict(zip(*item)) for item in records]
+        records.extend(response.fetch_dicts(2))
+        records.extend(dict(zip(*item)) for item in response.fetch())
+        self.assertEqual(response.fetch(), [])
+        self.assertEqual(response.fetch_dicts(), [])
+
+        # Compare the identifying keys, other keys can change when
+        # the system log is updated between the two searches.
+        self.assertEqual(
+            [r.get(asl.ASL_KEY_MSG_ID) for r in records[: len(expected)]],
+            [r.get(asl.ASL_KEY_MSG_ID) for r in expected[: len(records)]],
+        )
+
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(
+            asl.ASL_KEY_FACILITY, "com.apple.nosuchapp", asl.ASL_QUERY_OP_EQUAL
+        )
+        response = cli.search(msg)
+        self.assertEqual(response.fetch(), [])
+        self.assertEqual(response.fetch_dicts(), [])
+
+    def test_fetch_iterate(self):
+        tag = "fetch-iterate-%d" % (os.getpid(),)
+        cli = asl.aslclient(tag, "facility", 0)
+        cli.send_many(
+            {asl.ASL_KEY_MSG: str(i), asl.ASL_KEY_READ_UID: str(os.getuid())}
+            for i in range(300)
+        )
+
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(asl.ASL_KEY_SENDER, tag, asl.ASL_QUERY_OP_EQUAL)
+
+        # Records are read from libasl in chunks, mixing iteration
+        # and fetching returns every record once and in order.
+        response = cli.search(msg)
+        texts = [next(response)[asl.ASL_KEY_MSG]]
+        texts.extend(r[asl.ASL_KEY_MSG] for r in response.fetch_dicts(200))
+        texts.append(next(response)[asl.ASL_KEY_MSG])
+        texts.extend(r[asl.ASL_KEY_MSG] for r in response.fetch_records())
+        self.assertEqual(texts, [str(i) for i in range(300)])
+        self.assertEqual(list(response), [])
+
+        # search_columns reads the response in chunks as well
+        columns = cli.search_columns(msg, [asl.ASL_KEY_MSG], {asl.ASL_KEY_MSG: "q"})
+        self.assertEqual(list(columns[asl.ASL_KEY_MSG]), list(range(300)))
+
+    def test_fetch_records(self):
+        cli = asl.aslclient("ident", "facility", 0)
+        cli.set_filter(asl.ASL_FILTER_MASK_UPTO(asl.ASL_LEVEL_DEBUG))
+        for i in range(3):
+            cli.log(None, asl.ASL_LEVEL_ERR, "fetch_records %d" % (i,))
+
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(asl.ASL_KEY_MSG, "fetch_records ", asl.ASL_QUERY_OP_PREFIX)
+
+        expected = cli.search(msg).fetch_dicts()
+
+        response = cli.search(msg)
+        self.assertEqual(response.fetch_records(0), [])
+        records = response.fetch_records(1) + response.fetch_records()
+        self.assertEqual(response.fetch_records(), [])
+
+        self.assertEqual(len(records), len(expected))
+        for record, value in zip(records, expected):
+            self.assertIsInstance(record, asl.Record)
+            self.assertEqual(record.asdict(), value)
+            self.assertEqual(record[asl.ASL_KEY_SENDER], "ident")
+
+        fields = [asl.ASL_KEY_MSG, "NoSuchKey"]
+        records = cli.search(msg, fields=fields).fetch_records()
+        self.assertEqual(len(records), len(expected))
+        for record, value in zip(records, expected):
+            self.assertEqual(list(record.keys()), [asl.ASL_KEY_MSG])
+            self.assertEqual(record[asl.ASL_KEY_MSG], value[asl.ASL_KEY_MSG])
+
+    def test_search_fields(self):
+        cli = asl.aslclient("ident", "facility", 0)
+        self.assertIsInstance(cli, asl.aslclient)
+
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(asl.ASL_KEY_FACILITY, "com.apple.console", asl.ASL_QUERY_OP_EQUAL)
+
+        fields = [asl.ASL_KEY_MSG_ID, asl.ASL_KEY_FACILITY, "NoSuchKey"]
+        response = cli.search(msg, fields=fields)
+        self.assertEqual(response.fields, tuple(fields))
+
+        rows = list(response)
+        for row in rows:
+            self.assertIsInstance(row, tuple)
+            self.assertEqual(len(row), 3)
+            self.assertEqual(row[1], "com.apple.console")
+            self.assertIs(row[2], None)
+
+        response = cli.search(msg, fields=fields)
+        records = response.fetch(1) + response.fetch_dicts(1) + response.fetch()
+        for record in records:
+            if isinstance(record, dict):
+                self.assertEqual(
+                    set(record), {asl.ASL_KEY_MSG_ID, asl.ASL_KEY_FACILITY}
+                )
+            else:
+                self.assertEqual(len(record), 3)
+
+        self.assertIs(cli.search(msg).fields, None)
+        self.assertIs(cli.search(msg, fields=None).fields, None)
+        self.assertEqual(cli.search(msg, fields=()).fields, ())
+
+        self.assertRaises(TypeError, cli.search, msg, fields="Sender")
+        self.assertRaises(TypeError, cli.search, msg, fields=[42])
+        self.assertRaises(TypeError, cli.search, msg, fields=42)
+
+    def test_search_columns(self):
+        cli = asl.aslclient("ident", "facility", 0)
+        self.assertIsInstance(cli, asl.aslclient)
+
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(asl.ASL_KEY_FACILITY, "com.apple.console", asl.ASL_QUERY_OP_EQUAL)
+
+        fields = [
+            asl.ASL_KEY_TIME,
+            asl.ASL_KEY_LEVEL,
+            asl.ASL_KEY_FACILITY,
+            asl.ASL_KEY_PID,
+            "NoSuchKey",
+        ]
+        columns = cli.search_columns(
+            msg, fields, types={asl.ASL_KEY_LEVEL: None, asl.ASL_KEY_PID: "d"}
+        )
+        self.assertEqual(list(columns), fields)
+
+        for name, typecode in ((asl.ASL_KEY_TIME, "q"), (asl.ASL_KEY_PID, "d")):
+            self.assertIsInstance(columns[name], array.array)
+            self.assertEqual(getattr(columns[name], "typecode", None), typecode)
+        self.assertIsInstance(columns[asl.ASL_KEY_LEVEL], list)
+        self.assertIsInstance(columns[asl.ASL_KEY_FACILITY], list)
+
+        count = len(columns[asl.ASL_KEY_TIME])
+        for name in fields:
+            self.assertEqual(len(columns[name]), count)
+
+        for value in columns[asl.ASL_KEY_FACILITY]:
+            self.assertEqual(value, "com.apple.console")
+        for value in columns["NoSuchKey"]:
+            self.assertIs(value, None)
+
+        self.assertEqual(cli.search_columns(msg, ()), {})
+
+        self.assertRaises(TypeError, cli.search_columns, msg)
+        self.assertRaises(TypeError, cli.search_columns, msg, "Sender")
+        self.assertRaises(TypeError, cli.search_columns, msg, [42])
+        self.assertRaises(TypeError, cli.search_columns, msg, fields, types=[])
+        self.assertRaises(
+            ValueError, cli.search_columns, msg, fields, types={asl.ASL_KEY_PID: "i"}
+        )
+
+        cli.close()
+        self.assertRaises(ValueError, cli.search_columns, msg, fields)
+
+    def test_search_columns_masks(self):
+        tag = "columns-masks-%d" % (os.getpid(),)
+        cli = asl.aslclient(tag, "facility", 0)
+        values = ["12", "x", "12abc", "", None, "99999999999999999999", "-7", "1.5"]
+        cli.send_many(
+            {asl.ASL_KEY_READ_UID: str(os.getuid())}
+            if value is None
+            else {"py.value": value, asl.ASL_KEY_READ_UID: str(os.getuid())}
+            for value in values
+        )
+
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(asl.ASL_KEY_SENDER, tag, asl.ASL_QUERY_OP_EQUAL)
+
+        fields = ["py.value", "py.double", asl.ASL_KEY_SENDER]
+        columns, masks = cli.search_columns(
+            msg, fields, {"py.value": "q", "py.double": "d"}, masks=True
+        )
+        self.assertEqual(list(columns["py.value"]), [12, 0, 0, 0, 0, 0, -7, 0])
+        self.assertEqual(list(masks["py.value"]), [1, 0, 0, 0, 0, 0, 1, 0])
+        self.assertEqual(masks["py.value"].typecode, "B")
+        self.assertEqual(list(masks["py.double"]), [0] * len(values))
+        self.assertNotIn(asl.ASL_KEY_SENDER, masks)
+
+        columns, masks = cli.search_columns(
+            msg, ["py.value"], {"py.value": "d"}, masks=True
+        )
+        self.assertEqual(list(masks["py.value"]), [1, 0, 0, 0, 0, 1, 1, 1])
+        self.assertEqual(columns["py.value"][7], 1.5)
+        self.assertNotEqual(columns["py.value"][1], columns["py.value"][1])
+
+        columns = cli.search_columns(msg, ["py.value"], {"py.value": "q"})
+        self.assertEqual(
+            columns, {"py.value": array.array("q", [12, 0, 0, 0, 0, 0, -7, 0])}
+        )
+
     @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) >= LooseVersion("10.8"), "Requires OSX 10.8"
+        has_feature("aslclient.log_descriptor"), "Requires log_descriptor"
     )
     def test_redirection(self):
         cli = asl.aslclient("ident", "facility", 0)
@@ -154,18 +525,14 @@ class TestASLClient(unittest.TestCase):
         msg[asl.ASL_KEY_FACILITY] = "com.apple.console"
         cli.log_descriptor(msg, asl.ASL_LEVEL_NOTICE, fd, asl.ASL_LOG_DESCRIPTOR_WRITE)
 
-    @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) < LooseVersion("10.8"), "Requires OSX 10.8"
-    )
+    @unittest.skipIf(has_feature("aslclient.log_descriptor"), "Has log_descriptor")
     def test_no_redirection(self):
         cli = asl.aslclient("ident", "facility", 0)
         self.assertIsInstance(cli, asl.aslclient)
 
         self.assertFalse(hasattr(cli, "log_descriptor"))
 
-    @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) >= LooseVersion("10.7"), "Requires OSX 10.7"
-    )
+    @unittest.skipUnless(has_feature("open_from_file"), "Requires open_from_file")
     def test_open_from_file(self):
         try:
             fd = os.open("asl.log", os.O_RDWR | os.O_CREAT, 0o660)
@@ -181,9 +548,7 @@ class TestASLClient(unittest.TestCase):
             if os.path.exists("asl.log"):
                 os.unlink("asl.log")
 
-    @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) < LooseVersion("10.7"), "Requires OSX 10.7"
-    )
+    @unittest.skipIf(has_feature("open_from_file"), "Has open_from_file")
     def test_no_open_from_file(self):
         self.assertFalse(hasattr(asl, "open_from_file"))
 
@@ -0,0 +1,322 @@
+import errno
+import logging
+import os
+import sys
+import threading
+import typing
+import unittest
+from unittest import mock
+
+import asl
+import asl.logging
+
+
+class TestASLHandler(unittest.TestCase):
+    def make_logger(self, handler):
+        logger = logging.getLogger("asl_tests.%s.%d" % (self.id(), id(handler)))
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return logger
+
+    def block_sending(self, handler):
+        """
+        Block the background thread while it sends the first batch,
+        returns the list of sent batches and a function that unblocks
+        the thread.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        batches = []
+
+        def _send(cli, batch):
+            started.set()
+            release.wait()
+            batches.append([text for record, text in batch])
+            return len(batch), 0
+
+        handler._send = _send
+        logger = self.make_logger(handler)
+        logger.info("first")
+        self.assertTrue(started.wait(5))
+        return logger, batches, release.set
+
+    def test_asl_level(self):
+        self.assertEqual(asl.logging.asl_level(logging.DEBUG), asl.ASL_LEVEL_DEBUG)
+        self.assertEqual(asl.logging.asl_level(logging.INFO), asl.ASL_LEVEL_INFO)
+        self.assertEqual(asl.logging.asl_level(logging.INFO + 5), asl.ASL_LEVEL_INFO)
+        self.assertEqual(asl.logging.asl_level(logging.WARNING), asl.ASL_LEVEL_WARNING)
+        self.assertEqual(asl.logging.asl_level(logging.ERROR), asl.ASL_LEVEL_ERR)
+        self.assertEqual(asl.logging.asl_level(logging.CRITICAL), asl.ASL_LEVEL_CRIT)
+        self.assertEqual(asl.logging.asl_level(100), asl.ASL_LEVEL_ALERT)
+        self.assertEqual(asl.logging.asl_level(0), asl.ASL_LEVEL_DEBUG)
+
+    def test_emit(self):
+        tag = "asl.logging %d %d" % (os.getpid(), id(self))
+        handler = asl.logging.ASLHandler("ident", read_uid=os.getuid())
+        logger = self.make_logger(handler)
+
+        lineno = sys._getframe().f_lineno + 1
+        logger.warning("%s %s", tag, "warning")
+        logger.debug("%s %s", tag, "debug")
+        handler.flush()
+        self.assertEqual(handler.pending, 0)
+        self.assertEqual(handler.queued, 2)
+        self.assertEqual(handler.sent, 2)
+        self.assertEqual(handler.dropped, 0)
+
+        cli = asl.aslclient(None, "user", 0)
+        query = asl.Field(asl.ASL_KEY_MSG).startswith(tag)
+        records = query.search(cli).fetch_dicts()
+        self.assertEqual(
+            [r[asl.ASL_KEY_MSG] for r in records],
+            ["%s warning" % (tag,), "%s debug" % (tag,)],
+        )
+        self.assertEqual(
+            [r[asl.ASL_KEY_LEVEL] for r in records],
+            [str(asl.ASL_LEVEL_WARNING), str(asl.ASL_LEVEL_DEBUG)],
+        )
+        self.assertEqual(records[0][asl.ASL_KEY_SENDER], "ident")
+        self.assertEqual(records[0][asl.ASL_KEY_FACILITY], "com.apple.console")
+        self.assertEqual(records[0][asl.ASL_KEY_READ_UID], str(os.getuid()))
+        self.assertEqual(records[0]["py.name"], logger.name)
+        self.assertEqual(records[0]["py.funcName"], "test_emit")
+        self.assertEqual(records[0]["py.lineno"], str(lineno))
+
+    def test_drop_newest(self):
+        handler = asl.logging.ASLHandler(
+            queue_size=2, overflow=asl.logging.OVERFLOW_DROP_NEWEST
+        )
+        logger, batches, release = self.block_sending(handler)
+        for i in range(4):
+            logger.info("message %d", i)
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(handler.pending, 3)
+
+        release()
+        self.assertTrue(handler.wait(5))
+        self.assertEqual(batches, [["first"], ["message 0", "message 1"]])
+        self.assertEqual(handler.queued, 3)
+        self.assertEqual(handler.sent, 3)
+
+    def test_drop_oldest(self):
+        handler = asl.logging.ASLHandler(
+            queue_size=2, overflow=asl.logging.OVERFLOW_DROP_OLDEST
+        )
+        logger, batches, release = self.block_sending(handler)
+        for i in range(4):
+            logger.info("message %d", i)
+        self.assertEqual(handler.dropped, 2)
+
+        release()
+        self.assertTrue(handler.wait(5))
+        self.assertEqual(batches, [["first"], ["message 2", "message 3"]])
+        self.assertEqual(handler.queued, 5)
+        self.assertEqual(handler.sent, 3)
+
+    def test_block(self):
+        handler = asl.logging.ASLHandler(queue_size=1, batch_size=1)
+        logger, batches, release = self.block_sending(handler)
+        logger.info("queued")
+
+        thread = threading.Thread(target=logger.info, args=("blocked",))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertFalse(handler.wait(0.01))
+
+        release()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(handler.wait(5))
+        self.assertEqual(batches, [["first"], ["queued"], ["blocked"]])
+        self.assertEqual(handler.dropped, 0)
+
+    def test_close(self):
+        handler = asl.logging.ASLHandler()
+        logger, batches, release = self.block_sending(handler)
+        logger.info("second")
+
+        threading.Timer(0.05, release).start()
+        handler.close()
+        self.assertEqual(batches, [["first"], ["second"]])
+
+        logger.info("closed")
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.sent, 2)
+
+    @unittest.skipUnless(hasattr(os, "register_at_fork"), "requires register_at_fork")
+    def test_fork(self):
+        handler = asl.logging.ASLHandler()
+        logger, batches, release = self.block_sending(handler)
+        logger.info("queued")
+
+        with handler._cond:
+            pid = os.fork()
+            if pid == 0:
+                # The child gets a new lock, and does not inherit
+                # the records queued by the parent.
+                status = 1
+                try:
+                    if handler._cond.acquire(blocking=False):
+                        handler._cond.release()
+                        if handler.pending == 0 and handler._thread is None:
+                            status = 0
+                finally:
+                    os._exit(status)
+
+        release()
+        self.assertTrue(handler.wait(5))
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertEqual(batches, [["first"], ["queued"]])
+
+    def test_send_failure(self):
+        sent = []
+
+        def send_many(messages):
+            texts = [msg[asl.ASL_KEY_MSG] for msg in messages]
+            if len(texts) > 1 and "invalid" in texts:
+                # Nothing is sent for an invalid message
+                raise TypeError("invalid message")
+            for index, text in enumerate(texts):
+                if text.startswith("fail") or text == "invalid":
+                    exc: typing.Any = OSError(errno.EIO, os.strerror(errno.EIO))
+                    exc.index = index
+                    raise exc
+                sent.append(text)
+            return len(texts)
+
+        client = mock.Mock()
+        client.send_many.side_effect = send_many
+        handle_error = mock.Mock()
+        with mock.patch.object(asl.logging, "aslclient", return_value=client):
+            handler = asl.logging.ASLHandler(batch_size=8)
+            with mock.patch.object(handler, "handleError", handle_error):
+                logger, batches, release = self.block_sending(handler)
+                del handler._send
+
+                texts = ["a", "fail 1", "b", "c", "fail 2", "d", "e", "f"]
+                texts += ["g", "invalid", "h"]
+                for text in texts:
+                    logger.info(text)
+
+                release()
+                self.assertTrue(handler.wait(5))
+
+        self.assertEqual(sent, ["a", "b", "c", "d", "e", "f", "g", "h"])
+        self.assertEqual(handler.sent, 9)
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual(
+            [call[0][0].getMessage() for call in handle_error.call_args_list],
+            ["fail 1", "fail 2", "invalid"],
+        )
+
+    def test_compile_fields(self):
+        self.assertEqual(
+            asl.logging.compile_fields(
+                ["name", ("lineno", "Line"), ("created", "Created", repr)]
+            ),
+            (
+                ("name", "py.name", str),
+                ("lineno", "Line", str),
+                ("created", "Created", repr),
+            ),
+        )
+        self.assertEqual(asl.logging.compile_fields(()), ())
+
+        self.assertRaises(TypeError, asl.logging.compile_fields, "name")
+        self.assertRaises(TypeError, asl.logging.compile_fields, [42])
+        self.assertRaises(TypeError, asl.logging.compile_fields, [("name",)])
+        self.assertRaises(TypeError, asl.logging.compile_fields, [("name", 42)])
+        self.assertRaises(
+            TypeError, asl.logging.compile_fields, [("name", "Name", "str")]
+        )
+        self.assertRaises(
+            ValueError, asl.logging.compile_fields, [("name", asl.ASL_KEY_MSG)]
+        )
+        self.assertRaises(
+            ValueError, asl.logging.compile_fields, ["name", ("module", "py.name")]
+        )
+
+    def test_fields(self):
+        handler = asl.logging.ASLHandler(
+            "ident",
+            facility="org.example",
+            fields=["funcName", ("lineno", "Line", lambda v: "%05d" % (v,))],
+            read_uid=1234,
+        )
+        self.addCleanup(handler.close)
+
+        record = logging.LogRecord(
+            "name", logging.ERROR, "path", 42, "hello", (), None, func="func"
+        )
+        # Attributes added using "extra" end up in the record __dict__
+        record.__dict__["request"] = "abc"
+        self.assertEqual(
+            handler._message(record, "text"),
+            {
+                asl.ASL_KEY_FACILITY: "org.example",
+                asl.ASL_KEY_READ_UID: "1234",
+                asl.ASL_KEY_LEVEL: str(asl.ASL_LEVEL_ERR),
+                asl.ASL_KEY_MSG: "text",
+                "py.funcName": "func",
+                "Line": "00042",
+            },
+        )
+
+        record = logging.LogRecord("name", 25, "path", 42, "hello", (), None)
+        msg = handler._message(record, "text")
+        self.assertEqual(msg[asl.ASL_KEY_LEVEL], str(asl.ASL_LEVEL_INFO))
+        self.assertNotIn("py.funcName", msg)
+
+    def test_extra(self):
+        handler = asl.logging.ASLHandler(fields=(), extra=True)
+        self.addCleanup(handler.close)
+
+        record = logging.makeLogRecord(
+            {
+                "msg": "hello",
+                "levelno": logging.INFO,
+                "request": 42,
+                "user": "bob",
+                "empty": None,
+            }
+        )
+        logging.Formatter("%(asctime)s %(message)s").format(record)
+        msg = handler._message(record, "text")
+        self.assertEqual(msg["py.request"], "42")
+        self.assertEqual(msg["py.user"], "bob")
+        self.assertNotIn("py.empty", msg)
+        self.assertNotIn("py.message", msg)
+        self.assertNotIn("py.asctime", msg)
+        self.assertNotIn("py.name", msg)
+
+        handler = asl.logging.ASLHandler(
+            fields=(), extra=[("request", "Request"), "missing"]
+        )
+        self.addCleanup(handler.close)
+        msg = handler._message(record, "text")
+        self.assertEqual(msg["Request"], "42")
+        self.assertNotIn("py.user", msg)
+        self.assertNotIn("py.missing", msg)
+
+        handler = asl.logging.ASLHandler(fields=())
+        self.addCleanup(handler.close)
+        self.assertEqual(
+            set(handler._message(record, "text")),
+            {asl.ASL_KEY_FACILITY, asl.ASL_KEY_LEVEL, asl.ASL_KEY_MSG},
+        )
+
+    def test_arguments(self):
+        self.assertRaises(ValueError, asl.logging.ASLHandler, queue_size=0)
+        self.assertRaises(ValueError, asl.logging.ASLHandler, batch_size=0)
+        self.assertRaises(ValueError, asl.logging.ASLHandler, overflow="ignore")
+        self.assertRaises(TypeError, asl.logging.ASLHandler, 42)
+        self.assertRaises(TypeError, asl.logging.ASLHandler, fields=[42])
+        self.assertRaises(TypeError, asl.logging.ASLHandler, extra=[42])
+
+
+if __name__ == "__main__":
+    unittest.main()
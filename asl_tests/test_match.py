@@ -0,0 +1,185 @@
+import calendar
+import time
+import unittest
+
+import asl
+from asl import match
+
+EQ = asl.ASL_QUERY_OP_EQUAL
+NE = asl.ASL_QUERY_OP_NOT_EQUAL
+GT = asl.ASL_QUERY_OP_GREATER
+GE = asl.ASL_QUERY_OP_GREATER_EQUAL
+LT = asl.ASL_QUERY_OP_LESS
+LE = asl.ASL_QUERY_OP_LESS_EQUAL
+CASEFOLD = asl.ASL_QUERY_OP_CASEFOLD
+PREFIX = asl.ASL_QUERY_OP_PREFIX
+SUFFIX = asl.ASL_QUERY_OP_SUFFIX
+SUBSTRING = asl.ASL_QUERY_OP_SUBSTRING
+NUMERIC = asl.ASL_QUERY_OP_NUMERIC
+REGEX = asl.ASL_QUERY_OP_REGEX
+
+
+class TestEvaluate(unittest.TestCase):
+    def test_missing(self):
+        self.assertTrue(match.evaluate(asl.ASL_QUERY_OP_TRUE, "", "a"))
+        self.assertFalse(match.evaluate(asl.ASL_QUERY_OP_TRUE, "", None))
+        self.assertTrue(match.evaluate(NE, "a", None))
+        for op in (EQ, GT, GE, LT, LE, EQ | SUBSTRING, EQ | REGEX):
+            self.assertFalse(match.evaluate(op, "a", None))
+
+    def test_string(self):
+        self.assertTrue(match.evaluate(EQ, "abc", "abc"))
+        self.assertFalse(match.evaluate(EQ, "abc", "ABC"))
+        self.assertTrue(match.evaluate(EQ | CASEFOLD, "abc", "ABC"))
+        self.assertTrue(match.evaluate(NE, "abc", "abd"))
+        self.assertTrue(match.evaluate(GT, "abc", "abd"))
+        self.assertTrue(match.evaluate(LT, "abc", "abb"))
+        self.assertTrue(match.evaluate(GE, "abc", "abc"))
+        self.assertTrue(match.evaluate(LE, "abc", "abc"))
+
+        # String comparison, not numeric comparison
+        self.assertTrue(match.evaluate(GT, "10", "9"))
+
+        # Only ASCII letters are folded
+        self.assertFalse(match.evaluate(EQ | CASEFOLD, "\xe9", "\xc9"))
+
+    def test_numeric(self):
+        self.assertFalse(match.evaluate(GT | NUMERIC, "10", "9"))
+        self.assertTrue(match.evaluate(LT | NUMERIC, "10", "9"))
+        self.assertTrue(match.evaluate(EQ | NUMERIC, "-5", "-05"))
+        self.assertFalse(match.evaluate(EQ | NUMERIC, "5", "5x"))
+        self.assertTrue(match.evaluate(NE | NUMERIC, "5", "5x"))
+        self.assertFalse(match.evaluate(EQ | NUMERIC, "x", "x"))
+
+    def test_affixes(self):
+        self.assertTrue(match.evaluate(EQ | PREFIX, "ab", "abc"))
+        self.assertFalse(match.evaluate(EQ | PREFIX, "bc", "abc"))
+        self.assertTrue(match.evaluate(NE | PREFIX, "bc", "abc"))
+        self.assertTrue(match.evaluate(EQ | PREFIX | CASEFOLD, "AB", "abc"))
+        self.assertTrue(match.evaluate(EQ | SUFFIX, "bc", "abc"))
+        self.assertFalse(match.evaluate(EQ | SUFFIX, "ab", "abc"))
+        self.assertTrue(match.evaluate(EQ | SUBSTRING, "b", "abc"))
+        self.assertFalse(match.evaluate(EQ | SUBSTRING, "d", "abc"))
+        self.assertTrue(match.evaluate(NE | SUBSTRING, "d", "abc"))
+        self.assertTrue(match.evaluate(GE | SUBSTRING, "b", "abc"))
+        self.assertFalse(match.evaluate(GT | SUBSTRING, "b", "abc"))
+
+        # Compares the first characters
+        self.assertTrue(match.evaluate(GT | PREFIX, "ab", "acx"))
+
+        # The empty string is a prefix of every string
+        self.assertTrue(match.evaluate(EQ | PREFIX, "", "abc"))
+        self.assertFalse(match.evaluate(NE | PREFIX, "", "abc"))
+
+        # A longer string never matches
+        self.assertFalse(match.evaluate(EQ | PREFIX, "abcd", "abc"))
+        self.assertTrue(match.evaluate(NE | PREFIX, "abcd", "abc"))
+
+    def test_regex(self):
+        self.assertTrue(match.evaluate(EQ | REGEX, "b.d", "abcde"))
+        self.assertFalse(match.evaluate(EQ | REGEX, "^b", "abc"))
+        self.assertTrue(match.evaluate(NE | REGEX, "^b", "abc"))
+        self.assertTrue(match.evaluate(EQ | REGEX | CASEFOLD, "^A", "abc"))
+        self.assertTrue(match.evaluate(EQ | REGEX, "^[[:digit:]]+$", "123"))
+        self.assertFalse(match.evaluate(GT | REGEX, "a", "abc"))
+
+        # An invalid regular expression matches nothing
+        self.assertFalse(match.evaluate(EQ | REGEX, "(", "("))
+        self.assertTrue(match.evaluate(NE | REGEX, "(", "("))
+
+    def test_time(self):
+        key = asl.ASL_KEY_TIME
+        now = int(time.time())
+
+        # Numeric comparison for the Time attribute
+        self.assertTrue(match.evaluate(GT, "9", "10", key))
+        self.assertFalse(match.evaluate(GT, "9", "10"))
+
+        self.assertTrue(match.evaluate(GE, "-1h", str(now), key))
+        self.assertFalse(match.evaluate(GE, "-1h", str(now - 7200), key))
+
+        ts = calendar.timegm((2020, 1, 31, 12, 0, 0, 0, 0, 0))
+        self.assertTrue(match.evaluate(EQ, "2020-01-31T12:00:00Z", str(ts), key))
+        self.assertTrue(match.evaluate(EQ, "2020-01-31T14:00:00+02:00", str(ts), key))
+        self.assertTrue(match.evaluate(EQ, "2020.01.31 12:00:00 UTC", str(ts), key))
+
+
+class TestCompile(unittest.TestCase):
+    def test_consistency(self):
+        # The compiled predicates use specialized tests, check that
+        # these are consistent with the generic implementation
+        flags = [
+            0,
+            CASEFOLD,
+            PREFIX,
+            SUFFIX,
+            SUBSTRING,
+            NUMERIC,
+            REGEX,
+            CASEFOLD | PREFIX,
+            CASEFOLD | SUBSTRING,
+            CASEFOLD | REGEX,
+            NUMERIC | PREFIX,
+        ]
+        query_values = ["", "a", "abc", "B", "10", "-5", "x[0-9]", "(", "-1h"]
+        values = [None, "", "a", "abc", "ABC", "xabcx", "10", "9", "-5", "x12"]
+
+        for key in ("Key", asl.ASL_KEY_TIME):
+            for op in [t | f for t in range(8) for f in flags]:
+                for q in query_values:
+                    predicate = match.compile([(key, q, op)])
+                    for m in values:
+                        record = {} if m is None else {key: m}
+                        self.assertEqual(
+                            predicate(record),
+                            match.evaluate(op, q, m, key),
+                            (key, q, op, m),
+                        )
+
+    def test_query(self):
+        query = (asl.Field(asl.ASL_KEY_SENDER) == "kernel") & (
+            asl.Field(asl.ASL_KEY_LEVEL) <= asl.ASL_LEVEL_ERR
+        )
+        predicate = match.compile(query)
+        self.assertTrue(predicate({"Sender": "kernel", "Level": "2"}))
+        self.assertFalse(predicate({"Sender": "kernel", "Level": "5"}))
+        self.assertFalse(predicate({"Sender": "kernel"}))
+        self.assertFalse(predicate({"Sender": "other", "Level": "2"}))
+
+        self.assertTrue(match.compile(asl.Query())({}))
+        self.assertTrue(match.matches(query, {"Sender": "kernel", "Level": "0"}))
+
+        records = [{"Sender": "kernel", "Level": str(i)} for i in range(8)]
+        self.assertEqual(list(match.filter(query, records)), records[:4])
+
+        self.assertRaises(TypeError, match.compile, [("Key", 42, EQ)])
+
+    def test_exists(self):
+        predicate = match.compile(
+            [("Key", "", asl.ASL_QUERY_OP_TRUE), ("Other", "", 0)]
+        )
+        self.assertTrue(predicate({"Key": "a"}))
+        self.assertFalse(predicate({"Key": "a", "Other": "b"}))
+        self.assertFalse(predicate({}))
+
+    @unittest.skipUnless(hasattr(asl.aslmsg, "query_items"), "Requires query_items")
+    def test_aslmsg(self):
+        msg = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        msg.set_query(asl.ASL_KEY_SENDER, "ker", EQ | PREFIX)
+        msg.set_query(asl.ASL_KEY_LEVEL, "3", LE | NUMERIC)
+
+        self.assertEqual(
+            sorted(msg.query_items()),
+            [
+                (asl.ASL_KEY_LEVEL, "3", LE | NUMERIC),
+                (asl.ASL_KEY_SENDER, "ker", EQ | PREFIX),
+            ],
+        )
+
+        predicate = match.compile(msg)
+        self.assertTrue(predicate({"Sender": "kernel", "Level": "3"}))
+        self.assertFalse(predicate({"Sender": "kernel", "Level": "4"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import collections
 import operator
 import sys
 import unittest
@@ -44,6 +45,163 @@ class TestMessage(unittest.TestCase):
         self.assertEqual(m.keys(), {"foo"})
         self.assertEqual(m.asdict(), {"foo": "bar"})
 
+    def test_creation_with_mapping(self):
+        m = asl.aslmsg(asl.ASL_TYPE_MSG, {"foo": "bar", "baz": "hello"})
+        self.assertEqual(m.asdict(), {"foo": "bar", "baz": "hello"})
+
+        m = asl.aslmsg(asl.ASL_TYPE_MSG, [("foo", "bar")])
+        self.assertEqual(m.asdict(), {"foo": "bar"})
+
+        m = asl.aslmsg(asl.ASL_TYPE_MSG, mapping=None)
+        self.assertEqual(m.asdict(), {})
+
+        m = asl.aslmsg(asl.ASL_TYPE_QUERY, {"foo": "bar"})
+        self.assertEqual(m.keys(), {"foo"})
+
+        self.assertRaises(TypeError, asl.aslmsg, asl.ASL_TYPE_MSG, {"foo": 42})
+        self.assertRaises(TypeError, asl.aslmsg, asl.ASL_TYPE_MSG, {42: "foo"})
+        self.assertRaises(TypeError, asl.aslmsg, asl.ASL_TYPE_MSG, 42)
+        self.assertRaises(TypeError, asl.aslmsg, asl.ASL_TYPE_MSG, ["foo"])
+
+    def test_update(self):
+        m = asl.aslmsg(asl.ASL_TYPE_MSG)
+        m.update({"foo": "bar"})
+        self.assertEqual(m.asdict(), {"foo": "bar"})
+
+        m.update([("foo", "baz")], key="value")
+        self.assertEqual(m.asdict(), {"foo": "baz", "key": "value"})
+
+        m.update(other="value2")
+        self.assertEqual(m.asdict(), {"foo": "baz", "key": "value", "other": "value2"})
+
+        m.update(collections.OrderedDict([("a", "1")]))
+        self.assertEqual(m["a"], "1")
+
+        m.update()
+        self.assertRaises(TypeError, m.update, {"foo": b"bar"})
+        self.assertRaises(TypeError, m.update, {"foo": "bar"}, {"foo": "bar"})
+        self.assertRaises(TypeError, m.update, [("a", "b", "c")])
+
+    def test_copy(self):
+        template = asl.aslmsg(
+            asl.ASL_TYPE_MSG, {asl.ASL_KEY_FACILITY: "org.example", "tag": "value"}
+        )
+        m = template.copy()
+        self.assertIsInstance(m, asl.aslmsg)
+        self.assertIsNot(m, template)
+        self.assertEqual(m.asdict(), template.asdict())
+
+        m[asl.ASL_KEY_MSG] = "hello"
+        m["tag"] = "other"
+        self.assertEqual(
+            template.asdict(), {asl.ASL_KEY_FACILITY: "org.example", "tag": "value"}
+        )
+        self.assertEqual(m["tag"], "other")
+
+        self.assertEqual(asl.aslmsg(asl.ASL_TYPE_MSG).copy().asdict(), {})
+
+        q = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        q.set_query("foo", "bar", asl.ASL_QUERY_OP_GREATER)
+        copy = q.copy()
+        self.assertEqual(copy.keys(), {"foo"})
+        if hasattr(q, "query_items"):
+            self.assertEqual(copy.query_items(), q.query_items())
+
+    def test_update_from_message(self):
+        template = asl.aslmsg(
+            asl.ASL_TYPE_MSG, {asl.ASL_KEY_FACILITY: "org.example", "tag": "value"}
+        )
+        m = asl.aslmsg(asl.ASL_TYPE_MSG, {"tag": "old", asl.ASL_KEY_MSG: "hello"})
+        m.update(template, extra="1")
+        self.assertEqual(
+            m.asdict(),
+            {
+                asl.ASL_KEY_FACILITY: "org.example",
+                "tag": "value",
+                asl.ASL_KEY_MSG: "hello",
+                "extra": "1",
+            },
+        )
+
+        m = asl.aslmsg(asl.ASL_TYPE_MSG, template)
+        self.assertEqual(m.asdict(), template.asdict())
+
+        q = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        q.set_query("foo", "bar", asl.ASL_QUERY_OP_LESS)
+        q2 = asl.aslmsg(asl.ASL_TYPE_QUERY)
+        q2.update(q)
+        if hasattr(q, "query_items"):
+            self.assertEqual(q2.query_items(), [("foo", "bar", asl.ASL_QUERY_OP_LESS)])
+
+    def test_shared_keys(self):
+        m1 = asl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_SENDER: "a", "custom": "b"})
+        m2 = asl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_SENDER: "c", "custom": "d"})
+
+        for name in (asl.ASL_KEY_SENDER, "custom"):
+            k1 = [k for k in m1.asdict() if k == name][0]
+            k2 = [k for k in m2.asdict() if k == name][0]
+            k3 = [k for k in m2.keys() if k == name][0]
+            self.assertIs(k1, k2)
+            self.assertIs(k1, k3)
+
+        # More keys than fit in the cache
+        m = asl.aslmsg(asl.ASL_TYPE_MSG, {"key%d" % i: str(i) for i in range(2000)})
+        for _ in range(2):
+            self.assertEqual(m.asdict(), {"key%d" % i: str(i) for i in range(2000)})
+            self.assertEqual(m.keys(), {"key%d" % i for i in range(2000)})
+
+    def test_value_cache(self):
+        self.addCleanup(asl.set_value_cache, 0)
+
+        info = asl.value_cache_info()
+        self.assertEqual(info, (0, 0, 0, 0))
+        self.assertEqual(info.maxsize, 0)
+
+        def make(i):
+            return asl.aslmsg(
+                asl.ASL_TYPE_MSG,
+                {
+                    asl.ASL_KEY_SENDER: "sender-%d" % (i % 2,),
+                    asl.ASL_KEY_MSG: "message %d" % (i,),
+                    "custom": "value %d" % (i % 2,),
+                },
+            )
+
+        # Disabled by default
+        self.assertIsNot(make(0).asdict()["custom"], make(2).asdict()["custom"])
+        self.assertEqual(asl.value_cache_info(), (0, 0, 0, 0))
+
+        asl.set_value_cache(100)
+        self.assertGreaterEqual(asl.value_cache_info().maxsize, 100)
+
+        d1 = make(0).asdict()
+        d2 = make(2).asdict()
+        self.assertEqual(d1[asl.ASL_KEY_MSG], "message 0")
+        self.assertIs(d1[asl.ASL_KEY_SENDER], d2[asl.ASL_KEY_SENDER])
+        self.assertIs(d1["custom"], d2["custom"])
+        self.assertIs(d1["custom"], make(4)["custom"])
+        self.assertIsNot(d1["custom"], make(1)["custom"])
+
+        info = asl.value_cache_info()
+        self.assertEqual(info.hits, 3)
+        self.assertEqual(info.misses, 3)
+        self.assertEqual(info.currsize, 3)
+
+        asl.value_cache_clear()
+        self.assertEqual(asl.value_cache_info()[:2], (0, 0))
+        self.assertEqual(asl.value_cache_info().currsize, 0)
+
+        # More values than fit in the cache
+        asl.set_value_cache(8)
+        maxsize = asl.value_cache_info().maxsize
+        m = asl.aslmsg(asl.ASL_TYPE_MSG, {"key%d" % i: str(i) for i in range(200)})
+        for _ in range(2):
+            self.assertEqual(m.asdict(), {"key%d" % i: str(i) for i in range(200)})
+        self.assertLessEqual(asl.value_cache_info().currsize, maxsize)
+
+        self.assertRaises(ValueError, asl.set_value_cache, -1)
+        self.assertRaises(TypeError, asl.set_value_cache, "10")
+
     @unittest.skipUnless(sys.version_info[0] == 3, "Python 3 tests")
     def test_no_bytes_attributes(self):
         m = asl.aslmsg(asl.ASL_TYPE_MSG)
@@ -1,11 +1,11 @@
 import os
-import platform
 import sys
 import unittest
-from distutils.version import LooseVersion
 
 import asl
 
+from .support import has_feature
+
 try:
     long
 except NameError:
@@ -27,16 +27,14 @@ class TestMiscFunctions(unittest.TestCase):
         self.assertIs(asl.asl_new, asl.aslmsg)
         self.assertIs(asl.asl_open, asl.aslclient)
 
-    @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) < LooseVersion("10.7"), "Requires OSX 10.7"
-    )
+    @unittest.skipIf(has_feature("create_auxiliary_file"), "Has auxiliary files")
     def test_no_aux(self):
         self.assertFalse(hasattr(asl, "create_auxiliary_file"))
         self.assertFalse(hasattr(asl, "close_auxiliary_file"))
         self.assertFalse(hasattr(asl, "log_auxiliary_location"))
 
     @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) >= LooseVersion("10.7"), "Requires OSX 10.7"
+        has_feature("create_auxiliary_file"), "Requires auxiliary files"
     )
     def test_create_auxiliary_file(self):
         msg = asl.aslmsg(asl.ASL_TYPE_MSG)
@@ -65,9 +63,8 @@ class TestMiscFunctions(unittest.TestCase):
         self.assertRaises(TypeError, asl.create_auxiliary_file, None, "title", 42)
 
     @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) >= LooseVersion("10.7")
-        and sys.version_info[0] == 3,
-        "Requires OSX 10.7, Python 3 test",
+        has_feature("create_auxiliary_file") and sys.version_info[0] == 3,
+        "Requires auxiliary files, Python 3 test",
     )
     def test_no_bytes(self):
         msg = asl.aslmsg(asl.ASL_TYPE_MSG)
@@ -105,9 +102,8 @@ class TestMiscFunctions(unittest.TestCase):
         )
 
     @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) >= LooseVersion("10.7")
-        and sys.version_info[0] == 2,
-        "Requires OSX 10.7, Python 2 test",
+        has_feature("create_auxiliary_file") and sys.version_info[0] == 2,
+        "Requires auxiliary files, Python 2 test",
     )
     def test_with_unicode(self):
         msg = asl.aslmsg(asl.ASL_TYPE_MSG)
@@ -145,7 +141,7 @@ class TestMiscFunctions(unittest.TestCase):
         )
 
     @unittest.skipUnless(
-        LooseVersion(platform.mac_ver()[0]) >= LooseVersion("10.7"), "Requires OSX 10.7"
+        has_feature("create_auxiliary_file"), "Requires auxiliary files"
     )
     def test_log_auxiliary_location(self):
         msg = asl.aslmsg(asl.ASL_TYPE_MSG)
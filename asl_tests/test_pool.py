@@ -0,0 +1,185 @@
+import asyncio
+import os
+import threading
+import typing
+import unittest
+from unittest import mock
+
+import asl
+from asl import _pool
+
+
+class TestClientPool(unittest.TestCase):
+    def test_threads(self):
+        with asl.ClientPool("ident", "facility") as pool:
+            self.assertFalse(pool.closed)
+
+            cli = pool.client()
+            self.assertIsInstance(cli, asl.aslclient)
+            self.assertIs(pool.client(), cli)
+
+            clients = []
+
+            def worker():
+                clients.append(pool.client())
+                clients.append(pool.client())
+
+            threads = [threading.Thread(target=worker) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(len(clients), 6)
+            for i in range(0, 6, 2):
+                self.assertIs(clients[i], clients[i + 1])
+                self.assertIsNot(clients[i], cli)
+            self.assertEqual(len({id(c) for c in clients}), 3)
+
+            info = pool.info()
+            self.assertEqual(info.opens, 4)
+            self.assertEqual(info.reuses, 4)
+            self.assertEqual(info.closes, 0)
+            self.assertEqual(info.live, 4)
+            self.assertIsInstance(info, _pool.PoolInfo)
+
+            # The clients of threads that have exited are closed
+            self.assertEqual(pool.close_idle(), 3)
+            self.assertEqual(pool.info(), (4, 4, 3, 1))
+            self.assertRaises(ValueError, clients[0].set_filter, 0)
+            self.assertIs(pool.client(), cli)
+
+        self.assertTrue(pool.closed)
+        self.assertEqual(pool.info(), (4, 5, 4, 0))
+        self.assertRaises(ValueError, cli.set_filter, 0)
+        self.assertRaises(ValueError, pool.client)
+        self.assertRaises(ValueError, pool.set_filter, 0)
+
+    def test_tasks(self):
+        pool = asl.ClientPool()
+        self.addCleanup(pool.close)
+
+        async def task():
+            cli = pool.client()
+            await asyncio.sleep(0)
+            self.assertIs(pool.client(), cli)
+            return cli
+
+        async def main():
+            return await asyncio.gather(task(), task())
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        first, second = loop.run_until_complete(main())
+        self.assertIsNot(first, second)
+        self.assertIsNot(pool.client(), first)
+
+    def test_idle(self):
+        now = [1000.0]
+        with mock.patch.object(_pool.time, "monotonic", lambda: now[0]):
+            pool = asl.ClientPool(idle_timeout=10)
+            self.addCleanup(pool.close)
+
+            cli = pool.client()
+            ready = threading.Event()
+            done = threading.Event()
+
+            def worker():
+                pool.client()
+                ready.set()
+                done.wait()
+
+            thread = threading.Thread(target=worker)
+            thread.start()
+            self.addCleanup(thread.join)
+            self.addCleanup(done.set)
+            ready.wait()
+
+            now[0] += 6
+            self.assertIs(pool.client(), cli)
+            self.assertEqual(pool.info().live, 2)
+
+            # The client of the other thread is idle, the current
+            # client was used recently
+            now[0] += 6
+            self.assertIs(pool.client(), cli)
+            self.assertEqual(pool.info().live, 1)
+            self.assertEqual(pool.info().closes, 1)
+
+            now[0] += 20
+            self.assertEqual(pool.close_idle(), 1)
+            self.assertEqual(pool.info().live, 0)
+            self.assertRaises(ValueError, cli.set_filter, 0)
+
+            self.assertIsNot(pool.client(), cli)
+            self.assertEqual(pool.info().opens, 3)
+
+    def test_filter(self):
+        tag = "pool %d %d" % (os.getpid(), id(self))
+        with asl.ClientPool("ident", "facility", idle_timeout=None) as pool:
+            cli = pool.client()
+            pool.set_filter(asl.ASL_FILTER_MASK_UPTO(asl.ASL_LEVEL_ERR))
+            self.assertTrue(pool.is_enabled(asl.ASL_LEVEL_ERR))
+            self.assertFalse(cli.is_enabled(asl.ASL_LEVEL_DEBUG))
+
+            clients = []
+            thread = threading.Thread(target=lambda: clients.append(pool.client()))
+            thread.start()
+            thread.join()
+            self.assertFalse(clients[0].is_enabled(asl.ASL_LEVEL_DEBUG))
+
+            pool.log(None, asl.ASL_LEVEL_ERR, "%s %s", tag, "log")
+            pool.log(None, asl.ASL_LEVEL_DEBUG, "%s %s", tag, "filtered")
+            pool.send(
+                asl.aslmsg(
+                    asl.ASL_TYPE_MSG,
+                    {asl.ASL_KEY_MSG: tag + " send", asl.ASL_KEY_LEVEL: "3"},
+                )
+            )
+
+            query = asl.Field(asl.ASL_KEY_MSG).startswith(tag)
+            self.assertEqual(
+                [r[asl.ASL_KEY_MSG] for r in query.search(cli).fetch_dicts()],
+                [tag + " log", tag + " send"],
+            )
+
+            self.assertRaises(TypeError, pool.set_filter, "debug")
+
+    def test_retired_during_reuse(self):
+        pool = asl.ClientPool()
+        self.addCleanup(pool.close)
+        clients = []
+        opened = threading.Event()
+        reuse = threading.Event()
+
+        def worker():
+            clients.append(pool.client())
+            opened.set()
+            reuse.wait()
+            clients.append(pool.client())
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        self.assertTrue(opened.wait(5))
+
+        # Retire the entry of the worker while it tries to reuse it
+        with pool._lock:
+            reuse.set()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+            pool._retire([e for e in pool._entries if e.client is clients[0]])
+
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNot(clients[1], clients[0])
+        self.assertEqual(pool.info().opens, 2)
+
+    def test_arguments(self):
+        self.assertRaises(ValueError, asl.ClientPool, idle_timeout=0)
+        ident: typing.Any = 42
+        pool = asl.ClientPool(ident)
+        self.assertRaises(TypeError, pool.client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+import base64
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import asl
+from asl import _pyasl
+
+
+def append_records(path, ident, count):
+    fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        store = _pyasl._FileStore(fd)
+        for idx in range(count):
+            store.append([{asl.ASL_KEY_SENDER: ident, asl.ASL_KEY_MSG: str(idx)}])
+    finally:
+        os.close(fd)
+
+
+class TestPythonBackend(unittest.TestCase):
+    def setUp(self):
+        # Use a private store for every test
+        store = _pyasl._MemoryStore(100)
+        for name, value in (("_store", store), ("_default_client", None)):
+            patcher = mock.patch.object(_pyasl, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def query(self, **kwds):
+        msg = _pyasl.aslmsg(asl.ASL_TYPE_QUERY)
+        for key, value in kwds.items():
+            msg.set_query(key, value, asl.ASL_QUERY_OP_EQUAL)
+        return msg
+
+    def test_backend(self):
+        self.assertIn(asl.BACKEND, ("libasl", "python"))
+        if asl.BACKEND == "python":
+            self.assertIs(asl.aslmsg, _pyasl.aslmsg)
+
+    def test_send_search(self):
+        cli = _pyasl.aslclient("ident", "facility", 0)
+
+        msg = _pyasl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_MSG: "hello"})
+        cli.send(msg)
+        cli.log(msg, asl.ASL_LEVEL_ERR, "world")
+
+        records = cli.search(self.query()).fetch_dicts()
+        self.assertEqual(len(records), 2)
+
+        self.assertEqual(records[0][asl.ASL_KEY_MSG], "hello")
+        self.assertEqual(records[0][asl.ASL_KEY_LEVEL], str(asl.ASL_LEVEL_NOTICE))
+        self.assertEqual(records[0][asl.ASL_KEY_SENDER], "ident")
+        self.assertEqual(records[0][asl.ASL_KEY_FACILITY], "facility")
+        self.assertEqual(records[0][asl.ASL_KEY_PID], str(os.getpid()))
+        self.assertEqual(records[0][asl.ASL_KEY_MSG_ID], "1")
+        self.assertLessEqual(abs(int(records[0][asl.ASL_KEY_TIME]) - time.time()), 2)
+
+        self.assertEqual(records[1][asl.ASL_KEY_MSG], "world")
+        self.assertEqual(records[1][asl.ASL_KEY_LEVEL], str(asl.ASL_LEVEL_ERR))
+        self.assertEqual(records[1][asl.ASL_KEY_MSG_ID], "2")
+
+        # The message that was sent is not modified
+        self.assertEqual(msg.asdict(), {asl.ASL_KEY_MSG: "hello"})
+
+        response = cli.search(self.query(Message="world"))
+        found = list(response)
+        self.assertEqual(len(found), 1)
+        self.assertIsInstance(found[0], _pyasl.aslmsg)
+        self.assertEqual(found[0][asl.ASL_KEY_MSG], "world")
+
+        rows = cli.search(self.query(), fields=[asl.ASL_KEY_MSG, "NoSuchKey"]).fetch()
+        self.assertEqual(rows, [("hello", None), ("world", None)])
+
+        keys, values = cli.search(self.query()).fetch(1)[0]
+        self.assertEqual(dict(zip(keys, values)), records[0])
+
+        columns = cli.search_columns(
+            self.query(), [asl.ASL_KEY_LEVEL, asl.ASL_KEY_MSG, asl.ASL_KEY_PID]
+        )
+        self.assertEqual(columns[asl.ASL_KEY_LEVEL].typecode, "q")
+        self.assertEqual(
+            list(columns[asl.ASL_KEY_LEVEL]), [asl.ASL_LEVEL_NOTICE, asl.ASL_LEVEL_ERR]
+        )
+        self.assertEqual(columns[asl.ASL_KEY_MSG], ["hello", "world"])
+
+    def test_value_cache(self):
+        self.addCleanup(_pyasl.set_value_cache, 0)
+        _pyasl.set_value_cache(10)
+
+        cli = _pyasl.aslclient("ident", "facility", 0)
+        for i in range(4):
+            cli.log(None, asl.ASL_LEVEL_ERR, "message %d" % (i,))
+
+        records = cli.search(self.query()).fetch_dicts()
+        self.assertIs(records[0][asl.ASL_KEY_SENDER], records[3][asl.ASL_KEY_SENDER])
+
+        rows = cli.search(self.query(), fields=[asl.ASL_KEY_HOST]).fetch()
+        self.assertIs(rows[0][0], rows[1][0])
+
+        columns = cli.search_columns(self.query(), [asl.ASL_KEY_FACILITY])
+        self.assertIs(
+            columns[asl.ASL_KEY_FACILITY][0], records[0][asl.ASL_KEY_FACILITY]
+        )
+
+        info = _pyasl.value_cache_info()
+        self.assertLessEqual(info.currsize, 10)
+        self.assertGreater(info.hits, info.misses)
+
+    def test_filter(self):
+        cli = _pyasl.aslclient("ident", "facility", 0)
+        self.assertEqual(
+            cli.set_filter(asl.ASL_FILTER_MASK_UPTO(asl.ASL_LEVEL_ERR)),
+            asl.ASL_FILTER_MASK_UPTO(asl.ASL_LEVEL_NOTICE),
+        )
+
+        for level in range(8):
+            cli.log(None, level, "level %d" % (level,))
+
+        cli.send(_pyasl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_LEVEL: "Critical"}))
+        cli.send(_pyasl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_LEVEL: "Debug"}))
+
+        levels = [r[asl.ASL_KEY_LEVEL] for r in cli.search(self.query()).fetch_dicts()]
+        self.assertEqual(levels, ["0", "1", "2", "3", "2"])
+
+    def test_log_file(self):
+        cli = _pyasl.aslclient("ident", "facility", 0)
+        cli.set_filter(0)
+
+        rd, wr = os.pipe()
+        cli.add_log_file(wr)
+        cli.log(None, asl.ASL_LEVEL_DEBUG, "hello world")
+        cli.remove_log_file(wr)
+        cli.log(None, asl.ASL_LEVEL_DEBUG, "not logged")
+        os.close(wr)
+
+        with os.fdopen(rd, "rb") as stream:
+            lines = stream.read().decode().splitlines()
+
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(
+            lines[0].endswith(" ident[%d] <Debug>: hello world" % (os.getpid(),))
+        )
+
+        # Log files don't use the filter
+        self.assertEqual(cli.search(self.query()).fetch(), [])
+
+    def test_read_access(self):
+        cli = _pyasl.aslclient("ident", "facility", 0)
+        for uid in (str(os.getuid()), "12345678"):
+            cli.send(_pyasl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_READ_UID: uid}))
+
+        count = len(cli.search(self.query()).fetch())
+        if os.getuid() == 0:
+            self.assertEqual(count, 2)
+        else:
+            self.assertEqual(count, 1)
+
+    def test_log_descriptor(self):
+        cli = _pyasl.aslclient("ident", "facility", 0)
+
+        rd, wr = os.pipe()
+        cli.log_descriptor(None, asl.ASL_LEVEL_ERR, rd, asl.ASL_LOG_DESCRIPTOR_READ)
+        os.write(wr, b"line 1\nline 2\n")
+        os.close(wr)
+
+        for _ in range(100):
+            records = cli.search(self.query()).fetch_dicts()
+            if len(records) == 2:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual([r[asl.ASL_KEY_MSG] for r in records], ["line 1", "line 2"])
+
+    def test_file_store(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "asl.log")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                cli = _pyasl.open_from_file(fd, "ident", "facility")
+                cli.log(None, asl.ASL_LEVEL_ERR, "first")
+
+                # Another writer
+                fd2 = os.open(path, os.O_RDWR)
+                try:
+                    cli2 = _pyasl.open_from_file(fd2, "other", "facility")
+                    cli2.log(None, asl.ASL_LEVEL_ERR, "second")
+                finally:
+                    os.close(fd2)
+
+                records = cli.search(self.query()).fetch_dicts()
+                self.assertEqual(
+                    [r[asl.ASL_KEY_MSG] for r in records], ["first", "second"]
+                )
+                self.assertEqual([r[asl.ASL_KEY_MSG_ID] for r in records], ["1", "2"])
+
+                # Nothing was sent to the default store
+                self.assertEqual(
+                    _pyasl.aslclient(None, "user", 0).search(self.query()).fetch(), []
+                )
+
+            finally:
+                os.close(fd)
+
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                self.assertRaises(OSError, _pyasl.open_from_file, fd, "ident", "f")
+            finally:
+                os.close(fd)
+
+    def test_file_store_processes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "asl.log")
+            processes = [
+                multiprocessing.Process(
+                    target=append_records, args=(path, "proc-%d" % (idx,), 50)
+                )
+                for idx in range(4)
+            ]
+            for proc in processes:
+                proc.start()
+            for proc in processes:
+                proc.join()
+                self.assertEqual(proc.exitcode, 0)
+
+            fd = os.open(path, os.O_RDWR)
+            try:
+                records = _pyasl._FileStore(fd).records()
+            finally:
+                os.close(fd)
+
+            self.assertEqual(
+                [r[asl.ASL_KEY_MSG_ID] for r in records],
+                [str(idx) for idx in range(1, 201)],
+            )
+            for idx in range(4):
+                self.assertEqual(
+                    [
+                        r[asl.ASL_KEY_MSG]
+                        for r in records
+                        if r[asl.ASL_KEY_SENDER] == "proc-%d" % (idx,)
+                    ],
+                    [str(i) for i in range(50)],
+                )
+
+    def test_auxiliary_file(self):
+        msg = _pyasl.aslmsg(asl.ASL_TYPE_MSG, {asl.ASL_KEY_MSG: "aux"})
+        fd = _pyasl.create_auxiliary_file(msg, "title", None)
+        os.write(fd, b"hello world\n")
+        _pyasl.close_auxiliary_file(fd)
+        self.assertRaises(OSError, _pyasl.close_auxiliary_file, fd)
+
+        records = _pyasl.aslclient(None, "user", 0).search(self.query()).fetch_dicts()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][asl.ASL_KEY_AUX_TITLE], "title")
+        self.assertEqual(records[0][asl.ASL_KEY_AUX_UTI], "public.data")
+        self.assertEqual(
+            base64.b64decode(records[0][asl.ASL_KEY_AUX_DATA]), b"hello world\n"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
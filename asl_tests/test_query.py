@@ -0,0 +1,138 @@
+import unittest
+
+import asl
+
+
+class TestField(unittest.TestCase):
+    def test_comparisons(self):
+        f = asl.Field(asl.ASL_KEY_SENDER)
+        self.assertEqual(f.name, asl.ASL_KEY_SENDER)
+
+        for query, op in [
+            (f == "a", asl.ASL_QUERY_OP_EQUAL),
+            (f != "a", asl.ASL_QUERY_OP_NOT_EQUAL),
+            (f < "a", asl.ASL_QUERY_OP_LESS),
+            (f <= "a", asl.ASL_QUERY_OP_LESS_EQUAL),
+            (f > "a", asl.ASL_QUERY_OP_GREATER),
+            (f >= "a", asl.ASL_QUERY_OP_GREATER_EQUAL),
+        ]:
+            self.assertIsInstance(query, asl.Query)
+            self.assertEqual(query.terms, ((asl.ASL_KEY_SENDER, "a", op),))
+
+        self.assertEqual(
+            (asl.Field(asl.ASL_KEY_LEVEL) <= 3).terms,
+            (
+                (
+                    asl.ASL_KEY_LEVEL,
+                    "3",
+                    asl.ASL_QUERY_OP_LESS_EQUAL | asl.ASL_QUERY_OP_NUMERIC,
+                ),
+            ),
+        )
+
+        self.assertRaises(TypeError, f.__eq__, b"a")
+        self.assertRaises(TypeError, f.__eq__, None)
+        self.assertRaises(TypeError, asl.Field, 42)
+        self.assertRaises(TypeError, hash, f)
+
+    def test_helpers(self):
+        f = asl.Field(asl.ASL_KEY_MSG)
+        eq = asl.ASL_QUERY_OP_EQUAL
+        self.assertEqual(
+            f.startswith("a").terms, ((f.name, "a", eq | asl.ASL_QUERY_OP_PREFIX),)
+        )
+        self.assertEqual(
+            f.endswith("a").terms, ((f.name, "a", eq | asl.ASL_QUERY_OP_SUFFIX),)
+        )
+        self.assertEqual(
+            f.contains("a").terms, ((f.name, "a", eq | asl.ASL_QUERY_OP_SUBSTRING),)
+        )
+        self.assertEqual(
+            f.regex("^a").terms, ((f.name, "^a", eq | asl.ASL_QUERY_OP_REGEX),)
+        )
+        self.assertEqual(f.exists().terms, ((f.name, "", asl.ASL_QUERY_OP_TRUE),))
+
+        self.assertEqual(
+            f.casefold.startswith("a").terms,
+            ((f.name, "a", eq | asl.ASL_QUERY_OP_PREFIX | asl.ASL_QUERY_OP_CASEFOLD),),
+        )
+        self.assertEqual(repr(f.casefold), "Field('Message', casefold=True)")
+        self.assertEqual(repr(f), "Field('Message')")
+
+
+class TestQuery(unittest.TestCase):
+    def test_combine(self):
+        q1 = asl.Field(asl.ASL_KEY_SENDER) == "a"
+        q2 = asl.Field(asl.ASL_KEY_FACILITY) == "b"
+
+        q = q1 & q2
+        self.assertEqual(len(q), 2)
+        self.assertEqual(q, q2 & q1)
+        self.assertEqual(hash(q), hash(q2 & q1))
+        self.assertEqual(q, q1.where(asl.ASL_KEY_FACILITY, "b", asl.ASL_QUERY_OP_EQUAL))
+        self.assertEqual(q & q1, q)
+        self.assertEqual(list(q), list(q.terms))
+
+        self.assertRaises(ValueError, q.__and__, asl.Field(asl.ASL_KEY_SENDER) == "c")
+        with self.assertRaises(TypeError):
+            q & 42
+        self.assertRaises(TypeError, asl.Query, (asl.ASL_KEY_SENDER, 42, 1))
+        self.assertRaises(TypeError, asl.Query, (asl.ASL_KEY_SENDER, "a", "b"))
+
+        self.assertEqual(len(asl.Query()), 0)
+
+    def test_immutable(self):
+        q = asl.Field(asl.ASL_KEY_SENDER) == "a"
+        with self.assertRaises(AttributeError):
+            q._terms = ()  # type: ignore
+        with self.assertRaises(AttributeError):
+            q.foo = 1  # type: ignore
+        with self.assertRaises(AttributeError):
+            del q._terms
+
+    def test_compile(self):
+        asl.Query.cache_clear()
+
+        q = (asl.Field(asl.ASL_KEY_SENDER) == "a") & (
+            asl.Field(asl.ASL_KEY_FACILITY) == "b"
+        )
+        msg = q.compile()
+        self.assertIsInstance(msg, asl.aslmsg)
+        self.assertEqual(
+            msg.asdict(), {asl.ASL_KEY_SENDER: "a", asl.ASL_KEY_FACILITY: "b"}
+        )
+
+        q2 = (asl.Field(asl.ASL_KEY_FACILITY) == "b") & (
+            asl.Field(asl.ASL_KEY_SENDER) == "a"
+        )
+        msg2 = q2.compile()
+        self.assertIsNot(msg2, msg)
+        self.assertEqual(msg2.asdict(), msg.asdict())
+
+        info = asl.Query.cache_info()
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.misses, 1)
+
+        # Modifying the result does not affect the cached message
+        msg[asl.ASL_KEY_SENDER] = "modified"
+        msg.set_query(asl.ASL_KEY_LEVEL, "3", asl.ASL_QUERY_OP_EQUAL)
+        self.assertEqual(
+            q.compile().asdict(), {asl.ASL_KEY_SENDER: "a", asl.ASL_KEY_FACILITY: "b"}
+        )
+        if hasattr(msg, "query_items"):
+            self.assertEqual(sorted(q.compile().query_items()), sorted(q.terms))
+
+        self.assertIsInstance(asl.Query().compile(), asl.aslmsg)
+
+    def test_search(self):
+        cli = asl.aslclient("ident", "facility", 0)
+        q = asl.Field(asl.ASL_KEY_FACILITY) == "com.apple.console"
+
+        for row in q.search(cli, fields=[asl.ASL_KEY_FACILITY]):
+            self.assertEqual(row, ("com.apple.console",))
+
+        self.assertIsInstance(q.search(cli), asl.aslresponse)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import pickle
+import typing
+import unittest
+
+import asl
+from asl import _record
+
+
+class TestRecord(unittest.TestCase):
+    def test_mapping(self):
+        rec = asl.Record({"Sender": "ident", "Message": "hello"})
+        self.assertEqual(rec["Sender"], "ident")
+        self.assertEqual(rec["Message"], "hello")
+        self.assertRaises(KeyError, rec.__getitem__, "Level")
+
+        self.assertEqual(len(rec), 2)
+        self.assertEqual(list(rec), ["Sender", "Message"])
+        self.assertEqual(list(rec.keys()), ["Sender", "Message"])
+        self.assertEqual(list(rec.values()), ["ident", "hello"])
+        self.assertIn("Sender", rec)
+        self.assertNotIn("Level", rec)
+        self.assertEqual(rec.get("Sender"), "ident")
+        self.assertIs(rec.get("Level"), None)
+        self.assertEqual(rec.get("Level", "5"), "5")
+
+        self.assertEqual(rec.asdict(), {"Sender": "ident", "Message": "hello"})
+        self.assertEqual(dict(rec), rec.asdict())
+        self.assertEqual(rec, {"Sender": "ident", "Message": "hello"})
+        self.assertEqual(rec, asl.Record(Message="hello", Sender="ident"))
+        self.assertNotEqual(rec, asl.Record(Sender="ident"))
+        self.assertRaises(TypeError, hash, rec)
+
+        self.assertEqual(repr(rec), "Record({'Sender': 'ident', 'Message': 'hello'})")
+
+        with self.assertRaises(TypeError):
+            mutable: typing.Any = rec
+            mutable["Level"] = "1"
+        self.assertRaises(AttributeError, setattr, rec, "Level", "1")
+
+        self.assertRaises(TypeError, asl.Record, {"Sender": 42})
+        self.assertRaises(TypeError, asl.Record, {42: "Sender"})
+
+    def test_shared_schema(self):
+        first = asl.Record(Sender="a", Message="b")
+        second = asl.Record(Sender="c", Message="d")
+        self.assertIs(first._schema, second._schema)
+        self.assertIsNot(first._schema, asl.Record(Message="d", Sender="c")._schema)
+
+    def test_from_items(self):
+        rec = asl.Record.from_items(("Sender", "Level"), ("ident", "3"))
+        self.assertEqual(rec.asdict(), {"Sender": "ident", "Level": "3"})
+
+        self.assertRaises(ValueError, asl.Record.from_items, ("Sender",), ())
+        self.assertRaises(ValueError, asl.Record.from_items, ("a", "a"), ("1", "2"))
+
+    def test_pickle(self):
+        rec = asl.Record(Sender="ident", Message="hello")
+        copy = pickle.loads(pickle.dumps(rec))
+        self.assertIsInstance(copy, asl.Record)
+        self.assertEqual(copy, rec)
+        self.assertIs(copy._schema, rec._schema)
+
+    def test_from_fetch(self):
+        keys = ("Sender", "Message")
+        records = _record._from_fetch(
+            None, [(keys, ("a", "b")), (keys, ("c", "d")), (("Sender",), ("e",))]
+        )
+        self.assertEqual(
+            [r.asdict() for r in records],
+            [
+                {"Sender": "a", "Message": "b"},
+                {"Sender": "c", "Message": "d"},
+                {"Sender": "e"},
+            ],
+        )
+        self.assertIs(records[0]._schema, records[1]._schema)
+
+        records = _record._from_fetch(keys, [("a", "b"), ("c", None), (None, None)])
+        self.assertEqual(
+            [r.asdict() for r in records],
+            [{"Sender": "a", "Message": "b"}, {"Sender": "c"}, {}],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
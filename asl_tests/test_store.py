@@ -0,0 +1,523 @@
+import concurrent.futures
+import os
+import random
+import struct
+import tempfile
+import typing
+import unittest
+from unittest import mock
+
+import asl
+from asl import store
+
+STANDARD_KEYS = (
+    asl.ASL_KEY_HOST,
+    asl.ASL_KEY_SENDER,
+    asl.ASL_KEY_FACILITY,
+    asl.ASL_KEY_MSG,
+    asl.ASL_KEY_REF_PROC,
+    asl.ASL_KEY_SESSION,
+)
+
+NUMERIC_KEYS = (
+    asl.ASL_KEY_MSG_ID,
+    asl.ASL_KEY_READ_UID,
+    asl.ASL_KEY_READ_GID,
+    asl.ASL_KEY_TIME,
+    asl.ASL_KEY_TIME_NSEC,
+    asl.ASL_KEY_LEVEL,
+    asl.ASL_KEY_PID,
+    asl.ASL_KEY_UID,
+    asl.ASL_KEY_GID,
+    asl.ASL_KEY_REF_PID,
+)
+
+
+def write_store(path, records, created=0):
+    """
+    Write *records* to an ASL store file at *path*, using the
+    same layout as the ASL library.
+    """
+    data = bytearray(80)
+    strings = {}
+
+    def encode(value):
+        raw = value.encode("utf-8")
+        if len(raw) < 8:
+            raw = bytes([0x80 | len(raw)]) + raw.ljust(7, b"\0")
+            return int.from_bytes(raw, "big")
+
+        if raw not in strings:
+            strings[raw] = len(data)
+            data.extend(struct.pack(">HI", 1, len(raw) + 1) + raw + b"\0")
+        return strings[raw]
+
+    first = last = 0
+    for record in records:
+        values = [int(record.get(key, 0)) for key in NUMERIC_KEYS]
+        flags = 0
+        if asl.ASL_KEY_READ_UID in record:
+            flags |= 1
+        else:
+            values[1] = 0xFFFFFFFF
+        if asl.ASL_KEY_READ_GID in record:
+            flags |= 2
+        else:
+            values[2] = 0xFFFFFFFF
+
+        xids = [encode(record[key]) if key in record else 0 for key in STANDARD_KEYS]
+        kvlist: typing.List[int] = []
+        for key, value in record.items():
+            if key not in NUMERIC_KEYS and key not in STANDARD_KEYS:
+                kvlist.extend((encode(key), encode(value) if value else 0))
+
+        offset = len(data)
+        body = struct.pack(
+            ">QQIIQIHHIIIIIQQQQQQ",
+            0,
+            values[0],
+            values[1],
+            values[2],
+            values[3],
+            values[4],
+            values[5],
+            flags,
+            values[6],
+            values[7],
+            values[8],
+            values[9],
+            len(kvlist),
+            *xids,
+        )
+        body += struct.pack(">%dQ" % (len(kvlist),), *kvlist)
+        body += struct.pack(">Q", last)
+        data.extend(struct.pack(">HI", 0, len(body)) + body)
+
+        if last:
+            struct.pack_into(">Q", data, last + 6, offset)
+        else:
+            first = offset
+        last = offset
+
+    struct.pack_into(">12sIQQIBQ", data, 0, b"ASL DB", 2, first, created, 0, 0xFF, last)
+    with open(path, "wb") as stream:
+        stream.write(data)
+
+
+def make_record(idx, **extra):
+    record = {
+        asl.ASL_KEY_MSG_ID: str(idx + 1),
+        asl.ASL_KEY_TIME: str(1600000000 + idx),
+        asl.ASL_KEY_TIME_NSEC: str(idx * 1000),
+        asl.ASL_KEY_LEVEL: str(idx % 8),
+        asl.ASL_KEY_PID: str(100 + idx % 3),
+        asl.ASL_KEY_UID: "501",
+        asl.ASL_KEY_GID: "20",
+        asl.ASL_KEY_HOST: "host.example.com",
+        asl.ASL_KEY_SENDER: "sender%d" % (idx % 3,),
+        asl.ASL_KEY_FACILITY: "user",
+        asl.ASL_KEY_MSG: "message number %d" % (idx,),
+    }
+    record.update(extra)
+    return record
+
+
+class TestStoreFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def make_store(self, records, name="test.asl", **kwds):
+        path = os.path.join(self.tmpdir.name, name)
+        write_store(path, records, **kwds)
+        return path
+
+
+class TestASLFileReader(TestStoreFile):
+    def test_records(self):
+        records = [make_record(i) for i in range(10)]
+        records.append(
+            make_record(
+                10,
+                ReadUID="501",
+                RefPID="4",
+                Session="session-id",
+                CustomKey="custom value",
+                Empty="",
+            )
+        )
+        path = self.make_store(records, created=1599999999)
+
+        with store.ASLFileReader(path) as reader:
+            self.assertEqual(reader.version, 2)
+            self.assertEqual(reader.created, 1599999999)
+            self.assertEqual(reader.path, path)
+            self.assertFalse(reader.closed)
+            self.assertIn(repr(path), repr(reader))
+
+            self.assertEqual(list(reader), records)
+            self.assertEqual(list(reader.records()), records)
+
+            messages = list(reader.messages())
+            self.assertEqual(len(messages), len(records))
+            self.assertIsInstance(messages[0], asl.aslmsg)
+            self.assertEqual(messages[-1]["CustomKey"], "custom value")
+
+            self.assertEqual(
+                list(reader.records(fields=[asl.ASL_KEY_SENDER, "CustomKey"]))[-2:],
+                [("sender0", None), ("sender1", "custom value")],
+            )
+            self.assertRaises(TypeError, reader.records(fields="Sender").__next__)
+
+        self.assertTrue(reader.closed)
+        self.assertRaises(ValueError, list, reader)
+
+    def test_search(self):
+        records = [make_record(i) for i in range(20)]
+        path = self.make_store(records)
+
+        query = (asl.Field(asl.ASL_KEY_SENDER) == "sender1") & (
+            asl.Field(asl.ASL_KEY_LEVEL) <= asl.ASL_LEVEL_ERR
+        )
+        expected = [r for r in records if asl.match.matches(query, r)]
+        self.assertEqual(len(expected), 4)
+
+        with store.ASLFileReader(path) as reader:
+            self.assertEqual(list(reader.search(query)), expected)
+            self.assertEqual(
+                list(reader.search(query, fields=[asl.ASL_KEY_MSG])),
+                [(r[asl.ASL_KEY_MSG],) for r in expected],
+            )
+            op = asl.ASL_QUERY_OP_EQUAL | asl.ASL_QUERY_OP_SUBSTRING
+            self.assertEqual(
+                list(reader.search([(asl.ASL_KEY_MSG, "number 1", op)])),
+                [records[1]] + records[10:],
+            )
+
+    def test_empty(self):
+        path = self.make_store([])
+        with store.ASLFileReader(path) as reader:
+            self.assertEqual(list(reader), [])
+
+    def test_strings(self):
+        records = [
+            make_record(0, Key="€ uro", Other="x" * 200),
+            make_record(1, Key="€ uro", Other="x" * 200),
+        ]
+        path = self.make_store(records)
+        with store.ASLFileReader(path) as reader:
+            self.assertEqual(list(reader), records)
+
+    def test_invalid(self):
+        path = os.path.join(self.tmpdir.name, "invalid.asl")
+        with open(path, "wb") as stream:
+            stream.write(b"ASL DB")
+        self.assertRaises(ValueError, store.ASLFileReader, path)
+
+        with open(path, "wb") as stream:
+            stream.write(b"NOT AN ASL DB".ljust(80, b"\0"))
+        self.assertRaises(ValueError, store.ASLFileReader, path)
+
+        with open(path, "wb") as stream:
+            stream.write(struct.pack(">12sI", b"ASL DB", 1).ljust(80, b"\0"))
+        self.assertRaises(ValueError, store.ASLFileReader, path)
+
+        # Truncated file
+        path = self.make_store([make_record(0), make_record(1)])
+        with open(path, "rb") as stream:
+            data = stream.read()
+        with open(path, "wb") as stream:
+            stream.write(data[:-20])
+        with store.ASLFileReader(path) as reader:
+            self.assertRaises(ValueError, list, reader)
+
+        self.assertRaises(
+            FileNotFoundError,
+            store.ASLFileReader,
+            os.path.join(self.tmpdir.name, "missing"),
+        )
+
+
+class TestTimeWindow(TestStoreFile):
+    def setUp(self):
+        super().setUp()
+
+        patcher = mock.patch.object(store, "INDEX_INTERVAL", 8)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Times are mostly increasing, with some records out of order
+        rnd = random.Random(42)
+        self.records = []
+        for idx in range(200):
+            record = make_record(idx)
+            seconds = 1600000000 + idx // 2 + rnd.choice((0, 0, -5))
+            record[asl.ASL_KEY_TIME] = str(seconds)
+            self.records.append(record)
+
+        self.path = self.make_store(self.records)
+
+    def in_window(self, record, start, end):
+        timestamp = (
+            int(record[asl.ASL_KEY_TIME]) + int(record[asl.ASL_KEY_TIME_NSEC]) * 1e-9
+        )
+        return (start is None or timestamp >= start) and (
+            end is None or timestamp < end
+        )
+
+    def test_window(self):
+        with store.ASLFileReader(self.path) as reader:
+            for start, end in [
+                (None, None),
+                (1600000010, 1600000020),
+                (1600000010.0000005, 1600000011),
+                (None, 1600000003),
+                (1600000090, None),
+                (1600000200, None),
+                (None, 1500000000),
+                (1600000020, 1600000020),
+            ]:
+                expected = [r for r in self.records if self.in_window(r, start, end)]
+
+                self.assertEqual(
+                    list(reader.records(start=start, end=end)), expected, (start, end)
+                )
+                self.assertEqual(
+                    list(
+                        reader.records(
+                            start=start,
+                            end=end,
+                            direction=asl.ASL_MATCH_DIRECTION_REVERSE,
+                        )
+                    ),
+                    expected[::-1],
+                    (start, end),
+                )
+
+            self.assertEqual(
+                list(reader.records(start="2020-09-13T12:26:50Z", end=1600000020)),
+                [r for r in self.records if self.in_window(r, 1600000010, 1600000020)],
+            )
+
+            self.assertEqual(
+                list(reader.records(fields=[asl.ASL_KEY_MSG_ID], end=1600000001)),
+                [
+                    (r[asl.ASL_KEY_MSG_ID],)
+                    for r in self.records
+                    if self.in_window(r, None, 1600000001)
+                ],
+            )
+            self.assertRaises(ValueError, list, reader.records(start="yesterday"))
+            invalid: typing.Any = [1]
+            self.assertRaises(TypeError, list, reader.records(start=invalid))
+            self.assertRaises(ValueError, list, reader.records(direction=0))
+
+    def test_reverse(self):
+        with store.ASLFileReader(self.path) as reader:
+            records = reader.records(direction=asl.ASL_MATCH_DIRECTION_REVERSE)
+            self.assertEqual([next(records) for _ in range(3)], self.records[:-4:-1])
+            self.assertEqual(list(records), self.records[-4::-1])
+
+            messages = list(reader.messages(direction=asl.ASL_MATCH_DIRECTION_REVERSE))
+            self.assertEqual(messages[0][asl.ASL_KEY_MSG_ID], "200")
+
+        path = self.make_store([], name="empty.asl")
+        with store.ASLFileReader(path) as reader:
+            self.assertEqual(
+                list(reader.records(direction=asl.ASL_MATCH_DIRECTION_REVERSE)), []
+            )
+            self.assertEqual(list(reader.records(start=0)), [])
+
+    def test_search(self):
+        query = (asl.Field(asl.ASL_KEY_TIME) < 1600000020) & (
+            asl.Field(asl.ASL_KEY_SENDER) == "sender1"
+        )
+        expected = [r for r in self.records if asl.match.matches(query, r)]
+        self.assertNotEqual(expected, [])
+
+        with store.ASLFileReader(self.path) as reader:
+            with mock.patch.object(reader, "_decode", wraps=reader._decode) as decode:
+                self.assertEqual(list(reader.search(query)), expected)
+
+            # Records outside of the time window are not decoded
+            self.assertLess(decode.call_count, 60)
+
+            self.assertEqual(
+                list(reader.search(query, direction=asl.ASL_MATCH_DIRECTION_REVERSE)),
+                expected[::-1],
+            )
+            self.assertEqual(
+                list(reader.search(query, start=1600000015, end=1600000030)),
+                [r for r in expected if int(r[asl.ASL_KEY_TIME]) >= 1600000015],
+            )
+
+            for op in (
+                asl.ASL_QUERY_OP_EQUAL,
+                asl.ASL_QUERY_OP_GREATER,
+                asl.ASL_QUERY_OP_GREATER_EQUAL,
+                asl.ASL_QUERY_OP_LESS,
+                asl.ASL_QUERY_OP_LESS_EQUAL,
+                asl.ASL_QUERY_OP_NOT_EQUAL,
+            ):
+                terms = [(asl.ASL_KEY_TIME, "1600000050", op)]
+                self.assertEqual(
+                    list(reader.search(terms)),
+                    [r for r in self.records if asl.match.matches(terms, r)],
+                    op,
+                )
+
+    def test_persistent_index(self):
+        index_path = os.path.join(self.tmpdir.name, "test.idx")
+        expected = [r for r in self.records if self.in_window(r, 1600000050, None)]
+
+        with store.ASLFileReader(self.path, index_path=index_path) as reader:
+            self.assertEqual(reader.index_path, index_path)
+            self.assertEqual(list(reader.records(start=1600000050)), expected)
+        self.assertTrue(os.path.exists(index_path))
+
+        with store.ASLFileReader(self.path, index_path=index_path) as reader:
+            with mock.patch.object(reader, "_offsets", wraps=reader._offsets) as m:
+                self.assertEqual(list(reader.records(start=1600000050)), expected)
+
+            # The index is read from the file
+            m.assert_called_once()
+
+        # A stale index is rebuilt
+        self.records.append(make_record(200))
+        write_store(self.path, self.records)
+        with store.ASLFileReader(self.path, index_path=index_path) as reader:
+            self.assertEqual(
+                list(reader.records(start=1600000050)), expected + self.records[-1:]
+            )
+
+        with open(index_path, "wb") as stream:
+            stream.write(b"garbage")
+        with store.ASLFileReader(self.path, index_path=index_path) as reader:
+            self.assertEqual(
+                list(reader.records(start=1600000050)), expected + self.records[-1:]
+            )
+
+
+class TestSearchDir(TestStoreFile):
+    def setUp(self):
+        super().setUp()
+
+        # Files with overlapping time ranges
+        self.records = []
+        for fileno in range(5):
+            records = []
+            for idx in range(50):
+                record = make_record(idx, File=str(fileno))
+                seconds = 1600000000 + fileno * 40 + idx
+                record[asl.ASL_KEY_TIME] = str(seconds)
+                record[asl.ASL_KEY_TIME_NSEC] = str((idx * 7919 + fileno) % 1000)
+                records.append(record)
+            self.make_store(records, name="2020.09.%02d.asl" % (13 + fileno,))
+            self.records.extend(records)
+
+        self.make_store([], name="2020.09.20.asl")
+        with open(os.path.join(self.tmpdir.name, "StoreData"), "wb") as stream:
+            stream.write(b"not a store file")
+
+    def expected(self, query, start=None, end=None):
+        records = [
+            r
+            for r in self.records
+            if asl.match.matches(query, r)
+            and (start is None or int(r[asl.ASL_KEY_TIME]) >= start)
+            and (end is None or int(r[asl.ASL_KEY_TIME]) < end)
+        ]
+        records.sort(
+            key=lambda r: (int(r[asl.ASL_KEY_TIME]), int(r[asl.ASL_KEY_TIME_NSEC]))
+        )
+        return records
+
+    def test_search(self):
+        query = asl.Field(asl.ASL_KEY_SENDER) == "sender1"
+        expected = self.expected(query)
+        self.assertEqual(len(expected), 85)
+
+        self.assertEqual(
+            list(store.search_dir(self.tmpdir.name, query, workers=2)), expected
+        )
+        self.assertEqual(
+            list(
+                store.search_dir(
+                    self.tmpdir.name, query, fields=[asl.ASL_KEY_MSG, "File"], workers=2
+                )
+            ),
+            [(r[asl.ASL_KEY_MSG], r["File"]) for r in expected],
+        )
+
+        # Time window, which skips some files
+        query = query & (asl.Field(asl.ASL_KEY_TIME) >= 1600000100)
+        self.assertEqual(
+            list(store.search_dir(self.tmpdir.name, query, workers=2, end=1600000150)),
+            self.expected(query, end=1600000150),
+        )
+
+        self.assertEqual(
+            list(store.search_dir(self.tmpdir.name, query, pattern="*.log")), []
+        )
+        self.assertEqual(list(store.search_dir(self.tmpdir.name, [], end=0)), [])
+
+    def test_chunks(self):
+        # Threads instead of processes to make the patches visible in
+        # the workers.
+        indexed = []
+        build_index = store.ASLFileReader.build_index
+
+        def counting_build_index(reader):
+            indexed.append(os.path.basename(reader.path))
+            build_index(reader)
+
+        search_file = mock.Mock(wraps=store._search_file)
+        for target, name, value in (
+            (store, "INDEX_INTERVAL", 8),
+            (store, "SEARCH_CHUNK_BLOCKS", 2),
+            (store, "_search_file", search_file),
+            (store.ASLFileReader, "build_index", counting_build_index),
+            (
+                store.concurrent.futures,
+                "ProcessPoolExecutor",
+                concurrent.futures.ThreadPoolExecutor,
+            ),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        query = asl.Field(asl.ASL_KEY_SENDER) == "sender1"
+        self.assertEqual(
+            list(store.search_dir(self.tmpdir.name, query, workers=3)),
+            self.expected(query),
+        )
+
+        # 5 files with 7 blocks, each searched in 4 chunks
+        self.assertEqual(search_file.call_count, 20)
+
+        # The index of every file is built once
+        self.assertEqual(
+            sorted(indexed),
+            ["2020.09.%02d.asl" % (day,) for day in (13, 14, 15, 16, 17, 20)],
+        )
+
+    def test_early_exit(self):
+        results = store.search_dir(self.tmpdir.name, asl.Query(), workers=2)
+        self.assertEqual(next(results), self.expected(asl.Query())[0])
+        results.close()
+
+    def test_invalid(self):
+        self.assertRaises(
+            TypeError, next, store.search_dir(self.tmpdir.name, [("Key", 42, 1)])
+        )
+        self.assertRaises(
+            TypeError, next, store.search_dir(self.tmpdir.name, [], fields="Key")
+        )
+        self.assertRaises(
+            ValueError, next, store.search_dir(self.tmpdir.name, [], pattern="*")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -264,7 +264,9 @@ def parse_setup_cfg():
             if ext is not None:
                 extensions.append(ext)
 
-        if extensions:
+        # The extension requires libasl, which is only available on
+        # macOS. Other platforms use the pure Python backend.
+        if extensions and sys.platform == "darwin":
             metadata["ext_modules"] = [
                 Extension(*args, **kwds) for (args, kwds) in extensions
             ]